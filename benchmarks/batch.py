@@ -0,0 +1,57 @@
+"""
+Compares the per-item CalculateSpeedOp of the taxi example with VectorizedSpeedOp, which calculates the distances of
+a whole batch at once. The vectorized operator uses numpy in case it is installed.
+
+    python -m benchmarks.batch --items 200000 --batch-size 1024
+"""
+import argparse
+import logging
+import random
+import time
+
+from examples.taxi.nodes import TaxiData, CalculateSpeedOp, VectorizedSpeedOp, numpy
+
+
+def _taxis(items: int, taxis: int):
+    rnd = random.Random(1)
+    return [TaxiData(rnd.randrange(taxis), 1581000000.0 + i, 116.3 + rnd.random() * 0.3, 39.8 + rnd.random() * 0.2)
+            for i in range(items)]
+
+
+def per_item(items) -> float:
+    op = CalculateSpeedOp()
+    apply = op.apply
+    out = []
+    start = time.perf_counter()
+    for item in items:
+        apply(item, out.append)
+    return len(items) / (time.perf_counter() - start)
+
+
+def batched(items, batch_size: int) -> float:
+    op = VectorizedSpeedOp()
+    out = []
+    start = time.perf_counter()
+    for i in range(0, len(items), batch_size):
+        op.apply_batch(items[i:i + batch_size], out.append)
+    return len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=200000, help='taxi positions')
+    parser.add_argument('--taxis', type=int, default=100, help='distinct taxis')
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[1, 64, 1024], help='items per batch')
+    args = parser.parse_args()
+
+    # the per-item operator logs every item
+    logging.disable(logging.INFO)
+    items = _taxis(args.items, args.taxis)
+    print(f'numpy: {"yes" if numpy is not None else "no, pure python fallback"}')
+    print(f'{"per item":<16} {per_item(items):>12.0f} items/s')
+    for batch_size in args.batch_size:
+        print(f'{"batch " + str(batch_size):<16} {batched(items, batch_size):>12.0f} items/s')
+
+
+if __name__ == '__main__':
+    main()
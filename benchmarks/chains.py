@@ -0,0 +1,96 @@
+"""
+Compares the overhead per item of a chain of operators executed by ChainedOperator, which is used for synchronous
+topologies and fused chains, with nested compositions of two operators each and with a flat loop that collects the
+outputs of each operator in a buffer and passes them to the next one stage by stage.
+
+    python -m benchmarks.chains --items 200000
+"""
+import argparse
+import time
+from typing import List, Callable
+
+from glimmer.processing import Operator, ChainedOperator
+
+
+class Increment(Operator):
+    name = 'increment'
+
+    def apply(self, data, out):
+        out(data + 1)
+
+
+def nested(operators: List[Operator]) -> Callable:
+    """Returns the apply function of nested compositions, which create a closure per operator and item
+    """
+
+    def compose(apply_1, apply_2):
+        def apply(data, out):
+            def out_f(data_f):
+                if data_f is not None:
+                    apply_2(data_f, out)
+
+            apply_1(data, out_f)
+
+        return apply
+
+    composed = operators[0].apply
+    for op in operators[1:]:
+        composed = compose(composed, op.apply)
+    return composed
+
+
+def flat(operators: List[Operator]) -> Callable:
+    """Returns an apply function that drives the chain stage by stage, without calling the next operator from the out
+    function of the previous one
+    """
+    buffers = [[] for _ in operators]
+    head = operators[0].apply
+    head_append = buffers[0].append
+    first = buffers[0]
+    stages = [(op.apply, buffer.append, buffer) for op, buffer in zip(operators[1:], buffers[1:])]
+
+    def apply(data, out):
+        buffer = first
+        head(data, head_append)
+        for stage_apply, append, outputs in stages:
+            if not buffer:
+                return
+            for item in buffer:
+                if item is not None:
+                    stage_apply(item, append)
+            buffer.clear()
+            buffer = outputs
+        for item in buffer:
+            out(item)
+        buffer.clear()
+
+    return apply
+
+
+def ns_per_item(apply: Callable, items: int) -> float:
+    def out(data):
+        pass
+
+    start = time.perf_counter()
+    for i in range(items):
+        apply(i, out)
+    return (time.perf_counter() - start) / items * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=200000, help='items passed through each chain')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[2, 4, 8, 16, 32], help='operators per chain')
+    args = parser.parse_args()
+
+    print(f'{"operators":>10} {"nested (ns)":>12} {"flat (ns)":>10} {"chained (ns)":>13}')
+    for length in args.lengths:
+        operators = [Increment() for _ in range(length)]
+        nested_ns = ns_per_item(nested(operators), args.items)
+        flat_ns = ns_per_item(flat(operators), args.items)
+        chained_ns = ns_per_item(ChainedOperator(operators).apply, args.items)
+        print(f'{length:>10} {nested_ns:>12.0f} {flat_ns:>10.0f} {chained_ns:>13.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Compares the throughput and latency of the channels that can be used for edges in a ParallelTopology.
+
+    python -m benchmarks.channels --items 200000
+    python -m benchmarks.channels --threads
+"""
+import argparse
+import multiprocessing
+import statistics
+import threading
+import time
+
+import glimmer.processing.factory as factory
+
+
+def _produce(channel, items: int, payload):
+    for _ in range(items):
+        channel.put(payload)
+
+
+def _echo(requests, responses, rounds: int):
+    for _ in range(rounds):
+        responses.put(requests.get())
+
+
+def throughput(channel_factory, items: int, payload, use_thread: bool = False) -> float:
+    """Items per second that one producer process, or thread in case the flag is set, sends to one consumer
+    """
+    channel = channel_factory()
+    task = threading.Thread if use_thread else multiprocessing.Process
+    producer = task(target=_produce, args=(channel, items, payload))
+    start = time.perf_counter()
+    producer.start()
+    for _ in range(items):
+        channel.get()
+    elapsed = time.perf_counter() - start
+    producer.join()
+    channel.close()
+    return items / elapsed
+
+
+def latency(channel_factory, rounds: int, payload, use_thread: bool = False) -> float:
+    """Median one-way latency in microseconds, measured as half of a round trip between two processes,
+    or threads in case the flag is set
+    """
+    requests = channel_factory()
+    responses = channel_factory()
+    task = threading.Thread if use_thread else multiprocessing.Process
+    echo = task(target=_echo, args=(requests, responses, rounds))
+    echo.start()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        requests.put(payload)
+        responses.get()
+        samples.append((time.perf_counter() - start) / 2 * 1e6)
+    echo.join()
+    requests.close()
+    responses.close()
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100000, help='items sent for the throughput measurement')
+    parser.add_argument('--rounds', type=int, default=5000, help='round trips for the latency measurement')
+    parser.add_argument('--payload', type=int, default=64, help='payload size in bytes')
+    parser.add_argument('--threads', action='store_true', help='run producer and consumer as threads')
+    args = parser.parse_args()
+
+    payload = b'x' * args.payload
+    channels = {
+        'queue': factory.queue_channel(),
+        'ring-buffer': factory.ring_buffer_channel(),
+    }
+    if args.threads:
+        channels['local'] = factory.local_channel()
+    print(f'{"channel":<12} {"items/s":>12} {"latency (us)":>14}')
+    for name, channel_factory in channels.items():
+        items_per_second = throughput(channel_factory, args.items, payload, args.threads)
+        median_latency = latency(channel_factory, args.rounds, payload, args.threads)
+        print(f'{name:<12} {items_per_second:>12.0f} {median_latency:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares reading the lines of a file with readline, one call per line, to FileSource, which slices chunks of a memory
+map and splits them at once.
+
+    python -m benchmarks.files --lines 1000000 --line-length 80
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from glimmer.processing import Source
+from glimmer.processing.source import FileSource
+
+
+class ReadlineSource(Source):
+    name = 'readline-source'
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.fd = open(path, 'r')
+        self.exhausted = False
+
+    def read(self, out):
+        line = self.fd.readline()
+        if not line:
+            self.exhausted = True
+            return
+        out(line.rstrip('\n'))
+
+    def close(self):
+        self.fd.close()
+
+
+def lines_per_second(source: Source) -> float:
+    out = []
+    read = source.read
+    start = time.perf_counter()
+    while not source.exhausted:
+        read(out.append)
+    elapsed = time.perf_counter() - start
+    source.close()
+    return len(out) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=1000000, help='lines of the file')
+    parser.add_argument('--line-length', type=int, default=80, help='characters per line')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            line = 'x' * (args.line_length - 1) + '\n'
+            for _ in range(args.lines):
+                file.write(line)
+        print(f'{"readline":<20} {lines_per_second(ReadlineSource(path)):>12.0f} lines/s')
+        print(f'{"mmap":<20} {lines_per_second(FileSource(path)):>12.0f} lines/s')
+        print(f'{"mmap, batches":<20} {lines_per_second(FileSource(path, batch_size=1024)) * 1024:>12.0f} lines/s')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Compares the serializers that can be used for edges in a ParallelTopology with the default path, in which
+multiprocessing.Queue pickles the items.
+
+    python -m benchmarks.serializers --items 50000
+"""
+import argparse
+import time
+
+import glimmer.processing.factory as factory
+from benchmarks.channels import throughput
+from examples.taxi.nodes import TaxiData, TaxiWithSpeed
+from glimmer.processing.channel import Batch
+from glimmer.processing.serialization import PickleSerializer, OutOfBandPickleSerializer, DataclassSerializer, \
+    MsgpackSerializer
+
+
+def round_trips(serializer, payload, duration: float = 1.0) -> float:
+    """Number of dumps and loads of the payload per second
+    """
+    n = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            serializer.loads(serializer.dumps(payload))
+        n += 100
+    return n / (time.perf_counter() - start)
+
+
+def _serializers():
+    serializers = {
+        'pickle': PickleSerializer(),
+        'pickle5': OutOfBandPickleSerializer(),
+        'dataclass': DataclassSerializer(TaxiWithSpeed),
+    }
+    try:
+        serializers['msgpack'] = MsgpackSerializer()
+    except AttributeError:
+        pass
+    return serializers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=50000, help='items sent for the throughput measurement')
+    args = parser.parse_args()
+
+    taxis = [TaxiWithSpeed(TaxiData(i, 1581000000.0 + i, 11.253, 47.621), 12.5 + i) for i in range(64)]
+    taxi = taxis[0]
+    payloads = {
+        'taxi': taxi,
+        # distinct items, pickle would only write a reference for repeated ones
+        'batch-64': Batch(taxis),
+        'buffer-256k': bytearray(256 * 1024),
+    }
+    serializers = _serializers()
+
+    print('round trips (dumps + loads) per second')
+    print(f'{"serializer":<12}' + ''.join(f'{name:>14}' for name in payloads))
+    for name, serializer in serializers.items():
+        rates = []
+        for payload in payloads.values():
+            try:
+                rates.append(f'{round_trips(serializer, payload):>14.0f}')
+            except TypeError:
+                # msgpack only supports basic types
+                rates.append(f'{"-":>14}')
+        print(f'{name:<12}' + ''.join(rates))
+
+    print()
+    print('items per second between two processes, payload: taxi')
+    channels = {'queue': factory.queue_channel()}
+    for name, serializer in serializers.items():
+        if name != 'msgpack':
+            channels[f'queue+{name}'] = factory.queue_channel(serializer)
+            channels[f'ring+{name}'] = factory.ring_buffer_channel(serializer=serializer)
+    for name, channel_factory in channels.items():
+        print(f'{name:<16} {throughput(channel_factory, args.items, taxi):>12.0f}')
+
+    print()
+    print('items per second between two threads, payload: taxi')
+    for name, channel_factory in {'queue': factory.queue_channel(), 'local': factory.local_channel()}.items():
+        print(f'{name:<16} {throughput(channel_factory, args.items, taxi, use_thread=True):>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
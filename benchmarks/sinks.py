@@ -0,0 +1,65 @@
+"""
+Compares a sink that writes each item to a file with its own write call to FileSink, which buffers the lines and
+writes them at once.
+
+    python -m benchmarks.sinks --items 200000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from glimmer.processing import Sink
+from glimmer.processing.sink import FileSink
+
+
+class UnbufferedSink(Sink):
+    name = 'unbuffered-sink'
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.fd = open(path, 'ab', buffering=0)
+        self.writes = 0
+
+    def write(self, data):
+        self.fd.write(f'{data}\n'.encode('utf-8'))
+        self.writes += 1
+
+    def close(self):
+        self.fd.close()
+
+
+def run(sink: Sink, items: int, batch_size: int) -> float:
+    start = time.perf_counter()
+    if batch_size is None:
+        write = sink.write
+        for i in range(items):
+            write(i)
+    else:
+        for i in range(0, items, batch_size):
+            sink.write_batch(list(range(i, min(i + batch_size, items))))
+    sink.close()
+    return items / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=200000, help='number of items written')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    try:
+        unbuffered = UnbufferedSink(path)
+        rate = run(unbuffered, args.items, None)
+        print(f'{"write per item":<20} {rate:>12.0f} items/s {unbuffered.writes / args.items:>10.4f} writes/item')
+        for name, batch_size in [('buffered', None), ('buffered, batches', 1024)]:
+            sink = FileSink(path)
+            rate = run(sink, args.items, batch_size)
+            print(f'{name:<20} {rate:>12.0f} items/s {sink.flushes / args.items:>10.4f} writes/item')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+"""
+Runs standard topologies on all execution engines and reports throughput and latency.
+
+    python -m benchmarks.suite --items 20000 --output results.json
+    python -m benchmarks.suite --topologies linear wordcount --engines sync parallel-thread --cost 50
+    python -m benchmarks.suite --compare baseline.json results.json
+
+Topologies:
+    linear      source -> chain of operators -> sink
+    fan-out     source -> one operator per branch -> one sink per branch
+    diamond     source -> two operators -> KeyedJoin -> sink, like the taxi example
+    wordcount   source of sentences -> flat map into words -> count per word -> sink
+
+Latency is the time between the source emitting an item and the sink receiving it, which includes the time the
+item waited in edges. Use --rate to measure it below saturation. Topologies that an engine does not support, i.e.:
+multiple outputs in a synchronous environment, are reported as skipped.
+New engines are added to ENGINES, new topologies to TOPOLOGIES.
+"""
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import queue
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source, Operator, Sink, InvalidTopologyError
+from glimmer.processing.join import KeyedJoin
+
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do']
+
+
+@dataclass
+class Event:
+    seq: int
+    # time.perf_counter() when the source emitted the item, the clock is shared by all processes on Linux
+    ts: float
+    data: object
+
+
+@dataclass
+class Params:
+    items: int = 20000
+    # payload size in bytes
+    payload: int = 64
+    # busy time of each operator per item in microseconds
+    cost: float = 0.0
+    # items per second the sources emit, 0 emits as fast as possible
+    rate: float = 0.0
+    # operators of the linear topology
+    chain: int = 4
+    # branches of the fan-out topology
+    branches: int = 3
+
+
+def _spin(cost_s: float):
+    if cost_s > 0:
+        deadline = time.perf_counter() + cost_s
+        while time.perf_counter() < deadline:
+            pass
+
+
+class EventSource(Source):
+    name = 'source'
+
+    def __init__(self, params: Params, payload) -> None:
+        super().__init__()
+        self.items = params.items
+        self.interval = 1 / params.rate if params.rate > 0 else 0
+        self.payload = payload
+        self.seq = 0
+        self.next_emit = None
+
+    def read(self, out):
+        if self.seq >= self.items:
+            time.sleep(0.01)
+            return
+        now = time.perf_counter()
+        if self.interval:
+            if self.next_emit is None:
+                self.next_emit = now
+            if now < self.next_emit:
+                time.sleep(self.next_emit - now)
+                now = time.perf_counter()
+            self.next_emit += self.interval
+        out(Event(self.seq, now, self.payload))
+        self.seq += 1
+
+
+class CostOperator(Operator):
+
+    def __init__(self, name: str, cost_s: float) -> None:
+        self.name = name
+        super().__init__()
+        self.cost_s = cost_s
+
+    def apply(self, data: Event, out):
+        _spin(self.cost_s)
+        out(data)
+
+
+class SplitOperator(Operator):
+    name = 'split'
+
+    def __init__(self, cost_s: float) -> None:
+        super().__init__()
+        self.cost_s = cost_s
+
+    def apply(self, data: Event, out):
+        _spin(self.cost_s)
+        for word in data.data.split():
+            out(Event(data.seq, data.ts, word))
+
+
+class CountOperator(Operator):
+    name = 'count'
+
+    def __init__(self, cost_s: float) -> None:
+        super().__init__()
+        self.cost_s = cost_s
+        self.counts = dict()
+
+    def apply(self, data: Event, out):
+        _spin(self.cost_s)
+        count = self.counts.get(data.data, 0) + 1
+        self.counts[data.data] = count
+        out(Event(data.seq, data.ts, (data.data, count)))
+
+
+class MergeOperator(Operator):
+    name = 'merge'
+
+    def apply(self, data: dict, out):
+        left = data['left']
+        out(Event(left.seq, left.ts, (left.data, data['right'].data)))
+
+
+class ResultSink(Sink):
+    """Records the latency of each item and reports a summary once all expected items arrived
+    """
+
+    def __init__(self, name: str, expected: int, results) -> None:
+        self.name = name
+        super().__init__()
+        self.expected = expected
+        self.results = results
+        self.latencies = []
+        self.first = None
+
+    def write(self, data: Event):
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = data.ts
+        self.latencies.append(now - data.ts)
+        if len(self.latencies) == self.expected:
+            self.results.put((self.name, self.first, now, self.latencies))
+
+
+def _payload(params: Params, sentence: bool = False):
+    if not sentence:
+        return 'x' * params.payload
+    words = []
+    size = 0
+    while size < params.payload:
+        word = WORDS[len(words) % len(WORDS)]
+        words.append(word)
+        size += len(word) + 1
+    return ' '.join(words)
+
+
+def linear(params: Params, results) -> Tuple[List[Source], Dict[str, int]]:
+    source = EventSource(params, _payload(params))
+    node = source
+    cost_s = params.cost / 1e6
+    for i in range(params.chain):
+        node = node | CostOperator(f'op-{i}', cost_s)
+    node | ResultSink('sink', params.items, results)
+    return [source], {'sink': params.items}
+
+
+def fan_out(params: Params, results) -> Tuple[List[Source], Dict[str, int]]:
+    source = EventSource(params, _payload(params))
+    expected = dict()
+    for i in range(params.branches):
+        source | CostOperator(f'op-{i}', params.cost / 1e6) | ResultSink(f'sink-{i}', params.items, results)
+        expected[f'sink-{i}'] = params.items
+    return [source], expected
+
+
+def diamond(params: Params, results) -> Tuple[List[Source], Dict[str, int]]:
+    source = EventSource(params, _payload(params))
+    join = KeyedJoin('join', key_selector=lambda event: event.seq)
+    join.receive_from([source | CostOperator('left', params.cost / 1e6),
+                       source | CostOperator('right', params.cost / 1e6)])
+    join | MergeOperator() | ResultSink('sink', params.items, results)
+    return [source], {'sink': params.items}
+
+
+def wordcount(params: Params, results) -> Tuple[List[Source], Dict[str, int]]:
+    sentence = _payload(params, sentence=True)
+    source = EventSource(params, sentence)
+    expected = params.items * len(sentence.split())
+    sink = ResultSink('sink', expected, results)
+    source | SplitOperator(params.cost / 1e6) | CountOperator(params.cost / 1e6) | sink
+    return [source], {'sink': expected}
+
+
+TOPOLOGIES: Dict[str, Callable] = {
+    'linear': linear,
+    'fan-out': fan_out,
+    'diamond': diamond,
+    'wordcount': wordcount,
+}
+
+ENGINES: Dict[str, Callable] = {
+    'sync': lambda sources: factory.mk_synchronous_env(sources[0]),
+    'parallel-process': lambda sources: factory.mk_parallel_env(sources, task_factory=factory.process_factory()),
+    'parallel-thread': lambda sources: factory.mk_parallel_env(sources, task_factory=factory.thread_factory()),
+    'async': lambda sources: factory.mk_async_env(sources),
+}
+
+
+def _percentile(samples: List[float], p: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def run(topology: str, engine: str, params: Params, timeout: float = 120) -> dict:
+    """Runs a topology on an engine once, returns the measurement or the reason it was skipped
+    """
+    result = {'topology': topology, 'engine': engine}
+    results = multiprocessing.Queue()
+    sources, expected = TOPOLOGIES[topology](params, results)
+    try:
+        env = ENGINES[engine](sources)
+    except (InvalidTopologyError, AttributeError, AssertionError) as e:
+        result['skipped'] = str(e)
+        return result
+
+    env.start()
+    summaries = []
+    try:
+        deadline = time.monotonic() + timeout
+        while len(summaries) < len(expected):
+            summaries.append(results.get(timeout=max(0.0, deadline - time.monotonic())))
+    except queue.Empty:
+        result['error'] = f'timeout, {len(summaries)} of {len(expected)} sinks finished'
+        return result
+    finally:
+        env.stop()
+        if hasattr(env, 'close'):
+            env.close()
+
+    first = min(summary[1] for summary in summaries)
+    last = max(summary[2] for summary in summaries)
+    latencies = sorted(latency for summary in summaries for latency in summary[3])
+    elapsed = last - first
+    result.update({
+        'items_out': len(latencies),
+        'elapsed_s': elapsed,
+        'throughput': params.items / elapsed,
+        'latency_mean_us': statistics.mean(latencies) * 1e6,
+        'latency_p50_us': _percentile(latencies, 50) * 1e6,
+        'latency_p99_us': _percentile(latencies, 99) * 1e6,
+    })
+    return result
+
+
+def run_repeated(topology: str, engine: str, params: Params, repeat: int, timeout: float) -> dict:
+    """Runs a topology repeatedly and reports the run with the median throughput
+    """
+    runs = [run(topology, engine, params, timeout) for _ in range(repeat)]
+    measured = [result for result in runs if 'throughput' in result]
+    if len(measured) < len(runs):
+        return next(result for result in runs if 'throughput' not in result)
+    measured.sort(key=lambda result: result['throughput'])
+    median = measured[len(measured) // 2]
+    median['repeat'] = repeat
+    return median
+
+
+def _commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    return {
+        'commit': _commit(),
+        'time': datetime.datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def _print_result(result: dict):
+    name = f'{result["topology"]:<10} {result["engine"]:<17}'
+    if 'throughput' in result:
+        print(f'{name} {result["throughput"]:>12.0f} {result["latency_p50_us"]:>12.1f} '
+              f'{result["latency_p99_us"]:>12.1f}')
+    else:
+        print(f'{name} {result.get("skipped") or result.get("error")}')
+
+
+def compare(baseline_path: str, current_path: str):
+    """Prints the change in throughput and median latency of each run that both result files contain
+    """
+    with open(baseline_path) as fd:
+        baseline = {(r['topology'], r['engine']): r for r in json.load(fd)['results'] if 'throughput' in r}
+    with open(current_path) as fd:
+        current = {(r['topology'], r['engine']): r for r in json.load(fd)['results'] if 'throughput' in r}
+    print(f'{"topology":<10} {"engine":<17} {"throughput":>12} {"p50 latency":>12}')
+    for key, result in current.items():
+        if key in baseline:
+            before = baseline[key]
+            throughput = result['throughput'] / before['throughput'] - 1
+            latency = result['latency_p50_us'] / before['latency_p50_us'] - 1
+            print(f'{key[0]:<10} {key[1]:<17} {throughput:>+12.1%} {latency:>+12.1%}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--topologies', nargs='+', default=list(TOPOLOGIES), choices=list(TOPOLOGIES))
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument('--items', type=int, default=Params.items, help='items each source emits')
+    parser.add_argument('--payload', type=int, default=Params.payload, help='payload size in bytes')
+    parser.add_argument('--cost', type=float, default=Params.cost, help='busy time per operator and item in us')
+    parser.add_argument('--rate', type=float, default=Params.rate, help='items per second, 0 is unlimited')
+    parser.add_argument('--chain', type=int, default=Params.chain, help='operators of the linear topology')
+    parser.add_argument('--branches', type=int, default=Params.branches, help='branches of the fan-out topology')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the median is reported')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds a single run may take')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # nodes log each shutdown as warning
+    logging.disable(logging.WARNING)
+    params = Params(items=args.items, payload=args.payload, cost=args.cost, rate=args.rate, chain=args.chain,
+                    branches=args.branches)
+    print(f'{"topology":<10} {"engine":<17} {"items/s":>12} {"p50 (us)":>12} {"p99 (us)":>12}')
+    results = []
+    for topology in args.topologies:
+        for engine in args.engines:
+            result = run_repeated(topology, engine, params, args.repeat, args.timeout)
+            _print_result(result)
+            results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump({'environment': environment(), 'params': vars(params), 'results': results}, fd, indent=2)
+
+
+if __name__ == '__main__':
+    main()
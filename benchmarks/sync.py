@@ -0,0 +1,73 @@
+"""
+Measures the per-item overhead of SynchronousEnvironment with trivial nodes, which is dominated by the loop of the
+environment itself.
+
+    python -m benchmarks.sync --items 500000
+"""
+import argparse
+import time
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source, Operator, Sink
+
+
+class CountingSource(Source):
+    name = 'counting-source'
+
+    def __init__(self, items: int) -> None:
+        super().__init__()
+        self.items = items
+        self.idx = 0
+        self.env = None
+
+    def read(self, out):
+        if self.idx == self.items:
+            self.env.stop()
+            return
+        self.idx += 1
+        out(self.idx)
+
+
+class Increment(Operator):
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        super().__init__()
+
+    def apply(self, data, out):
+        out(data + 1)
+
+
+class NullSink(Sink):
+    name = 'null-sink'
+
+    def write(self, data):
+        pass
+
+
+def items_per_second(items: int, operators: int, skip_none: bool = False) -> float:
+    source = CountingSource(items)
+    node = source
+    for i in range(operators):
+        node = node | Increment(f'increment-{i}')
+    node | NullSink()
+    env = factory.mk_synchronous_env(source, skip_none=skip_none)
+    source.env = env
+    start = time.perf_counter()
+    env.run()
+    return items / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=500000, help='items read from the source')
+    parser.add_argument('--operators', type=int, default=3, help='operators between source and sink')
+    parser.add_argument('--repeat', type=int, default=3, help='runs, the best is reported')
+    args = parser.parse_args()
+
+    best = max(items_per_second(args.items, args.operators) for _ in range(args.repeat))
+    print(f'{args.operators} operators: {best:.0f} items/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Compares encoding the nested dataclasses of the taxi example as JSON with dataclasses.asdict and EnhancedJSONEncoder
+to JsonEncoder, which converts each dataclass type with a generated function, with and without orjson.
+
+    python -m benchmarks.to_json --items 200000
+"""
+import argparse
+import json
+import random
+import time
+
+from examples.taxi.nodes import TaxiData, TaxiWithSpeed
+from glimmer.processing.serialization import JsonEncoder, orjson
+from glimmer.util import EnhancedJSONEncoder
+
+
+def _taxis(items: int):
+    rnd = random.Random(1)
+    return [TaxiWithSpeed(TaxiData(rnd.randrange(100), 1581000000.0 + i, 116.3 + rnd.random() * 0.3,
+                                   39.8 + rnd.random() * 0.2), rnd.random() * 100) for i in range(items)]
+
+
+def items_per_second(dumps, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        dumps(item)
+    return len(items) / (time.perf_counter() - start)
+
+
+def batch_items_per_second(encoder: JsonEncoder, items, batch_size: int) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(items), batch_size):
+        encoder.dumps_batch(items[i:i + batch_size])
+    return len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=200000, help='number of encoded items')
+    parser.add_argument('--batch-size', type=int, default=1024, help='items per batch')
+    args = parser.parse_args()
+
+    items = _taxis(args.items)
+    results = [('asdict', items_per_second(lambda item: json.dumps(item, cls=EnhancedJSONEncoder), items))]
+    encoders = [('compiled', JsonEncoder())]
+    if orjson is not None:
+        encoders.append(('orjson', JsonEncoder(use_orjson=True)))
+    for name, encoder in encoders:
+        results.append((name, items_per_second(encoder.dumps, items)))
+        results.append((f'{name}, batches', batch_items_per_second(encoder, items, args.batch_size)))
+    for name, rate in results:
+        print(f'{name:<20} {rate:>12.0f} items/s')
+
+
+if __name__ == '__main__':
+    main()
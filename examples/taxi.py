@@ -1,6 +1,8 @@
 import logging
 
 import glimmer.processing.factory as factory
+from glimmer.processing.channel import EdgeConfig, BLOCK
+from glimmer.processing.join import KeyedJoin
 from examples.taxi.nodes import TaxiSource, CalculateSpeedOp, AverageSpeedOp, TotalDistanceOp, time_to_unix, \
     filter_small_values, merge, persist, raw_persist
 
@@ -13,7 +15,7 @@ def main():
     Topology looks like this
         raw-persist                  Calculate speed - Calculate avg speed   
          /                         /                                        \
-    Taxis - convert time to unix    - persist |                             merge - filter small values - Publish data
+    Taxis - convert time to unix    - persist |                             join - merge - filter small values - Publish data
                                    \                                        /
                                         Calculate total distance                      
     """
@@ -28,6 +30,9 @@ def main():
     time_to_unix_op = factory.mk_op(time_to_unix, 'time2unix')
     filter_op = factory.mk_op(filter_small_values, 'filter')
     merge_op = factory.mk_op(merge, 'merge')
+    # matches the results of both branches by taxi and time, instead of waiting for one item of each branch in turns.
+    # Measurements that are still incomplete after 30 seconds are dropped
+    join = KeyedJoin('join', key_selector=lambda taxi: (taxi.data.id, taxi.data.time), timeout=30)
 
     # Define sinks
     persist_op = factory.mk_sink(persist, 'persist')
@@ -38,12 +43,15 @@ def main():
     source.send_to([raw_persist_op, time_to_unix_op])
     time_to_unix_op.send_to([total_distance, calc_speed, persist_op])
     calc_speed.send_to(avg_speed)
-    merge_op.receive_from([total_distance, avg_speed])
+    join.receive_from([total_distance, avg_speed])
+    join.send_to(merge_op)
     merge_op.send_to(filter_op)
     filter_op.send_to(sink)
 
     #  Create execution environment
-    env = factory.mk_parallel_env([source], task_factory=factory.process_factory())
+    #  Edges are bounded, the slow total-distance operator slows down the source instead of letting queues grow
+    env = factory.mk_parallel_env([source], task_factory=factory.process_factory(),
+                                  edge_config=EdgeConfig(capacity=100, policy=BLOCK))
 
     env.start()
     print('Hit enter to stop environment')
@@ -2,11 +2,16 @@ import math
 from dataclasses import dataclass
 from datetime import datetime
 from time import sleep
-from typing import Optional
+from typing import Optional, List
 
-from glimmer.processing import Source, Operator
+from glimmer.processing import Source, Operator, BatchOperator
 from glimmer.util.context import Context
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 @dataclass
 class RawTaxiData:
@@ -48,6 +53,20 @@ def haversine(lat1, lng1, lat2, lng2) -> float:
     return 2 * 6371 * math.asin(math.sqrt(d))
 
 
+def haversine_batch(lat1, lng1, lat2, lng2):
+    """Distance between each pair of coordinates in kilometers, vectorized with numpy in case it is installed
+    """
+    if numpy is None:
+        return [haversine(*coordinates) for coordinates in zip(lat1, lng1, lat2, lng2)]
+    lat1 = numpy.radians(lat1)
+    lat2 = numpy.radians(lat2)
+    lng1 = numpy.radians(lng1)
+    lng2 = numpy.radians(lng2)
+
+    d = numpy.sin((lat2 - lat1) * 0.5) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lng2 - lng1) * 0.5) ** 2
+    return 2 * 6371 * numpy.arcsin(numpy.sqrt(d))
+
+
 @dataclass
 class Checkpoint:
     time: float
@@ -60,11 +79,12 @@ class CalculateSpeedOp(Operator[TaxiData, TaxiWithSpeed]):
 
     def __init__(self, ctx: Context = None) -> None:
         super().__init__(ctx)
-        self.last_pos = dict()
+        self.last_pos = self.keyed_state('last_pos')
 
     def apply(self, data: TaxiData, out):
         self.logger.info(f'calc speed: {data}')
-        last_checkpoint: Checkpoint = self.last_pos.get(data.id, Checkpoint(data.time, data.latitude, data.longitude))
+        last_checkpoint: Checkpoint = self.last_pos.get(data.id, Checkpoint(data.time, data.longitude, data.latitude))
+        self.last_pos[data.id] = Checkpoint(data.time, data.longitude, data.latitude)
         last_lat = last_checkpoint.latitude
         last_lng = last_checkpoint.longitude
 
@@ -83,13 +103,40 @@ class CalculateSpeedOp(Operator[TaxiData, TaxiWithSpeed]):
         out(TaxiWithSpeed(data=data, speed=speed))
 
 
+class VectorizedSpeedOp(BatchOperator[TaxiData, TaxiWithSpeed]):
+    """Calculates the same speed as CalculateSpeedOp, but the distances of all available items at once
+    """
+    name = 'calc-speed'
+
+    def __init__(self, ctx: Context = None) -> None:
+        super().__init__(ctx)
+        self.last_pos = self.keyed_state('last_pos')
+
+    def apply_batch(self, items: List[TaxiData], out):
+        # the checkpoints are updated item by item, a taxi may occur multiple times in a batch
+        last_pos = self.last_pos
+        previous = []
+        for data in items:
+            previous.append(last_pos.get(data.id, Checkpoint(data.time, data.longitude, data.latitude)))
+            last_pos[data.id] = Checkpoint(data.time, data.longitude, data.latitude)
+
+        distances = haversine_batch([checkpoint.latitude for checkpoint in previous],
+                                    [checkpoint.longitude for checkpoint in previous],
+                                    [data.latitude for data in items],
+                                    [data.longitude for data in items])
+        for data, checkpoint, distance in zip(items, previous, distances):
+            time_passed = data.time - checkpoint.time
+            speed = (distance / time_passed) * 60 if time_passed != 0 else 0
+            out(TaxiWithSpeed(data=data, speed=float(speed)))
+
+
 class AverageSpeedOp(Operator[TaxiWithSpeed, TaxiWithSpeed]):
     name = 'avg-speed'
 
     def __init__(self, ctx: Context = None) -> None:
         super().__init__(ctx)
         # key: taxi id, value: (n, avg)
-        self.last_speed = dict()
+        self.last_speed = self.keyed_state('last_speed')
 
     def apply(self, data: TaxiWithSpeed, out):
         self.logger.info(f'average speed: {data}')
@@ -108,7 +155,7 @@ class TotalDistanceOp(Operator[TaxiData, TaxiWithDistance]):
     def __init__(self, ctx: Context = None) -> None:
         super().__init__(ctx)
         # key: id, value: ((last_lat, last_lng), total_distance)
-        self.last_update = dict()
+        self.last_update = self.keyed_state('last_update')
 
     def open(self):
         self.logger.info('Open Total distance')
@@ -42,6 +42,11 @@ def main():
 
     # In case you would like to have all nodes executed in separated threads or processes:
     # env = factory.mk_parallel_env([words])
+    # The operators separate-lines -> ... -> reducer can also be run as a single task, which saves the transport
+    # between them. Sources and sinks always run as tasks of their own:
+    # env = factory.mk_parallel_env([words], fuse=True)
+    # The reducer keeps a count per word, to spread it over multiple instances partition its input by word:
+    # reducer.key_by(lambda word_count: word_count[0], parallelism=4)
     try:
         env.run()
     except KeyboardInterrupt:
@@ -13,7 +13,7 @@ class Reducer(Operator[Tuple[str, int], Tuple[str, int]]):
 
     def __init__(self, ctx: Context = None) -> None:
         super().__init__(ctx)
-        self.statistics = dict()
+        self.statistics = self.keyed_state('statistics')
 
     def apply(self, data: Tuple[str, int], out: Callable[[Tuple[str, int]], None]):
         count = self.statistics.get(data[0], 0)
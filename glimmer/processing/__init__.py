@@ -1,7 +1,11 @@
 import abc
 import multiprocessing
+import time
 from typing import TypeVar, Generic, Dict, List, Callable
 
+from glimmer.processing.channel import ROUND_ROBIN
+from glimmer.processing.metrics import NodeMetrics
+from glimmer.processing.state import KeyedState
 from glimmer.util.context import Context
 
 Result = TypeVar("Result")
@@ -90,6 +94,14 @@ class Node(abc.ABC):
     name: str
     inputs: Dict[str, 'Node']
     outputs: Dict[str, 'Node']
+    # number of instances of this node a parallel environment executes
+    parallelism: int = 1
+    # returns the key of an incoming item, items with the same key are processed by the same instance
+    key_selector: Callable = None
+    # how items without key are distributed among the instances: ROUND_ROBIN or LEAST_LOADED
+    distribution: str = ROUND_ROBIN
+    # in case the node runs in multiple instances, nodes that read from it receive the items in input order
+    ordered: bool = False
 
     def __init__(self, ctx: Context = None) -> None:
         super().__init__()
@@ -112,6 +124,33 @@ class Node(abc.ABC):
         """
         pass
 
+    def key_by(self, key_selector: Callable, parallelism: int = None) -> 'Node':
+        """
+        Partitions the input of this node by the key the passed function returns for each item.
+        In a parallel environment, the node runs in multiple instances and all items with the same key are
+        processed by the same instance. Therefore state that is kept per key stays in a single instance.
+        :param key_selector: function that returns the key of an item
+        :param parallelism: number of instances
+        """
+        self.key_selector = key_selector
+        if parallelism is not None:
+            self.parallelism = parallelism
+        return self
+
+    def replicate(self, replicas: int, distribution: str = ROUND_ROBIN, ordered: bool = False) -> 'Node':
+        """
+        Runs the node in multiple instances in a parallel environment, which is only valid for stateless nodes.
+        :param replicas: number of instances
+        :param distribution: ROUND_ROBIN sends the items to the instances in turns,
+                             LEAST_LOADED sends each item to the instance with the fewest items in flight
+        :param ordered: in case it is set to True, the outputs of the instances are reordered to match the input
+                        order, at the cost of buffering outputs that overtook earlier ones
+        """
+        self.parallelism = replicas
+        self.distribution = distribution
+        self.ordered = ordered
+        return self
+
     def send_to(self, other):
         """
         Adds passed nodes or functions as output receiving nodes
@@ -170,6 +209,28 @@ class Node(abc.ABC):
 
 
 class Source(Node, Generic[Result]):
+    # whether the input of the source can be split among multiple instances, see split
+    splittable: bool = False
+    # whether the source read all of its input, environments end the stream once it is set
+    exhausted: bool = False
+
+    def split(self, index: int, instances: int):
+        """Restricts the source to the index-th of instances disjoint parts of its input. In case a splittable source
+        runs in multiple instances in a parallel environment, each instance is split before it runs
+        """
+        raise NotImplementedError
+
+    def position(self):
+        """Returns the position of the source in its input, i.e.: an offset, which checkpoints contain. None in case
+        the source can not continue at a position, it then reads its input again after a restart
+        """
+        return None
+
+    def restore(self, position):
+        """Continues reading at a position that position returned, called once the source is restored from a
+        checkpoint before it reads
+        """
+        pass
 
     def read(self, out: Callable[[Result], None]):
         """Reads from the source, type of return value depends on implementation
@@ -181,6 +242,8 @@ class Source(Node, Generic[Result]):
 
 
 class Sink(Node, Generic[In]):
+    # maximum number of items an environment passes to write_batch at once, None passes one item at a time to write
+    batch_size: int = None
 
     def write(self, data: In):
         """Consumes data
@@ -190,8 +253,35 @@ class Sink(Node, Generic[In]):
         """
         raise NotImplementedError
 
+    def write_batch(self, items: List[In]):
+        """Consumes multiple items at once, environments pass the items that are available, at most batch_size.
+        Calls write for each item by default
+        """
+        write = self.write
+        for item in items:
+            write(item)
+
+
+class BatchSink(Sink[In]):
+    """Sink that only implements write_batch, i.e.: to write all available items with one request.
+    Environments that pass one item at a time call write_batch with a list of one item
+    """
+    batch_size = 1024
+
+    def write(self, data: In):
+        self.write_batch([data])
+
+    def write_batch(self, items: List[In]):
+        raise NotImplementedError
+
 
 class Operator(Node, Generic[In, Out]):
+    # set to False to always execute the operator as its own task, even if the environment fuses operator chains
+    chainable: bool = True
+    # maximum number of items an environment passes to apply_batch at once, None passes one item at a time to apply
+    batch_size: int = None
+    # keyed states of the operator, keyed by name, see keyed_state
+    states: Dict[str, KeyedState] = None
 
     def apply(self, data: In, out: Callable[[Out], None]):
         """Consumes data, possible transforms it, and returns data
@@ -201,6 +291,28 @@ class Operator(Node, Generic[In, Out]):
         """
         raise NotImplementedError
 
+    def apply_batch(self, items: List[In], out: Callable[[Out], None]):
+        """Consumes multiple items at once, i.e.: to process them with vectorized functions. Environments pass the
+        items that are available, at most batch_size. Each output is passed to out separately.
+        Calls apply for each item by default
+        """
+        apply = self.apply
+        for item in items:
+            apply(item, out)
+
+    def keyed_state(self, name: str = 'state', capacity: int = 100000, ttl: float = None,
+                    directory: str = None, spill_batch: int = None) -> KeyedState:
+        """Returns the keyed state with the passed name, it is created on the first call.
+        States created in __init__ are reported in the metrics of the environment, see KeyedState for the arguments
+        """
+        if self.states is None:
+            self.states = dict()
+        state = self.states.get(name)
+        if state is None:
+            state = KeyedState(name, capacity, ttl, directory, spill_batch)
+            self.states[name] = state
+        return state
+
     def __sub__(self, other):
         return composition(self, other)
 
@@ -208,6 +320,19 @@ class Operator(Node, Generic[In, Out]):
         return self.name
 
 
+class BatchOperator(Operator[In, Out]):
+    """Operator that only implements apply_batch.
+    Environments that pass one item at a time call apply_batch with a list of one item
+    """
+    batch_size = 1024
+
+    def apply(self, data: In, out: Callable[[Out], None]):
+        self.apply_batch([data], out)
+
+    def apply_batch(self, items: List[In], out: Callable[[Out], None]):
+        raise NotImplementedError
+
+
 class Topology:
     pass
 
@@ -239,45 +364,153 @@ class Environment:
         """
         raise NotImplementedError
 
+    def metrics(self) -> Dict[str, dict]:
+        """Returns a snapshot of the metrics of all nodes, keyed by node name, the depth of all edges and the counters
+        of the keyed states of the operators: {'nodes': {name: metrics}, 'edges': {(from, to): stats},
+        'states': {name: {state: stats}}}
+        Metrics are kept in shared memory, therefore they can be read while the environment runs in another process.
+        """
+        raise NotImplementedError
 
-def composition(op_1: Operator[A, B], op_2: Operator[B, C], fail_fast: bool = True) -> Operator[A, C]:
-    """
-    Returns the composition of the passed functions.
-    The fail_fast parameter dictates how the case is handled if the first operator returns None.
-    If it is set to true, the second function will not be called.
+
+class ChainedOperator(Operator):
+    """Executes a chain of operators as a single operator, each operator receives the outputs of the previous one.
+    The callbacks that pass the outputs from one operator to the next are created once, instead of a closure per
+    operator and item, therefore the overhead per item grows linearly with the length of the chain. Each operator
+    still calls the next one through its out function, a flat loop that buffers the outputs of each operator and
+    passes them on stage by stage is not faster, see benchmarks/chains.py.
+    In case fail_fast is set, None outputs are not passed to the next operator.
     """
 
-    class ComposedOperator(Operator[A, C]):
-        name = f"({op_1.name} -> {op_2.name})"
+    def __init__(self, operators: List[Operator], fail_fast: bool = True, ctx: Context = None):
+        if len(operators) == 0:
+            raise AssertionError("No operator in list")
+        self.name = '(' + ' -> '.join(op.name for op in operators) + ')'
+        super().__init__(ctx)
+        self.operators = list(operators)
+        self.fail_fast = fail_fast
+        # out function of the current call of apply, which receives the outputs of the last operator
+        self.out = None
+        self.head = self.operators[0].apply
+        self.head_batch = self.operators[0].apply_batch
+        self.callbacks = self._link([op.apply for op in self.operators])
+        # the chain receives batches in case its first operator does
+        self.batch_size = self.operators[0].batch_size
+        # metrics of each operator, None in case the chain is not instrumented
+        self.operator_metrics = None
+
+    def _link(self, applies: List[Callable], metrics: List[NodeMetrics] = None) -> List[Callable]:
+        """Returns the out function of each operator, which counts the outputs of the operator in case metrics are set
+        """
 
-        def apply(self, data: A, out: Callable[[C], None]):
-            def out_f(data_f):
-                if not (fail_fast and data_f is None):
-                    op_2.apply(data_f, out)
+        def emit(data):
+            self.out(data)
+
+        callbacks = [emit]
+        for i in reversed(range(len(applies))):
+            if metrics is not None:
+                callbacks[0] = _counted(callbacks[0], metrics[i])
+            if i > 0:
+                callbacks.insert(0, _stage(applies[i], callbacks[0], self.fail_fast))
+        return callbacks
+
+    def instrument(self) -> Dict[str, NodeMetrics]:
+        """Records items in and out and the latency of each operator of the chain and returns the metrics keyed by
+        operator name. The time an operator spends in apply excludes the time of the operators after it, which it
+        calls through its out function.
+        """
+        metrics = [NodeMetrics() for _ in self.operators]
+        # time spent in the next operator during the current call of each operator
+        inner = [0] * len(self.operators)
+        applies = [_measured(op.apply, i, metrics, inner) for i, op in enumerate(self.operators)]
+        self.head = applies[0]
+        self.head_batch = _measured(self.operators[0].apply_batch, 0, metrics, inner, batch=True)
+        self.callbacks = self._link(applies, metrics)
+        self.operator_metrics = metrics
+        return {op.name: node_metrics for op, node_metrics in zip(self.operators, metrics)}
+
+    def apply(self, data, out: Callable):
+        self.out = out
+        self.head(data, self.callbacks[0])
+
+    def apply_batch(self, items: list, out: Callable):
+        self.out = out
+        self.head_batch(items, self.callbacks[0])
+
+    def open(self):
+        if self.operator_metrics is not None:
+            for node_metrics in self.operator_metrics:
+                node_metrics.start()
+        for op in self.operators:
+            op.open()
+
+    def close(self):
+        for op in self.operators:
+            op.close()
+
+
+def _stage(apply: Callable, out: Callable, fail_fast: bool) -> Callable:
+    if fail_fast:
+        def stage(data):
+            if data is not None:
+                apply(data, out)
+    else:
+        def stage(data):
+            apply(data, out)
+    return stage
 
-            op_1.apply(data, out_f)
 
-        def open(self):
-            op_1.open()
-            op_2.open()
+def _counted(out: Callable, metrics: NodeMetrics) -> Callable:
+    values = metrics.values
 
-        def close(self):
-            op_1.close()
-            op_2.close()
+    def counted(data):
+        if data is not None:
+            values[NodeMetrics.ITEMS_OUT] += 1
+        out(data)
 
-    return ComposedOperator()
+    return counted
+
+
+def _measured(apply: Callable, index: int, metrics: List[NodeMetrics], inner: List[int],
+              batch: bool = False) -> Callable:
+    values = metrics[index].values
+    record = metrics[index].record
+    clock = time.perf_counter_ns
+    outer = index - 1
+
+    def measured(data, out):
+        values[NodeMetrics.ITEMS_IN] += len(data) if batch else 1
+        inner[index] = 0
+        start = clock()
+        apply(data, out)
+        elapsed = clock() - start
+        record(elapsed - inner[index])
+        if outer >= 0:
+            inner[outer] += elapsed
+
+    return measured
+
+
+def composition(op_1: Operator[A, B], op_2: Operator[B, C], fail_fast: bool = True) -> Operator[A, C]:
+    """
+    Returns the composition of the passed functions.
+    The fail_fast parameter dictates how the case is handled if the first operator returns None.
+    If it is set to true, the second function will not be called.
+    Compositions of compositions are flattened into a single chain.
+    """
+    operators = []
+    for op in (op_1, op_2):
+        if isinstance(op, ChainedOperator) and op.fail_fast == fail_fast:
+            operators.extend(op.operators)
+        else:
+            operators.append(op)
+    return ChainedOperator(operators, fail_fast)
 
 
 def compose_list(operators: List[Operator]) -> Operator:
     if len(operators) == 1:
         return operators[0]
-    elif len(operators) == 0:
-        raise AssertionError("No operator in list")
-    else:
-        composed = operators[0] - operators[1]
-        for op in operators[2:]:
-            composed = composed - op
-        return composed
+    return ChainedOperator(operators)
 
 
 class Executable(abc.ABC):
@@ -289,3 +522,6 @@ class Executable(abc.ABC):
 
     def join(self, timeout):
         raise NotImplementedError
+
+    def is_alive(self) -> bool:
+        raise NotImplementedError
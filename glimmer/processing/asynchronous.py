@@ -0,0 +1,374 @@
+import asyncio
+import inspect
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TypeVar, List, Callable, Awaitable, Tuple, Dict
+
+from glimmer.processing import Source, Operator, Sink, Node, Topology, Environment, InvalidTopologyError
+from glimmer.processing.channel import EOS
+from glimmer.processing.join import JoinOperator
+from glimmer.processing.metrics import NodeMetrics
+from glimmer.processing.state import state_stats
+from glimmer.processing.parallel import collect_nodes, _warn_duplicate
+
+Result = TypeVar("Result")
+In = TypeVar("In")
+Out = TypeVar("Out")
+
+
+class AsyncSource(Source[Result]):
+
+    async def read(self, out: Callable[[Result], Awaitable[None]]):
+        """Reads from the source, each item is passed to the out coroutine function, which has to be awaited
+        :raises:
+            ReadError
+        """
+        raise NotImplementedError
+
+
+class AsyncOperator(Operator[In, Out]):
+
+    async def apply(self, data: In, out: Callable[[Out], Awaitable[None]]):
+        """Consumes data, possible transforms it, and passes the results to the out coroutine function,
+        which has to be awaited
+        :raises:
+            OperatorError: in case there is an error during application
+        """
+        raise NotImplementedError
+
+
+class AsyncSink(Sink[In]):
+
+    async def write(self, data: In):
+        """Consumes data
+        :raises:
+            WriteError
+        """
+        raise NotImplementedError
+
+
+@dataclass
+class AsyncTopology(Topology):
+    sources: List[Source]
+    operators: List[Operator]
+    sinks: List[Sink]
+
+    @property
+    def nodes(self) -> List[Node]:
+        return self.sources + self.operators + self.sinks
+
+
+def mk_async_topology(sources: List[Source], logger: logging.Logger = logging.getLogger(__name__)) -> AsyncTopology:
+    """
+    Helper function to generate a topology from a list of initialized sources, see mk_parallel_topology
+    """
+    _warn_duplicate(sources, logger)
+    operators, sinks = collect_nodes(sources)
+    topology = AsyncTopology(sources, operators, sinks)
+    for node in topology.nodes:
+        if node.parallelism != 1:
+            raise InvalidTopologyError(f'Node {node.name} can not have multiple instances in an async environment, '
+                                       f'use a parallel environment instead')
+    return topology
+
+
+def is_async(method: Callable) -> bool:
+    """Returns True in case the passed method of a node is a coroutine function
+    """
+    return inspect.iscoroutinefunction(method)
+
+
+class AsyncEnvironment(Environment):
+    """This environment executes all nodes of the topology as tasks on one asyncio event loop. Nodes communicate
+    via asyncio.Queue instances. Nodes that implement read, apply or write as coroutine functions (i.e.: AsyncSource)
+    run on the loop, the methods of all other nodes are offloaded to a thread pool, so they don't block the loop.
+    The pool has one thread per offloaded node by default, so a synchronous source that blocks in read never keeps
+    another node from running.
+    The busy time of coroutine nodes includes the time they await, i.e.: I/O or publishing into a full edge.
+    """
+
+    def __init__(self, topology: AsyncTopology, logger: logging.Logger = None, capacity: int = 0,
+                 max_workers: int = None, offload: bool = True, poll_interval: float = 0.05):
+        """
+        Initializes the environment
+        :param topology: the topology that will be executed
+        :param capacity: maximum number of items an edge holds, a node that publishes into a full edge waits until
+                         the receiving node catches up. 0 means the edges are unbounded
+        :param max_workers: number of threads that execute the methods of synchronous nodes, defaults to one per
+                            synchronous node. Synchronous sources occupy a thread for each read, with fewer threads
+                            than synchronous sources some of them starve
+        :param offload: in case it is set to False, synchronous nodes are called on the event loop, which is only
+                        advisable for nodes that never block
+        :param poll_interval: interval in seconds in which the stop signal is checked
+        """
+        super().__init__(topology, multiprocessing.Event())
+        if logger is None:
+            logger = logging.getLogger(__name__)
+        self.logger = logger
+        self.capacity = capacity
+        self.max_workers = max_workers
+        self.offload = offload
+        self.poll_interval = poll_interval
+        self.p = None
+        self._executor = None
+        self._queues = dict()
+        self.node_metrics = {node.name: NodeMetrics() for node in topology.nodes}
+
+    def start(self, use_thread: bool = False):
+        if use_thread:
+            self.p = threading.Thread(target=self.run)
+        else:
+            self.p = multiprocessing.Process(target=self.run)
+        self.p.start()
+
+    def join(self, timeout: int = None):
+        self.p.join(timeout)
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        """Executes the topology on the running event loop until the environment is stopped
+        """
+        self._executor = ThreadPoolExecutor(self._workers(), thread_name_prefix='glimmer')
+        queues = dict()
+        for node in self.topology.sources + self.topology.operators:
+            for out in node.outputs.values():
+                queues[(node.name, out.name)] = asyncio.Queue(self.capacity)
+        self._queues = queues
+
+        tasks = []
+        try:
+            for node in self.topology.nodes:
+                await self._call(node.open)
+                self.node_metrics[node.name].start()
+
+            runs = [self._run_source(source, _out_queues(source, queues)) for source in self.topology.sources]
+            runs.extend(self._run_operator(op, _in_queues(op, queues), _out_queues(op, queues))
+                        for op in self.topology.operators)
+            runs.extend(self._run_sink(sink, _in_queues(sink, queues)) for sink in self.topology.sinks)
+            for node, run in zip(self.topology.nodes, runs):
+                tasks.append(asyncio.ensure_future(self._run_node(node, run)))
+
+            self.logger.info('Started topology, waiting for stop signal')
+            while not self.stop_signal.is_set():
+                if all(task.done() for task in tasks):
+                    self.logger.info('All nodes finished')
+                    break
+                await asyncio.sleep(self.poll_interval)
+            else:
+                self.logger.info('Received stop signal, stopping all nodes')
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for node in self.topology.nodes:
+                try:
+                    await self._call(node.close)
+                except Exception:
+                    node.logger.exception(f'Failed to close {node.name}')
+            self._executor.shutdown(wait=False)
+
+    def _workers(self) -> int:
+        sources = [source for source in self.topology.sources if not is_async(source.read)]
+        operators = [op for op in self.topology.operators
+                     if not isinstance(op, JoinOperator) and not is_async(op.apply)]
+        sinks = [sink for sink in self.topology.sinks if not is_async(sink.write)]
+        if self.max_workers is None:
+            return max(1, len(sources) + len(operators) + len(sinks))
+        if self.offload and self.max_workers < len(sources):
+            self.logger.warning(f'{len(sources)} synchronous sources share {self.max_workers} threads, '
+                                f'some of them can not read')
+        return self.max_workers
+
+    async def _run_node(self, node: Node, run: Awaitable):
+        try:
+            await run
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            node.logger.exception(f'{node.name} failed, stopping environment')
+            self.stop()
+
+    async def _run_source(self, source: Source, out_qs: List[asyncio.Queue]):
+        metrics = self.node_metrics[source.name]
+        publish = _publisher(out_qs, metrics)
+        clock = time.perf_counter_ns
+        read_async = is_async(source.read)
+        read = self._bind(source.read)
+        while True:
+            start = clock()
+            if read_async:
+                await read(publish)
+                metrics.record(clock() - start)
+            else:
+                items = []
+                await read(items.append)
+                metrics.record(clock() - start)
+                for item in items:
+                    await publish(item)
+            if source.exhausted:
+                await _end_stream(out_qs)
+                return
+
+    async def _run_operator(self, op: Operator, in_qs: List[Tuple[str, asyncio.Queue]],
+                            out_qs: List[asyncio.Queue]):
+        metrics = self.node_metrics[op.name]
+        values = metrics.values
+        publish = _publisher(out_qs, metrics)
+        if isinstance(op, JoinOperator):
+            await _run_join(op, in_qs, publish, metrics)
+            await _end_stream(out_qs)
+            return
+        clock = time.perf_counter_ns
+        apply_async = is_async(op.apply)
+        apply = self._bind(op.apply)
+        while True:
+            waiting = clock()
+            data = await _get_items(in_qs)
+            start = clock()
+            values[NodeMetrics.WAIT] += start - waiting
+            if data is EOS:
+                await _end_stream(out_qs)
+                return
+            values[NodeMetrics.ITEMS_IN] += 1
+            if apply_async:
+                await apply(data, publish)
+                metrics.record(clock() - start)
+            else:
+                items = []
+                await apply(data, items.append)
+                metrics.record(clock() - start)
+                for item in items:
+                    await publish(item)
+
+    async def _run_sink(self, sink: Sink, in_qs: List[Tuple[str, asyncio.Queue]]):
+        metrics = self.node_metrics[sink.name]
+        values = metrics.values
+        clock = time.perf_counter_ns
+        write = self._bind(sink.write)
+        while True:
+            waiting = clock()
+            data = await _get_items(in_qs)
+            start = clock()
+            values[NodeMetrics.WAIT] += start - waiting
+            if data is EOS:
+                return
+            values[NodeMetrics.ITEMS_IN] += 1
+            await write(data)
+            metrics.record(clock() - start)
+
+    async def _call(self, method: Callable, *args):
+        return await self._bind(method)(*args)
+
+    def _bind(self, method: Callable) -> Callable[..., Awaitable]:
+        """Returns a coroutine function that calls the method on the loop or in the thread pool, the method is only
+        checked once, instead of for each call
+        """
+        if is_async(method):
+            return method
+        if not self.offload:
+            async def call(*args):
+                return method(*args)
+
+            return call
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+
+        async def offloaded(*args):
+            return await loop.run_in_executor(executor, method, *args)
+
+        return offloaded
+
+    def stop(self):
+        self.logger.info('Stop environment')
+        self.stop_signal.set()
+
+    def metrics(self) -> Dict[str, dict]:
+        # the depth of the edges is only known in case the environment runs in this process
+        edges = {edge: {'in_flight': q.qsize()} for edge, q in self._queues.items()}
+        return {'nodes': {name: metrics.snapshot() for name, metrics in self.node_metrics.items()}, 'edges': edges,
+                'states': state_stats({node.name: node for node in self.topology.nodes})}
+
+
+def _out_queues(node: Node, queues: Dict[Tuple[str, str], asyncio.Queue]) -> List[asyncio.Queue]:
+    return [queues[(node.name, out)] for out in node.outputs.keys()]
+
+
+def _in_queues(node: Node, queues: Dict[Tuple[str, str], asyncio.Queue]) -> List[Tuple[str, asyncio.Queue]]:
+    return [(name, queues[(name, node.name)]) for name in node.inputs.keys()]
+
+
+def _publisher(out_qs: List[asyncio.Queue], metrics: NodeMetrics):
+    values = metrics.values
+
+    async def publish(item):
+        if item is not None:
+            values[NodeMetrics.ITEMS_OUT] += 1
+            for out_q in out_qs:
+                await out_q.put(item)
+
+    return publish
+
+
+async def _end_stream(out_qs: List[asyncio.Queue]):
+    for out_q in out_qs:
+        await out_q.put(EOS)
+
+
+async def _run_join(op: JoinOperator, in_qs: List[Tuple[str, asyncio.Queue]], publish: Callable,
+                    metrics: NodeMetrics):
+    # one task per input, so each item is passed to the join as soon as it arrives, until all inputs ended
+    async def consume(input_name: str, in_q: asyncio.Queue):
+        while True:
+            data = await in_q.get()
+            if data is EOS:
+                return
+            metrics.values[NodeMetrics.ITEMS_IN] += 1
+            items = []
+            start = time.perf_counter_ns()
+            op.apply_input(input_name, data, items.append)
+            metrics.record(time.perf_counter_ns() - start)
+            for item in items:
+                await publish(item)
+
+    async def timer():
+        while True:
+            await asyncio.sleep(op.timer_interval)
+            items = []
+            op.on_timer(time.monotonic(), items.append)
+            for item in items:
+                await publish(item)
+
+    timer_task = asyncio.ensure_future(timer())
+    try:
+        await asyncio.gather(*[consume(input_name, in_q) for input_name, in_q in in_qs])
+    finally:
+        timer_task.cancel()
+
+
+async def _get_items(in_qs: List[Tuple[str, asyncio.Queue]]):
+    # same semantics as the parallel environment: one item of each input, a dict keyed by name for multiple inputs
+    if len(in_qs) == 1:
+        return await in_qs[0][1].get()
+    items = dict()
+    for index, (name, in_q) in enumerate(in_qs):
+        item = await in_q.get()
+        if item is EOS:
+            await _discard_inputs(in_qs, index)
+            return EOS
+        items[name] = item
+    return items
+
+
+async def _discard_inputs(in_qs: List[Tuple[str, asyncio.Queue]], ended: int):
+    # once an input ended, the items of the other inputs can't be combined anymore, they are discarded until the
+    # other inputs end as well
+    for index, (name, in_q) in enumerate(in_qs):
+        if index != ended:
+            while await in_q.get() is not EOS:
+                pass
@@ -0,0 +1,1000 @@
+import abc
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import queue
+import threading
+import time
+import weakref
+import zlib
+from collections import deque, namedtuple
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Callable, TYPE_CHECKING
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # pragma: no cover - python < 3.8
+    shared_memory = None
+
+if TYPE_CHECKING:  # pragma: no cover
+    from glimmer.processing.serialization import Serializer
+
+
+class Marker:
+    """Control message that is sent over an edge in between the items.
+    Markers are singletons, which keep their identity when they are pickled, therefore they can be compared with is.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __reduce__(self):
+        # pickled as reference to the module attribute with the same name
+        return self.name
+
+    def __repr__(self):
+        return self.name
+
+
+# tells the consumer to stop immediately
+POISON = Marker('POISON')
+# tells the consumer that the producer finished, it is sent after the last item
+EOS = Marker('EOS')
+# separates the items before a checkpoint from the items after it, see glimmer.processing.checkpoint
+BARRIER = Marker('BARRIER')
+
+
+class Channel(abc.ABC):
+    """Transports items over an edge, from the node that publishes them to the node that consumes them.
+    A channel is created before the nodes are started and has exactly one consumer.
+    """
+    # whether the producer may remove items from the channel, which is needed for the DROP_OLDEST policy
+    supports_eviction: bool = False
+
+    def put(self, item) -> Optional[int]:
+        """Sends the item, blocks in case the channel has no space left
+        :return: the number of bytes the item occupies in the channel, None if unknown
+        """
+        raise NotImplementedError
+
+    def get(self, timeout: float = None):
+        """Receives the next item, blocks until one is available
+        :raises:
+            queue.Empty: in case no item arrived within the timeout
+        """
+        raise NotImplementedError
+
+    def interrupt(self):
+        """Makes the consumer receive POISON once it has consumed the items that are already in the channel
+        """
+        raise NotImplementedError
+
+    def wait_handle(self):
+        """Returns an object that multiprocessing.connection.wait accepts and that becomes ready once an item arrived,
+        so a consumer can wait on multiple channels at once. None in case the channel has none
+        """
+        return None
+
+    def measure_sizes(self):
+        """Called before the nodes start in case the producer bounds the bytes in flight. Channels that do not know the
+        size of an item may serialize the items from now on, so put returns their size
+        """
+        pass
+
+    def close(self):
+        """Releases all resources held by the channel, nodes that are still running must not be affected
+        """
+        pass
+
+
+class QueueChannel(Channel):
+    """Channel based on multiprocessing.Queue, supports any number of producers.
+    Without serializer, the queue pickles the items.
+    """
+    supports_eviction = True
+
+    def __init__(self, serializer: 'Serializer' = None):
+        self.queue = multiprocessing.Queue()
+        self.serializer = serializer
+        # whether put pickles the items instead of the queue, to know their size
+        self.pickled = False
+
+    def measure_sizes(self):
+        self.pickled = self.serializer is None
+
+    def put(self, item):
+        if self.serializer is not None:
+            data = self.serializer.dumps(item)
+        elif self.pickled:
+            data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        else:
+            self.queue.put(item)
+            return None
+        self.queue.put(data)
+        return len(data)
+
+    def get(self, timeout: float = None):
+        item = self.queue.get(timeout=timeout)
+        if type(item) is bytes:
+            if self.serializer is not None:
+                return self.serializer.loads(item)
+            if self.pickled:
+                return pickle.loads(item)
+        return item
+
+    def interrupt(self):
+        self.queue.put(POISON)
+
+    def wait_handle(self):
+        # the receiving end of the pipe the queue feeds the items into
+        return self.queue._reader
+
+
+class LocalChannel(Channel):
+    """Channel for nodes that run as threads of the same process. Items are passed by reference, without any
+    serialization, therefore producer and consumer must not modify an item after it was published.
+    In case the process forks, i.e.: to start an environment in its own process, the child replaces the queues of
+    all local channels with new ones, the queue of the parent is not usable in the child.
+    """
+    supports_eviction = True
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        _local_channels.add(self)
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def get(self, timeout: float = None):
+        return self.queue.get(timeout=timeout)
+
+    def interrupt(self):
+        self.queue.put(POISON)
+
+
+# local channels of this process, see LocalChannel
+_local_channels = weakref.WeakSet()
+
+
+def _reset_local_channels():
+    for channel in list(_local_channels):
+        channel.queue = queue.SimpleQueue()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_local_channels)
+
+
+class RingBufferChannel(Channel):
+    """Single-producer/single-consumer channel based on a ring buffer in shared memory.
+
+    Items are serialized, by default pickled, and written as length-prefixed records. The producer is the only one
+    advancing the head, the consumer is the only one advancing the tail. Records are copied without holding a lock,
+    only publishing or reading the head and tail is done under a shared condition, which orders the copies with the
+    index updates on every platform and lets a blocked producer or consumer wait until it gets notified.
+
+    Works between processes created with fork, as well as between threads. Requires multiprocessing.shared_memory,
+    i.e.: python >= 3.8.
+    """
+    # indices of the counters, which are stored in front of the data
+    _HEAD = 0
+    _TAIL = 1
+    _CLOSED = 2
+    _DATA = 64
+    _WRAP = 0xFFFFFFFF
+
+    def __init__(self, capacity: int = 1 << 20, serializer: 'Serializer' = None):
+        """
+        :param capacity: size of the ring buffer in bytes, an item must fit into it
+        :param serializer: converts items into bytes, defaults to pickle
+        """
+        if shared_memory is None:
+            raise AttributeError('RingBufferChannel requires multiprocessing.shared_memory (python >= 3.8)')
+        self.capacity = capacity
+        self.serializer = serializer
+        self.memory = shared_memory.SharedMemory(create=True, size=self._DATA + capacity)
+        self.buf = self.memory.buf
+        self.counters = self.buf[:self._DATA].cast('Q')
+        self.counters[self._HEAD] = 0
+        self.counters[self._TAIL] = 0
+        self.counters[self._CLOSED] = 0
+        self.data = self.buf[self._DATA:self._DATA + capacity]
+        self.condition = multiprocessing.Condition()
+        self.head = 0
+        self.tail = 0
+
+    def put(self, item):
+        if self.serializer is None:
+            frames = [pickle.dumps(item, pickle.HIGHEST_PROTOCOL)]
+        else:
+            frames = self.serializer.frames(item)
+        length = sum(memoryview(frame).nbytes for frame in frames) if len(frames) > 1 else len(frames[0])
+        size = 4 + length
+        capacity = self.capacity
+        if size > capacity:
+            raise ValueError(f'Item of {size} bytes does not fit into ring buffer of {capacity} bytes')
+
+        head = self.head
+        pos = head % capacity
+        contiguous = capacity - pos
+        needed = size if contiguous >= size else contiguous + size
+
+        counters = self.counters
+        condition = self.condition
+        with condition:
+            if head + needed - counters[self._TAIL] > capacity:
+                condition.wait_for(lambda: head + needed - counters[self._TAIL] <= capacity or counters[self._CLOSED])
+                if counters[self._CLOSED]:
+                    return
+
+        if contiguous < size:
+            # record does not fit in the end of the buffer, mark the rest as unused and start from the beginning
+            if contiguous >= 4:
+                self.data[pos:pos + 4] = self._WRAP.to_bytes(4, 'little')
+            head += contiguous
+            pos = 0
+
+        data = self.data
+        data[pos:pos + 4] = length.to_bytes(4, 'little')
+        pos += 4
+        for frame in frames:
+            end = pos + memoryview(frame).nbytes
+            data[pos:end] = frame
+            pos = end
+        self.head = head + size
+        with condition:
+            counters[self._HEAD] = self.head
+            condition.notify()
+        return size
+
+    def get(self, timeout: float = None):
+        capacity = self.capacity
+        counters = self.counters
+        data = self.data
+        condition = self.condition
+        tail = self.tail
+        with condition:
+            if counters[self._HEAD] == tail:
+                if not condition.wait_for(lambda: counters[self._HEAD] != tail or counters[self._CLOSED], timeout):
+                    raise queue.Empty
+            if counters[self._HEAD] == tail:
+                return POISON
+
+        # everything up to the published head is complete, skip the unused end of the buffer in case it wrapped
+        pos = tail % capacity
+        contiguous = capacity - pos
+        if contiguous < 4 or int.from_bytes(data[pos:pos + 4], 'little') == self._WRAP:
+            tail += contiguous
+            pos = 0
+        length = int.from_bytes(data[pos:pos + 4], 'little')
+
+        record = data[pos + 4:pos + 4 + length]
+        try:
+            item = pickle.loads(record) if self.serializer is None else self.serializer.loads(record)
+        finally:
+            record.release()
+        self.tail = tail + 4 + length
+        with condition:
+            counters[self._TAIL] = self.tail
+            condition.notify()
+        return item
+
+    def interrupt(self):
+        with self.condition:
+            self.counters[self._CLOSED] = 1
+            self.condition.notify_all()
+
+    def close(self):
+        # only remove the name, nodes that still run keep their mapping until they exit
+        try:
+            self.memory.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __del__(self):
+        # views into the shared memory have to be released before it can be unmapped, they do not exist in case
+        # __init__ failed
+        counters = getattr(self, 'counters', None)
+        if counters is not None:
+            counters.release()
+            self.data.release()
+
+
+class _Backoff:
+    """Waits with an exponentially increasing sleep time, used for polling
+    """
+    _SPINS = 0
+    _MAX_SLEEP = 0.0005
+
+    def __init__(self, timeout: float = None):
+        self.spins = 0
+        self.sleep = 0.00001
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+
+    def wait(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise queue.Empty
+        if self.spins < self._SPINS:
+            self.spins += 1
+            time.sleep(0)
+        else:
+            time.sleep(self.sleep)
+            self.sleep = min(self.sleep * 2, self._MAX_SLEEP)
+
+
+class Batch(list):
+    """A list of items that was published as a single message over an edge
+    """
+    pass
+
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+
+
+@dataclass
+class EdgeConfig:
+    """Transport configuration of an edge between two nodes
+    batch_size: number of items that are collected before they are sent as one message, 1 disables batching
+    linger: maximum number of seconds an item waits in an incomplete batch before the batch gets sent
+    capacity: maximum number of items in flight, None means unbounded
+    capacity_bytes: maximum number of bytes in flight, measured in serialized form, None means unbounded
+    policy: what happens to a message that is published while the edge is at its capacity:
+            BLOCK waits until the consumer caught up (backpressure), DROP_OLDEST removes the oldest messages
+            from the edge, DROP_NEWEST discards the published message
+    serializer: converts the messages into bytes, passed to the channel factory, None uses its default
+    """
+    batch_size: int = 1
+    linger: float = 0.005
+    capacity: int = None
+    capacity_bytes: int = None
+    policy: str = BLOCK
+    serializer: 'Serializer' = None
+
+    @property
+    def batching(self) -> bool:
+        return self.batch_size > 1
+
+    @property
+    def bounded(self) -> bool:
+        return self.capacity is not None or self.capacity_bytes is not None
+
+
+class EdgeCounters:
+    """Counters of an edge, shared between producer and consumer. Each counter is written by one side only,
+    therefore no lock is needed.
+    """
+    SENT = 0
+    RECEIVED = 1
+    BLOCKED = 2
+    BLOCKED_TIME = 3
+    DROPPED_OLDEST = 4
+    DROPPED_NEWEST = 5
+    DISCARDED = 6
+    _NAMES = ['sent', 'received', 'blocked', 'blocked_us', 'dropped_oldest', 'dropped_newest', 'discarded']
+
+    def __init__(self):
+        self.values = multiprocessing.RawArray('q', len(self._NAMES))
+
+    @property
+    def in_flight(self) -> int:
+        values = self.values
+        return values[self.SENT] - values[self.RECEIVED] - values[self.DROPPED_OLDEST]
+
+    def snapshot(self) -> Dict[str, int]:
+        snapshot = dict(zip(self._NAMES, self.values))
+        snapshot['in_flight'] = self.in_flight
+        return snapshot
+
+
+class EdgeWriter:
+    """Producer side of an edge.
+    Collects published items into batches and puts them into the channel once the batch is full or the oldest item
+    waited longer than the linger time. Without batching every item is put into the channel directly.
+    In case the edge is bounded, a message is accepted as long as the edge is below its capacity, otherwise the
+    configured policy is applied.
+    """
+
+    def __init__(self, channel: Channel, config: EdgeConfig = None, counters: EdgeCounters = None):
+        config = config or EdgeConfig()
+        if config.policy not in (BLOCK, DROP_OLDEST, DROP_NEWEST):
+            raise AttributeError(f'Unknown edge policy: {config.policy}')
+        if config.bounded and config.policy == DROP_OLDEST and not channel.supports_eviction:
+            raise AttributeError(f'{type(channel).__name__} does not support the policy {DROP_OLDEST}')
+        self.channel = channel
+        self.batch_size = config.batch_size
+        self.linger = config.linger
+        self.capacity = config.capacity
+        self.capacity_bytes = config.capacity_bytes
+        self.policy = config.policy
+        self.bounded = config.bounded
+        self.counters = counters or EdgeCounters()
+        self.values = self.counters.values
+        self.batch = Batch()
+        self.deadline = 0.0
+        self.lock = threading.Lock()
+        self.stop = None
+        # (items, bytes) of each message in flight, only used to track capacity_bytes
+        self.sizes = deque()
+        self.removed = 0
+        self.bytes_in_flight = 0
+        # number of items sent before each marker that may still be in flight, only used by DROP_OLDEST
+        self.markers = deque()
+        if self.capacity_bytes is not None:
+            channel.measure_sizes()
+
+    @property
+    def batching(self) -> bool:
+        return self.batch_size > 1
+
+    def open(self, stop: multiprocessing.Event):
+        """A blocked producer gives up waiting once the stop event is set
+        """
+        self.stop = stop
+
+    def put(self, item):
+        if self.batch_size <= 1:
+            self._publish(item, 1)
+            return
+
+        with self.lock:
+            batch = self.batch
+            batch.append(item)
+            if len(batch) == 1:
+                self.deadline = time.monotonic() + self.linger
+            if len(batch) >= self.batch_size or time.monotonic() >= self.deadline:
+                self._send()
+
+    def flush(self):
+        """Sends the current batch, regardless of its size
+        """
+        with self.lock:
+            self._send()
+
+    def flush_expired(self):
+        """Sends the current batch in case its oldest item exceeded the linger time
+        """
+        with self.lock:
+            if self.batch and time.monotonic() >= self.deadline:
+                self._send()
+
+    def end_stream(self):
+        """Sends the current batch followed by EOS, nothing must be published afterwards
+        """
+        with self.lock:
+            self._send()
+            self._put_marker(EOS)
+
+    def barrier(self):
+        """Sends the current batch followed by BARRIER
+        """
+        with self.lock:
+            self._send()
+            self._put_marker(BARRIER)
+
+    def _put_marker(self, marker: Marker):
+        if self.bounded and self.policy == DROP_OLDEST:
+            self.markers.append(self.values[EdgeCounters.SENT])
+        self.channel.put(marker)
+
+    def _send(self):
+        if self.batch:
+            batch = self.batch
+            self.batch = Batch()
+            self._publish(batch, len(batch))
+
+    def _publish(self, message, items: int):
+        if self.bounded and not self._admit(items):
+            return
+        self.values[EdgeCounters.SENT] += items
+        size = self.channel.put(message)
+        if self.capacity_bytes is not None:
+            if size is None:
+                # the channel passes the message on without serializing it, i.e.: LocalChannel
+                size = len(pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+            self.sizes.append((items, size))
+            self.bytes_in_flight += size
+
+    def _full(self) -> bool:
+        if self.capacity is not None and self.counters.in_flight >= self.capacity:
+            return True
+        if self.capacity_bytes is not None:
+            values = self.values
+            removed = values[EdgeCounters.RECEIVED] + values[EdgeCounters.DROPPED_OLDEST]
+            sizes = self.sizes
+            while sizes and self.removed + sizes[0][0] <= removed:
+                items, size = sizes.popleft()
+                self.removed += items
+                self.bytes_in_flight -= size
+            return self.bytes_in_flight >= self.capacity_bytes
+        return False
+
+    def _admit(self, items: int) -> bool:
+        if not self._full():
+            return True
+
+        values = self.values
+        if self.policy == DROP_NEWEST:
+            values[EdgeCounters.DROPPED_NEWEST] += items
+            return False
+
+        if self.policy == DROP_OLDEST:
+            while self._full():
+                if not self._evict():
+                    # the oldest message can not be removed, the published one is dropped instead
+                    values[EdgeCounters.DROPPED_NEWEST] += items
+                    return False
+            return True
+
+        values[EdgeCounters.BLOCKED] += 1
+        start = time.perf_counter()
+        backoff = _Backoff()
+        try:
+            while self._full():
+                if self.stop is not None and self.stop.is_set():
+                    return False
+                backoff.wait()
+            return True
+        finally:
+            values[EdgeCounters.BLOCKED_TIME] += int((time.perf_counter() - start) * 1e6)
+
+    def _evict(self) -> bool:
+        """Removes the oldest message from the channel, unless it may be a marker. Evicting a marker would send it
+        after the items that were published after it, i.e.: a BARRIER after items that are not part of the checkpoint
+        """
+        values = self.values
+        removed = values[EdgeCounters.RECEIVED] + values[EdgeCounters.DROPPED_OLDEST]
+        markers = self.markers
+        # items after the marker were removed, therefore the marker was received
+        while markers and markers[0] < removed:
+            markers.popleft()
+        if markers and markers[0] == removed:
+            return False
+        try:
+            message = self.channel.get(timeout=0.01)
+        except queue.Empty:
+            return False
+
+        if type(message) is Marker:
+            # i.e.: POISON of an interrupt, the consumer has to receive it nonetheless
+            if message is POISON:
+                self.channel.interrupt()
+            else:
+                self.channel.put(message)
+            return False
+
+        items = len(message) if type(message) is Batch else 1
+        values[EdgeCounters.DROPPED_OLDEST] += items
+        return True
+
+
+class EdgeReader:
+    """Consumer side of an edge. Unpacks received batches and hands out one item at a time.
+    """
+
+    def __init__(self, channel: Channel, counters: EdgeCounters = None):
+        self.channel = channel
+        self.counters = counters or EdgeCounters()
+        self.values = self.counters.values
+        self.pending = deque()
+
+    def get(self, timeout: float = None):
+        """
+        :raises:
+            queue.Empty: in case no item arrived within the timeout
+        """
+        pending = self.pending
+        if pending:
+            return pending.popleft()
+
+        item = self.channel.get(timeout)
+        if type(item) is Batch:
+            self.values[EdgeCounters.RECEIVED] += len(item)
+            pending.extend(item)
+            return pending.popleft()
+        if type(item) is not Marker:
+            self.values[EdgeCounters.RECEIVED] += 1
+        return item
+
+    def get_batch(self, max_items: int, timeout: float = None):
+        """Returns a list of the items that are available, at most max_items, waits until at least one arrived.
+        Returns POISON or EOS in case it arrives before any item, otherwise it is returned by the next call
+        :raises:
+            queue.Empty: in case no item arrived within the timeout
+        """
+        pending = self.pending
+        item = self.get(timeout)
+        if type(item) is Marker:
+            return item
+        items = [item]
+        channel = self.channel
+        while len(items) < max_items:
+            if pending:
+                if type(pending[0]) is Marker:
+                    break
+                items.append(pending.popleft())
+                continue
+            try:
+                item = channel.get(0)
+            except queue.Empty:
+                break
+            if type(item) is Batch:
+                self.values[EdgeCounters.RECEIVED] += len(item)
+                pending.extend(item)
+            elif type(item) is Marker:
+                pending.append(item)
+                break
+            else:
+                self.values[EdgeCounters.RECEIVED] += 1
+                items.append(item)
+        return items
+
+    def wait_handles(self) -> Optional[list]:
+        """See Channel.wait_handle
+        """
+        handle = self.channel.wait_handle()
+        return None if handle is None else [handle]
+
+    def drain(self) -> int:
+        """Discards the items until the end of the stream or POISON
+        :return: number of discarded items
+        """
+        discarded = 0
+        while True:
+            item = self.get()
+            if item is EOS or item is POISON:
+                self.discard(discarded)
+                return discarded
+            if item is not BARRIER:
+                discarded += 1
+
+    def discard(self, items: int):
+        """Records items that were received, but not processed
+        """
+        self.values[EdgeCounters.DISCARDED] += items
+
+
+def partition(key, partitions: int) -> int:
+    """Maps the key to one of the partitions.
+    The key is hashed with crc32 of its canonical encoding, which, unlike hash(), is the same in every process,
+    see _encode_key.
+    """
+    if isinstance(key, str):
+        return zlib.crc32(key.encode()) % partitions
+    if isinstance(key, bytes):
+        return zlib.crc32(key) % partitions
+    return zlib.crc32(_encode_key(key)) % partitions
+
+
+def _encode_key(key) -> bytes:
+    """Encodes a key into bytes that are the same for equal keys in every process. Tuples are encoded element by
+    element, each prefixed with its length. Numbers and None are encoded by their repr, as are all other keys, whose
+    repr has to be the same for equal keys then, i.e.: for dataclasses or enums
+    """
+    if isinstance(key, str):
+        return key.encode()
+    if isinstance(key, (bytes, bytearray)):
+        return bytes(key)
+    if isinstance(key, tuple):
+        parts = [_encode_key(element) for element in key]
+        return b''.join(len(part).to_bytes(4, 'little') + part for part in parts)
+    if isinstance(key, int):
+        # bools are equal to their int values
+        return repr(int(key)).encode()
+    return repr(key).encode()
+
+
+ROUND_ROBIN = 'round-robin'
+LEAST_LOADED = 'least-loaded'
+
+Sequenced = namedtuple('Sequenced', ['seq', 'data'])
+Sequenced.__doc__ = """Envelope that carries the sequence number of an item, used to restore the order of items that were
+processed by multiple instances of a node"""
+
+
+class DistributingWriter:
+    """Producer side of an edge to a node with multiple instances, sends each item to one of the instances.
+    In case the edge is ordered, each item is wrapped into a Sequenced envelope.
+    """
+
+    def __init__(self, writers: List[EdgeWriter], ordered: bool = False):
+        self.writers = writers
+        self.ordered = ordered
+        self.seq = 0
+
+    @property
+    def batching(self) -> bool:
+        return any(writer.batching for writer in self.writers)
+
+    @property
+    def linger(self) -> float:
+        return min(writer.linger for writer in self.writers)
+
+    def open(self, stop: multiprocessing.Event):
+        for writer in self.writers:
+            writer.open(stop)
+
+    def select(self, item) -> EdgeWriter:
+        raise NotImplementedError
+
+    def put(self, item):
+        writer = self.select(item)
+        if self.ordered:
+            writer.put(Sequenced(self.seq, item))
+            self.seq += 1
+        else:
+            writer.put(item)
+
+    def flush(self):
+        for writer in self.writers:
+            writer.flush()
+
+    def flush_expired(self):
+        for writer in self.writers:
+            writer.flush_expired()
+
+    def end_stream(self):
+        for writer in self.writers:
+            writer.end_stream()
+
+    def barrier(self):
+        # every instance takes part in the checkpoint
+        for writer in self.writers:
+            writer.barrier()
+
+
+class PartitionedWriter(DistributingWriter):
+    """Sends each item to the instance that is responsible for the item's key
+    """
+
+    def __init__(self, writers: List[EdgeWriter], key_selector: Callable, ordered: bool = False):
+        super().__init__(writers, ordered)
+        self.key_selector = key_selector
+
+    def select(self, item) -> EdgeWriter:
+        writers = self.writers
+        return writers[partition(self.key_selector(item), len(writers))]
+
+
+class RoundRobinWriter(DistributingWriter):
+    """Sends the items to the instances in turns
+    """
+
+    def __init__(self, writers: List[EdgeWriter], ordered: bool = False):
+        super().__init__(writers, ordered)
+        self.next = 0
+
+    def select(self, item) -> EdgeWriter:
+        writer = self.writers[self.next]
+        self.next = (self.next + 1) % len(self.writers)
+        return writer
+
+
+class LeastLoadedWriter(DistributingWriter):
+    """Sends each item to the instance with the fewest items in flight
+    """
+
+    def select(self, item) -> EdgeWriter:
+        return min(self.writers, key=lambda writer: writer.counters.in_flight)
+
+
+def wait_any(readers: list, timeout: Optional[float]) -> bool:
+    """Blocks until one of the readers may have an item, at most timeout seconds, in case the channels of all readers
+    have a wait handle
+    :return: False in case a channel has no wait handle, the caller has to wait on the readers one by one then
+    """
+    handles = []
+    for reader in readers:
+        reader_handles = reader.wait_handles() if hasattr(reader, 'wait_handles') else None
+        if reader_handles is None:
+            return False
+        handles.extend(reader_handles)
+    if not handles:
+        return False
+    multiprocessing.connection.wait(handles, timeout)
+    return True
+
+
+class MergedReader:
+    """Consumer side of an edge from a node with multiple instances.
+    Hands out the items of all instances as a single stream, in the order they are available.
+    BARRIER is returned once all instances sent it, an instance that sent it is not read until then.
+    """
+    # seconds to block on one instance in case no instance has an item available
+    _WAIT = 0.0005
+
+    def __init__(self, readers: List[EdgeReader]):
+        self.readers = readers
+        self.next = 0
+        # readers that sent BARRIER and wait for the others
+        self.aligned = []
+
+    def get(self, timeout: float = None):
+        """Returns EOS once all instances ended their stream
+        :raises:
+            queue.Empty: in case no item arrived within the timeout
+        """
+        return self._next(lambda reader, wait: reader.get(wait), timeout)
+
+    def get_batch(self, max_items: int, timeout: float = None):
+        """Returns the available items of one instance, see EdgeReader.get_batch
+        """
+        return self._next(lambda reader, wait: reader.get_batch(max_items, wait), timeout)
+
+    def _next(self, read: Callable, timeout: float):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            index, item = self._poll(read)
+            if index is None:
+                index, item = self._wait(read, deadline)
+                if index is None:
+                    continue
+            if item is EOS or item is BARRIER:
+                marker = self._marker(index, item)
+                if marker is not None:
+                    return marker
+                continue
+            return item
+
+    def _poll(self, read: Callable):
+        """Reads the first instance that has an item available, starting after the one that was read last
+        :return: index of the instance and its item, or None twice in case no instance has an item
+        """
+        readers = self.readers
+        n = len(readers)
+        for i in range(n):
+            index = (self.next + i) % n
+            reader = readers[index]
+            if self.aligned and reader in self.aligned:
+                continue
+            try:
+                item = read(reader, 0)
+            except queue.Empty:
+                continue
+            self.next = (index + 1) % n
+            return index, item
+        return None, None
+
+    def _wait(self, read: Callable, deadline: Optional[float]):
+        """Blocks until an instance may have an item, instead of polling all instances. In case not all channels can
+        be waited on at once, blocks on the next instance for a short time. The instance that is waited on moves on
+        with each call, so an item of another instance waits at most one period per instance
+        :raises:
+            queue.Empty: in case the deadline passed
+        """
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise queue.Empty
+        if wait_any(self._unaligned(), remaining):
+            return None, None
+        wait = self._WAIT if remaining is None else min(self._WAIT, remaining)
+        readers = self.readers
+        n = len(readers)
+        index = self.next % n
+        # at least one instance did not send BARRIER, otherwise the barrier would have been returned
+        while self.aligned and readers[index] in self.aligned:
+            index = (index + 1) % n
+        self.next = (index + 1) % n
+        try:
+            return index, read(readers[index], wait)
+        except queue.Empty:
+            return None, None
+
+    def _marker(self, index: int, marker: Marker) -> Optional[Marker]:
+        """Handles EOS or BARRIER of the instance at index
+        :return: the marker once all instances sent it, otherwise None
+        """
+        readers = self.readers
+        if marker is EOS:
+            # the instance finished, the others may still send items
+            del readers[index]
+            if not readers:
+                return EOS
+            self.next = index % len(readers)
+        else:
+            self.aligned.append(readers[index])
+        return BARRIER if self._aligned() else None
+
+    def wait_handles(self) -> Optional[list]:
+        """See Channel.wait_handle, instances that sent BARRIER are not waited on
+        """
+        handles = []
+        for reader in self._unaligned():
+            reader_handles = reader.wait_handles()
+            if reader_handles is None:
+                return None
+            handles.extend(reader_handles)
+        return handles
+
+    def _unaligned(self) -> List[EdgeReader]:
+        return [reader for reader in self.readers if reader not in self.aligned]
+
+    def _aligned(self) -> bool:
+        if self.aligned and len(self.aligned) == len(self.readers):
+            self.aligned.clear()
+            return True
+        return False
+
+    def drain(self) -> int:
+        discarded = 0
+        for reader in self.readers:
+            discarded += reader.drain()
+        self.readers = []
+        return discarded
+
+    def discard(self, items: int):
+        if self.readers:
+            self.readers[0].discard(items)
+
+
+class ReorderingReader:
+    """Consumer side of an ordered edge from a node with multiple instances.
+    Buffers the Sequenced outputs of the instances and hands out their items in the order of the sequence numbers.
+    """
+
+    def __init__(self, reader: MergedReader):
+        self.reader = reader
+        self.next_seq = 0
+        self.buffered = dict()
+        self.ready = deque()
+
+    def get(self, timeout: float = None):
+        """
+        :raises:
+            queue.Empty: in case no item arrived within the timeout
+        """
+        ready = self.ready
+        while not ready:
+            envelope = self.reader.get(timeout)
+            if envelope is BARRIER:
+                # all items before the barrier arrived, the ones that are buffered are released first
+                ready.append(envelope)
+                break
+            if type(envelope) is not Sequenced:
+                return envelope
+            buffered = self.buffered
+            buffered[envelope.seq] = envelope.data
+            while self.next_seq in buffered:
+                ready.extend(buffered.pop(self.next_seq))
+                self.next_seq += 1
+        return ready.popleft()
+
+    def drain(self) -> int:
+        discarded = len(self.ready) + sum(len(data) for data in self.buffered.values())
+        self.ready.clear()
+        self.buffered.clear()
+        self.reader.discard(discarded)
+        return discarded + self.reader.drain()
+
+    def discard(self, items: int):
+        self.reader.discard(items)
+
+
+class LingerFlusher:
+    """Periodically sends batches of the passed writers, whose oldest item exceeded the linger time.
+    This makes sure that items do not get stuck in a batch in case a node stops publishing.
+    """
+
+    def __init__(self, writers: List[EdgeWriter]):
+        self.writers = [writer for writer in writers if writer.batching]
+        self.closed = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if len(self.writers) == 0:
+            return
+        interval = min(writer.linger for writer in self.writers)
+        self.thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self.thread.start()
+
+    def _run(self, interval: float):
+        while not self.closed.wait(interval):
+            for writer in self.writers:
+                writer.flush_expired()
+
+    def close(self):
+        self.closed.set()
+        for writer in self.writers:
+            writer.flush()
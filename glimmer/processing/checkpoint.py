@@ -0,0 +1,279 @@
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import re
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from glimmer.processing import Source
+from glimmer.processing.state import operator_states
+
+# file in the checkpoint directory that contains the id of the latest complete checkpoint
+LATEST = 'LATEST'
+# acknowledgement of a task that finished, it takes part in no further checkpoint
+FINISHED = (1 << 62)
+
+# name under which the position of a source is saved, next to the keyed states
+POSITION = '__position__'
+
+_FILE = re.compile(r'^(\d+)\.(delta|full)$')
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as fd:
+        fd.write(data)
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.replace(tmp, path)
+
+
+class Checkpointing:
+    """Checkpoint settings of an environment, checkpoints contain the keyed states of all operators
+    (see Operator.keyed_state) and the positions of the sources (see Source.position).
+    Every interval seconds the sources send a BARRIER between their items, which moves through the topology like an
+    item. A task that received the barrier on all of its inputs snapshots the changes of its states since the last
+    barrier and passes the barrier on, the snapshot is written to disk in the background. A checkpoint is complete
+    once all tasks wrote their snapshot, its id is then recorded in the LATEST file of the directory.
+    Every full_every checkpoints the snapshots of a task are compacted into a full snapshot, also in the background.
+    Once the environment is started again, each task restores its states from the latest complete checkpoint when it
+    is opened, and each source continues at its position. Sources without a position read their input again, so the
+    restored states would count their items twice. The topology, including the parallelism of the nodes, must be
+    the same.
+    """
+
+    def __init__(self, directory: str = 'checkpoints', interval: float = 10.0, full_every: int = 10,
+                 restore: bool = True):
+        """
+        :param directory: directory the checkpoints are written to, one sub directory per task
+        :param interval: seconds between two checkpoints
+        :param full_every: number of checkpoints after which the snapshots of a task are compacted
+        :param restore: whether the states are restored from the latest complete checkpoint, otherwise the existing
+                        checkpoints are replaced
+        """
+        if interval <= 0:
+            raise AttributeError(f'Checkpoint interval must be positive, was: {interval}')
+        if full_every < 1:
+            raise AttributeError(f'Checkpoints between full snapshots must be at least 1, was: {full_every}')
+        self.directory = directory
+        self.interval = interval
+        self.full_every = full_every
+        self.restore = restore
+        self.logger = logging.getLogger(__name__)
+        # id of the latest complete checkpoint
+        self.latest = 0
+        # id of the latest checkpoint the environment triggered
+        self.requested = multiprocessing.RawValue('q', 0)
+        # id of the latest checkpoint each task wrote, keyed by task name
+        self.acks: Dict[str, multiprocessing.RawValue] = dict()
+
+    def prepare(self, task_names: List[str]):
+        """Reads the latest complete checkpoint and removes the snapshots of incomplete ones, has to be called before
+        the tasks are started
+        """
+        self.latest = self._read_latest() if self.restore else 0
+        self.requested.value = self.latest
+        self.acks = {name: multiprocessing.RawValue('q', self.latest) for name in task_names}
+        if not os.path.isdir(self.directory):
+            return
+        if not self.restore and os.path.exists(os.path.join(self.directory, LATEST)):
+            os.remove(os.path.join(self.directory, LATEST))
+        for task_dir in os.listdir(self.directory):
+            path = os.path.join(self.directory, task_dir)
+            if not os.path.isdir(path):
+                continue
+            for file_name in os.listdir(path):
+                match = _FILE.match(file_name)
+                if match is not None and int(match.group(1)) > self.latest:
+                    os.remove(os.path.join(path, file_name))
+
+    def _read_latest(self) -> int:
+        try:
+            with open(os.path.join(self.directory, LATEST)) as fd:
+                return int(fd.read().strip())
+        except FileNotFoundError:
+            return 0
+
+    def checkpointer(self, task_name: str) -> 'TaskCheckpointer':
+        return TaskCheckpointer(task_name, self, self.acks[task_name])
+
+    def coordinate(self, stop: multiprocessing.Event):
+        """Triggers a checkpoint every interval seconds until stop is set, the next one is only triggered once the
+        previous one is complete
+        """
+        next_trigger = time.monotonic() + self.interval
+        while not stop.wait(min(self.interval, 0.05)):
+            self.complete()
+            now = time.monotonic()
+            if now >= next_trigger and self.requested.value == self.latest:
+                self.requested.value += 1
+                next_trigger = now + self.interval
+        self.complete()
+
+    def complete(self) -> int:
+        """Records the latest checkpoint all tasks acknowledged
+        :return: id of the latest complete checkpoint
+        """
+        acked = min([ack.value for ack in self.acks.values()] + [self.requested.value])
+        if acked > self.latest:
+            os.makedirs(self.directory, exist_ok=True)
+            _write_atomic(os.path.join(self.directory, LATEST), str(acked).encode('utf-8'))
+            self.latest = acked
+            self.logger.info(f'Completed checkpoint {acked}')
+        return self.latest
+
+
+class TaskCheckpointer:
+    """Writes the snapshots of the keyed states of a single task, i.e.: the instance of an operator, and restores them.
+    The snapshots of sources contain their position instead.
+    Each snapshot is a file <checkpoint id>.delta with the changed and deleted keys of each state, compacted
+    snapshots are files <checkpoint id>.full with all keys.
+    """
+
+    def __init__(self, task_name: str, checkpointing: Checkpointing, ack: multiprocessing.RawValue):
+        self.task_name = task_name
+        self.checkpointing = checkpointing
+        self.ack = ack
+        # id of the last barrier the task received
+        self.checkpoint_id = checkpointing.latest
+        self.logger = logging.getLogger(__name__)
+        self.queue = None
+        self.thread = None
+        self.failed = False
+        # position of the source at the last barrier
+        self.position = None
+
+    @property
+    def directory(self) -> str:
+        task_dir = re.sub(r'[^\w.-]+', '_', self.task_name).strip('_')
+        return os.path.join(self.checkpointing.directory, task_dir)
+
+    @property
+    def triggered(self) -> bool:
+        """Whether the environment requested a checkpoint the task did not take part in yet, used by sources
+        """
+        return self.checkpointing.requested.value > self.checkpoint_id
+
+    def restore(self, node) -> int:
+        """Restores the keyed states of the node, or the position of a source, from the latest complete checkpoint and
+        starts tracking their changes
+        :return: number of restored keys
+        """
+        states = operator_states(node)
+        restored = 0
+        if (states or isinstance(node, Source)) and self.checkpoint_id > 0:
+            for name, entries in self.load(self.checkpoint_id).items():
+                if name == POSITION:
+                    self.position = entries[None]
+                    node.restore(self.position)
+                    self.logger.info(f'Restored position {self.position} of {self.task_name}')
+                    continue
+                state = states.get(name)
+                if state is None:
+                    self.logger.warning(f'Checkpoint of {self.task_name} contains unknown state {name}')
+                    continue
+                state.restore(entries)
+                restored += len(entries)
+            self.logger.info(f'Restored {restored} keys of {self.task_name} from checkpoint {self.checkpoint_id}')
+        for state in states.values():
+            state.track_changes()
+        return restored
+
+    def barrier(self, node=None):
+        """Takes the snapshot of the node once the barrier arrived on all of its inputs. Only the changes of the states
+        are collected and pickled, writing them to disk happens in the background
+        """
+        self.checkpoint_id += 1
+        states = operator_states(node) if node is not None else None
+        delta = {name: state.delta() for name, state in states.items()} if states else dict()
+        position = node.position() if isinstance(node, Source) else None
+        if position is not None and position != self.position:
+            delta[POSITION] = ({None: position}, ())
+            self.position = position
+        if not delta and self.thread is None:
+            if not self.failed:
+                self.ack.value = self.checkpoint_id
+            return
+        if self.thread is None:
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self._write, name=f'checkpoint-{self.task_name}', daemon=True)
+            self.thread.start()
+        changed = any(entries or deleted for entries, deleted in delta.values())
+        self.queue.put((self.checkpoint_id, pickle.dumps(delta, pickle.HIGHEST_PROTOCOL) if changed else None))
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                return
+            checkpoint_id, payload = entry
+            if self.failed:
+                continue
+            try:
+                # checkpoints without changes have no delta
+                if payload is not None:
+                    _write_atomic(os.path.join(self.directory, f'{checkpoint_id}.delta'), payload)
+                if checkpoint_id % self.checkpointing.full_every == 0:
+                    self._compact(checkpoint_id)
+            except Exception:
+                # later checkpoints would miss the changes of this one, so none of them can complete
+                self.logger.exception(f'Writing checkpoint {checkpoint_id} of {self.task_name} failed')
+                self.failed = True
+                continue
+            self.ack.value = checkpoint_id
+
+    def _files(self) -> List[Tuple[int, str]]:
+        if not os.path.isdir(self.directory):
+            return []
+        files = []
+        for file_name in os.listdir(self.directory):
+            match = _FILE.match(file_name)
+            if match is not None:
+                files.append((int(match.group(1)), match.group(2)))
+        return sorted(files)
+
+    def _read(self, checkpoint_id: int, kind: str):
+        with open(os.path.join(self.directory, f'{checkpoint_id}.{kind}'), 'rb') as fd:
+            return pickle.load(fd)
+
+    def load(self, checkpoint_id: int) -> Dict[str, Dict]:
+        """Returns the entries of each state at the passed checkpoint: the latest full snapshot up to the checkpoint
+        with the deltas after it applied
+        """
+        files = [(i, kind) for i, kind in self._files() if i <= checkpoint_id]
+        fulls = [i for i, kind in files if kind == 'full']
+        base = max(fulls) if fulls else 0
+        states = self._read(base, 'full') if fulls else dict()
+        for i, kind in files:
+            if kind != 'delta' or i <= base:
+                continue
+            for name, (entries, deleted) in self._read(i, kind).items():
+                state = states.setdefault(name, dict())
+                state.update(entries)
+                for key in deleted:
+                    state.pop(key, None)
+        return states
+
+    def _compact(self, checkpoint_id: int):
+        previous = [i for i, kind in self._files() if kind == 'full' and i < checkpoint_id]
+        states = self.load(checkpoint_id)
+        _write_atomic(os.path.join(self.directory, f'{checkpoint_id}.full'),
+                      pickle.dumps(states, pickle.HIGHEST_PROTOCOL))
+        # the previous full snapshot and the deltas after it are kept, the latest complete checkpoint may lag behind
+        if previous:
+            for i, kind in self._files():
+                if i < previous[-1] or (i == previous[-1] and kind == 'delta'):
+                    os.remove(os.path.join(self.directory, f'{i}.{kind}'))
+
+    def close(self):
+        """Writes the remaining snapshots, afterwards the task does not take part in further checkpoints
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        self.ack.value = FINISHED
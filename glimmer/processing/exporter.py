@@ -0,0 +1,178 @@
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+from glimmer.processing import Environment
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# metric families of the nodes: (key in the metrics snapshot, name, type, help)
+_NODE_FAMILIES = [
+    ('items_in', 'glimmer_node_items_in', 'counter', 'Items the node received'),
+    ('items_out', 'glimmer_node_items_out', 'counter', 'Items the node emitted'),
+    ('busy_s', 'glimmer_node_busy_seconds', 'counter', 'Time the node spent in read, apply or write'),
+    ('wait_s', 'glimmer_node_wait_seconds', 'counter', 'Time the node waited for input'),
+    ('utilization', 'glimmer_node_utilization', 'gauge', 'Share of the runtime the node was busy'),
+]
+
+# metric families of the edges, all other counters of an edge are exported as glimmer_edge_<counter>
+_EDGE_FAMILIES = {
+    'in_flight': ('glimmer_edge_in_flight', 'gauge', 'Items sent but not yet received'),
+    'blocked_us': ('glimmer_edge_blocked_seconds', 'counter', 'Time the producer was blocked by a full edge'),
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _family(lines: List[str], name: str, metric_type: str, description: str):
+    lines.append(f'# TYPE {name} {metric_type}')
+    lines.append(f'# HELP {name} {description}.')
+
+
+def _render_nodes(lines: List[str], nodes: Dict[str, dict]):
+    for key, name, metric_type, description in _NODE_FAMILIES:
+        _family(lines, name, metric_type, description)
+        suffix = '_total' if metric_type == 'counter' else ''
+        for node, snapshot in nodes.items():
+            lines.append(f'{name}{suffix}{_labels(node=node)} {snapshot[key]}')
+
+    name = 'glimmer_node_latency_seconds'
+    _family(lines, name, 'histogram', 'Duration of the calls of read, apply or write')
+    for node, snapshot in nodes.items():
+        cumulative = 0
+        # the last bucket has no upper bound
+        for bucket, count in enumerate(snapshot['latency_histogram'][:-1]):
+            cumulative += count
+            le = (1 << (bucket + 10)) / 1e9
+            lines.append(f'{name}_bucket{_labels(node=node, le=repr(le))} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(node=node, le="+Inf")} {snapshot["calls"]}')
+        lines.append(f'{name}_count{_labels(node=node)} {snapshot["calls"]}')
+        lines.append(f'{name}_sum{_labels(node=node)} {snapshot["busy_s"]}')
+
+
+def _render_edges(lines: List[str], edges: Dict[Tuple[str, str], dict]):
+    keys = []
+    for stats in edges.values():
+        keys.extend(key for key in stats.keys() if key not in keys)
+    for key in keys:
+        name, metric_type, description = _EDGE_FAMILIES.get(
+            key, (f'glimmer_edge_{key}', 'counter', f'Counter {key} of the edge'))
+        _family(lines, name, metric_type, description)
+        suffix = '_total' if metric_type == 'counter' else ''
+        for (upstream, downstream), stats in edges.items():
+            if key not in stats:
+                continue
+            value = stats[key] / 1e6 if key == 'blocked_us' else stats[key]
+            lines.append(f'{name}{suffix}{_labels(source=upstream, target=downstream)} {value}')
+
+
+# metric families of the keyed states, all other counters of a state are exported as glimmer_state_<counter>_total
+_STATE_FAMILIES = {
+    'in_memory': ('glimmer_state_in_memory', 'gauge', 'Keys kept in memory'),
+    'on_disk': ('glimmer_state_on_disk', 'gauge', 'Keys spilled to disk'),
+    'hit_ratio': ('glimmer_state_hit_ratio', 'gauge', 'Share of the lookups of existing keys served from memory'),
+}
+
+
+def _render_states(lines: List[str], states: Dict[str, Dict[str, dict]]):
+    keys = []
+    for node_states in states.values():
+        for stats in node_states.values():
+            keys.extend(key for key in stats.keys() if key not in keys)
+    for key in keys:
+        name, metric_type, description = _STATE_FAMILIES.get(
+            key, (f'glimmer_state_{key}', 'counter', f'Counter {key} of the keyed state'))
+        _family(lines, name, metric_type, description)
+        suffix = '_total' if metric_type == 'counter' else ''
+        for node, node_states in states.items():
+            for state, stats in node_states.items():
+                lines.append(f'{name}{suffix}{_labels(node=node, state=state)} {stats[key]}')
+
+
+def render(metrics: Dict[str, dict]) -> str:
+    """Renders the metrics of an environment, as returned by Environment.metrics, in OpenMetrics text format
+    """
+    lines = []
+    _render_nodes(lines, metrics['nodes'])
+    _render_edges(lines, metrics['edges'])
+    _render_states(lines, metrics.get('states', {}))
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """Serves the metrics of an environment over HTTP in OpenMetrics text format, i.e.: for Prometheus.
+    The server runs in a daemon thread of the process that created the environment. Metrics of nodes that run in
+    other processes are read from shared memory, without locks, so a scrape never blocks the nodes.
+    """
+
+    def __init__(self, env: Environment, port: int = 9464, host: str = '127.0.0.1', path: str = '/metrics'):
+        """
+        :param env: environment whose metrics are served
+        :param port: port to listen on, 0 picks a free port
+        :param host: address to listen on
+        :param path: path the metrics are served at
+        """
+        self.env = env
+        self.host = host
+        self.port = port
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.server = None
+        self.thread = None
+        self.pid = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] != exporter.path:
+                    self.send_error(404)
+                    return
+                try:
+                    body = render(exporter.env.metrics()).encode('utf-8')
+                except Exception as e:
+                    exporter.logger.exception('Collecting metrics failed')
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                exporter.logger.debug(format, *args)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-exporter', daemon=True)
+        self.thread.start()
+        self.logger.info(f'Serving metrics at http://{self.host}:{self.port}{self.path}')
+
+    def close(self):
+        # a forked copy of the exporter does not run the server
+        if self.thread is None or self.pid != os.getpid():
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.thread = None
@@ -1,10 +1,15 @@
 import logging
 import multiprocessing
 import threading
-from typing import List
+from typing import List, Dict, Tuple, Callable
 
 from glimmer.processing import Source, Sink, Operator, Executable
+from glimmer.processing.asynchronous import AsyncEnvironment, mk_async_topology
+from glimmer.processing.channel import EdgeConfig, Channel, QueueChannel, RingBufferChannel, LocalChannel, shared_memory
+from glimmer.processing.checkpoint import Checkpointing
 from glimmer.processing.parallel import ParallelEnvironment, mk_parallel_topology
+from glimmer.processing.profiling import Profiling
+from glimmer.processing.serialization import Serializer
 from glimmer.processing.sync import SynchronousEnvironment, mk_synchronous_topology
 from glimmer.util import generate_node_name
 
@@ -60,6 +65,9 @@ def process_factory():
             def join(self, timeout):
                 process.join(timeout)
 
+            def is_alive(self):
+                return process.is_alive()
+
         return ProcessExecutable()
 
     return factory
@@ -77,19 +85,106 @@ def thread_factory():
             def join(self, timeout):
                 thread.join(timeout)
 
+            def is_alive(self):
+                return thread.is_alive()
+
         return ThreadExecutable()
 
+    # all nodes share the memory of one process, which allows edges to pass items by reference
+    factory.in_process = True
+    return factory
+
+
+def queue_channel(serializer: Serializer = None) -> Callable[..., Channel]:
+    """
+    Channels based on multiprocessing.Queue
+    :param serializer: converts the items into bytes, by default the queue pickles them
+    """
+
+    def factory(edge_serializer: Serializer = None):
+        return QueueChannel(edge_serializer or serializer)
+
     return factory
 
 
-def mk_parallel_env(sources: List[Source], logger: logging.Logger = None, task_factory=None) -> ParallelEnvironment:
+def ring_buffer_channel(capacity: int = 1 << 20, serializer: Serializer = None) -> Callable[..., Channel]:
+    """
+    Channels based on a single-producer/single-consumer ring buffer in shared memory, requires python >= 3.8
+    :param capacity: size of each ring buffer in bytes
+    :param serializer: converts the items into bytes, defaults to pickle
+    """
+    if shared_memory is None:
+        raise AttributeError('Ring buffer channels require multiprocessing.shared_memory (python >= 3.8)')
+
+    def factory(edge_serializer: Serializer = None):
+        return RingBufferChannel(capacity, edge_serializer or serializer)
+
+    return factory
+
+
+def local_channel() -> Callable[..., Channel]:
+    """
+    Channels that pass items by reference, without serialization. Only usable in case all nodes run as threads,
+    i.e.: with thread_factory()
+    """
+
+    def factory(edge_serializer: Serializer = None):
+        return LocalChannel()
+
+    return factory
+
+
+def mk_parallel_env(sources: List[Source], logger: logging.Logger = None, task_factory=None,
+                    edge_config: EdgeConfig = None,
+                    edge_configs: Dict[Tuple[str, str], EdgeConfig] = None,
+                    fuse: bool = False,
+                    channel_factory: Callable[[], Channel] = None,
+                    in_process: bool = None,
+                    drain: bool = False,
+                    shutdown_timeout: float = None,
+                    metrics_port: int = None,
+                    profiling: Profiling = None,
+                    checkpointing: Checkpointing = None) -> ParallelEnvironment:
+    """
+    Creates a parallel environment for the topology reachable from the passed sources.
+    :param edge_config: transport configuration (i.e.: batching) used for all edges
+    :param edge_configs: transport configuration for single edges, keyed by (upstream name, downstream name)
+    :param fuse: run chains of operators, which are connected by a single edge, as one task
+    :param channel_factory: creates the channels of the edges, i.e.: queue_channel(), ring_buffer_channel() or
+                            local_channel()
+    :param in_process: whether all nodes run in the same process, detected from the task factory in case it is None.
+                       In case no channel_factory is passed, nodes in the same process exchange items over
+                       local channels, otherwise over queue channels
+    :param drain: let the nodes finish the items in flight when the environment is stopped
+    :param shutdown_timeout: seconds to wait for the nodes to drain
+    :param metrics_port: serve the metrics in OpenMetrics text format on this port, i.e.: for Prometheus
+    :param profiling: profile the read, apply or write calls of the selected nodes
+    :param checkpointing: checkpoint the keyed states of the operators and restore them on restart
+    """
     if task_factory is None:
         task_factory = process_factory()
+    if in_process is None:
+        in_process = getattr(task_factory, 'in_process', False)
+    if channel_factory is None:
+        channel_factory = local_channel() if in_process else queue_channel()
 
-    top = mk_parallel_topology(sources)
-    return ParallelEnvironment(top, task_factory, logger)
+    top = mk_parallel_topology(sources, edge_config=edge_config, edge_configs=edge_configs, fuse=fuse,
+                               channel_factory=channel_factory)
+    return ParallelEnvironment(top, task_factory, logger, drain=drain, shutdown_timeout=shutdown_timeout,
+                               metrics_port=metrics_port, profiling=profiling, checkpointing=checkpointing)
 
 
-def mk_synchronous_env(source: Source, logger: logging.Logger = None, skip_none: bool = None) -> SynchronousEnvironment:
+def mk_synchronous_env(source: Source, logger: logging.Logger = None, skip_none: bool = None,
+                       metrics_port: int = None) -> SynchronousEnvironment:
     top = mk_synchronous_topology(source)
-    return SynchronousEnvironment(top, logger, skip_none)
+    return SynchronousEnvironment(top, logger, skip_none, metrics_port=metrics_port)
+
+
+def mk_async_env(sources: List[Source], logger: logging.Logger = None, capacity: int = 0,
+                 max_workers: int = None, offload: bool = True) -> AsyncEnvironment:
+    """
+    Creates an environment that runs the topology reachable from the passed sources on one event loop.
+    See AsyncEnvironment for the arguments.
+    """
+    top = mk_async_topology(sources)
+    return AsyncEnvironment(top, logger, capacity=capacity, max_workers=max_workers, offload=offload)
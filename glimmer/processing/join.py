@@ -0,0 +1,248 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Union, Optional
+
+from glimmer.processing import Operator
+from glimmer.util.context import Context
+
+
+class JoinOperator(Operator):
+    """Operator that combines the items of multiple inputs.
+    Unlike other operators with multiple inputs, which receive one item of each input at a time, a join receives
+    the items of all inputs as they arrive, together with the name of the input they came from.
+    Environments call on_timer regularly, which allows joins to give up on inputs that stalled.
+    """
+    # a join keeps its state per input, therefore it is always executed in its own task
+    chainable = False
+    # seconds between two calls of on_timer
+    timer_interval: float = 0.1
+
+    def __init__(self, name: str = None, timeout: Union[float, Dict[str, float]] = None, ctx: Context = None):
+        """
+        :param name: name of the node
+        :param timeout: seconds after which an input, or the state that waits for it, is considered stalled.
+                        Either one value for all inputs or a value per input name, None waits forever
+        """
+        if name is not None:
+            self.name = name
+        super().__init__(ctx)
+        self.timeout = timeout
+
+    def input_timeout(self, input_name: str) -> Optional[float]:
+        if isinstance(self.timeout, dict):
+            return self.timeout.get(input_name)
+        return self.timeout
+
+    def apply(self, data: dict, out: Callable):
+        # environments that don't support joins pass one item of each input
+        for input_name, item in data.items():
+            self.apply_input(input_name, item, out)
+
+    def apply_input(self, input_name: str, data, out: Callable):
+        """Consumes an item of the input with the passed name
+        """
+        raise NotImplementedError
+
+    def on_timer(self, now: float, out: Callable):
+        """Called regularly, also in case no input sends any items
+        :param now: time.monotonic()
+        """
+        pass
+
+    def on_end(self, out: Callable):
+        """Called once all inputs ended their stream, i.e.: while the environment drains
+        """
+        pass
+
+
+class KeyedJoin(JoinOperator):
+    """Equi-join that emits a dict with one item of each input, keyed by input name, as soon as all inputs sent an
+    item with the same key.
+    At most max_pending keys wait for their missing items, the oldest one is evicted once the limit is exceeded.
+    A key is evicted as well once it waited longer than the timeout of a missing input.
+    In case emit_partial is set, evicted keys are emitted, missing inputs are None, otherwise they are dropped.
+    """
+
+    def __init__(self, name: str = None, key_selector: Union[Callable, Dict[str, Callable]] = None,
+                 timeout: Union[float, Dict[str, float]] = None, max_pending: int = 10000,
+                 emit_partial: bool = False, ctx: Context = None):
+        """
+        :param key_selector: returns the key of an item, either one function for all inputs or one per input name,
+                             None uses the item itself as key
+        """
+        super().__init__(name, timeout, ctx)
+        # not stored as key_selector, which partitions the inputs of a node, see Node.key_by
+        self.join_key_selector = key_selector
+        self.max_pending = max_pending
+        self.emit_partial = emit_partial
+        # key -> (time the first item arrived, items keyed by input name), ordered by arrival
+        self.pending = OrderedDict()
+        self.evicted = 0
+
+    def join_key(self, input_name: str, data):
+        selector = self.join_key_selector
+        if isinstance(selector, dict):
+            selector = selector[input_name]
+        return data if selector is None else selector(data)
+
+    def apply_input(self, input_name: str, data, out: Callable):
+        key = self.join_key(input_name, data)
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = (time.monotonic(), dict())
+            self.pending[key] = entry
+        items = entry[1]
+        items[input_name] = data
+        if len(items) == len(self.inputs):
+            del self.pending[key]
+            out(items)
+        elif len(self.pending) > self.max_pending:
+            self._evict(next(iter(self.pending)), out)
+
+    def on_timer(self, now: float, out: Callable):
+        expired = []
+        for key, (arrived, items) in self.pending.items():
+            if self._expired(now - arrived, items):
+                expired.append(key)
+        for key in expired:
+            self._evict(key, out)
+
+    def _expired(self, waited: float, items: dict) -> bool:
+        for input_name in self.inputs.keys():
+            if input_name not in items:
+                timeout = self.input_timeout(input_name)
+                if timeout is not None and waited >= timeout:
+                    return True
+        return False
+
+    def on_end(self, out: Callable):
+        for key in list(self.pending.keys()):
+            self._evict(key, out)
+
+    def _evict(self, key, out: Callable):
+        _, items = self.pending.pop(key)
+        self.evicted += 1
+        if self.emit_partial:
+            out({input_name: items.get(input_name) for input_name in self.inputs.keys()})
+
+
+class WindowedJoin(JoinOperator):
+    """Collects the items of all inputs in tumbling windows and emits a dict of lists, keyed by input name,
+    for each window and key.
+    With a time_selector the windows are based on the time of the items (event time), a window is closed once
+    all inputs sent an item that is later than the end of the window. Inputs that did not send any item within
+    their timeout are not waited for. Without time_selector the windows are based on the time the items arrived.
+    """
+
+    def __init__(self, name: str = None, size: float = 1.0, key_selector: Union[Callable, Dict[str, Callable]] = None,
+                 time_selector: Union[Callable, Dict[str, Callable]] = None,
+                 timeout: Union[float, Dict[str, float]] = None, ctx: Context = None):
+        """
+        :param size: length of a window in seconds
+        :param key_selector: returns the key of an item, None puts all items of a window into the same group
+        :param time_selector: returns the time of an item in seconds
+        """
+        super().__init__(name, timeout, ctx)
+        self.size = size
+        self.join_key_selector = key_selector
+        self.time_selector = time_selector
+        # window start -> key -> input name -> items
+        self.windows = dict()
+        # input name -> latest item time
+        self.progress = dict()
+        # input name -> time.monotonic() of the last item
+        self.last_seen = dict()
+        self.started = time.monotonic()
+        # end of the last emitted window
+        self.emitted = float('-inf')
+
+    def open(self):
+        self.started = time.monotonic()
+
+    def _select(self, selector, input_name: str, data):
+        if isinstance(selector, dict):
+            selector = selector[input_name]
+        return selector(data)
+
+    def apply_input(self, input_name: str, data, out: Callable):
+        now = time.monotonic()
+        self.last_seen[input_name] = now
+        if self.time_selector is None:
+            item_time = now
+        else:
+            item_time = self._select(self.time_selector, input_name, data)
+            self.progress[input_name] = max(item_time, self.progress.get(input_name, item_time))
+        key = None if self.join_key_selector is None else self._select(self.join_key_selector, input_name, data)
+
+        start = item_time - item_time % self.size
+        if start + self.size <= self.emitted:
+            # the window was already emitted
+            self.logger.debug(f'Dropped late item of {input_name}: {data}')
+            return
+        groups = self.windows.setdefault(start, dict())
+        group = groups.get(key)
+        if group is None:
+            group = {name: [] for name in self.inputs.keys()}
+            groups[key] = group
+        group[input_name].append(data)
+        self._emit_closed(now, out)
+
+    def on_timer(self, now: float, out: Callable):
+        self._emit_closed(now, out)
+
+    def _watermark(self, now: float) -> float:
+        if self.time_selector is None:
+            return now
+        times = []
+        for input_name in self.inputs.keys():
+            timeout = self.input_timeout(input_name)
+            idle = now - self.last_seen.get(input_name, self.started)
+            if timeout is not None and idle >= timeout:
+                # stalled input
+                continue
+            if input_name not in self.progress:
+                return float('-inf')
+            times.append(self.progress[input_name])
+        if not times:
+            return max(self.progress.values(), default=float('-inf'))
+        return min(times)
+
+    def on_end(self, out: Callable):
+        for start in sorted(self.windows.keys()):
+            self.emitted = start + self.size
+            for group in self.windows.pop(start).values():
+                out(group)
+
+    def _emit_closed(self, now: float, out: Callable):
+        watermark = self._watermark(now)
+        for start in sorted(self.windows.keys()):
+            if start + self.size > watermark:
+                break
+            self.emitted = start + self.size
+            for group in self.windows.pop(start).values():
+                out(group)
+
+
+class LatestJoin(JoinOperator):
+    """Emits a dict with the latest item of each input, keyed by input name, whenever an input sends an item.
+    Nothing is emitted until all inputs sent an item, except for inputs that did not send any item within their
+    timeout, which are None instead.
+    """
+
+    def __init__(self, name: str = None, timeout: Union[float, Dict[str, float]] = None, ctx: Context = None):
+        super().__init__(name, timeout, ctx)
+        self.latest = dict()
+        self.started = time.monotonic()
+
+    def open(self):
+        self.started = time.monotonic()
+
+    def apply_input(self, input_name: str, data, out: Callable):
+        self.latest[input_name] = data
+        waited = time.monotonic() - self.started
+        for name in self.inputs.keys():
+            if name not in self.latest:
+                timeout = self.input_timeout(name)
+                if timeout is None or waited < timeout:
+                    return
+        out({name: self.latest.get(name) for name in self.inputs.keys()})
@@ -0,0 +1,73 @@
+import multiprocessing
+import time
+from typing import Dict, List
+
+
+class NodeMetrics:
+    """Metrics of a node, kept in shared memory so they can be read from any process.
+    Each node is the only writer of its metrics, therefore no lock is needed.
+
+    The latency histogram has exponential buckets: bucket 0 counts calls that took less than 1 microsecond (2^10 ns),
+    bucket i counts calls that took between 2^(i+9) and 2^(i+10) ns, the last bucket counts all longer calls.
+    """
+    ITEMS_IN = 0
+    ITEMS_OUT = 1
+    BUSY = 2
+    WAIT = 3
+    STARTED = 4
+    _HISTOGRAM = 5
+    BUCKETS = 24
+
+    def __init__(self):
+        self.values = multiprocessing.RawArray('q', self._HISTOGRAM + self.BUCKETS)
+
+    def start(self):
+        self.values[self.STARTED] = time.monotonic_ns()
+
+    def record(self, elapsed_ns: int):
+        """Records the time a single call of read, apply or write took
+        """
+        values = self.values
+        values[self.BUSY] += elapsed_ns
+        bucket = (elapsed_ns >> 10).bit_length()
+        if bucket >= self.BUCKETS:
+            bucket = self.BUCKETS - 1
+        values[self._HISTOGRAM + bucket] += 1
+
+    @property
+    def histogram(self) -> List[int]:
+        return list(self.values[self._HISTOGRAM:])
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket that contains the p-th percentile, in microseconds
+        """
+        histogram = self.histogram
+        count = sum(histogram)
+        if count == 0:
+            return 0.0
+        threshold = count * p / 100
+        seen = 0
+        for bucket, n in enumerate(histogram):
+            seen += n
+            if seen >= threshold:
+                return float(1 << bucket) * 1.024
+        return float('inf')
+
+    def snapshot(self) -> Dict[str, float]:
+        values = self.values
+        calls = sum(self.histogram)
+        busy = values[self.BUSY] / 1e9
+        started = values[self.STARTED]
+        elapsed = (time.monotonic_ns() - started) / 1e9 if started else 0.0
+        return {
+            'items_in': values[self.ITEMS_IN],
+            'items_out': values[self.ITEMS_OUT],
+            'busy_s': busy,
+            'wait_s': values[self.WAIT] / 1e9,
+            'utilization': busy / elapsed if elapsed > 0 else 0.0,
+            'calls': calls,
+            'latency_mean_us': busy * 1e6 / calls if calls else 0.0,
+            'latency_p50_us': self.percentile(50),
+            'latency_p99_us': self.percentile(99),
+            'latency_histogram': self.histogram,
+        }
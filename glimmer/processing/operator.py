@@ -1,9 +1,8 @@
-import json
-from json import JSONDecodeError
 from typing import Callable
 
 from glimmer.processing import Operator, In, Out
-from glimmer.util import EnhancedJSONEncoder
+from glimmer.processing.serialization import JsonEncoder
+from glimmer.util.context import Context
 
 
 class LogOperator(Operator[In, Out]):
@@ -15,11 +14,21 @@ class LogOperator(Operator[In, Out]):
 
 
 class ToJsonOperator(Operator[any, str]):
+    """Encodes each item as JSON string, dataclasses are encoded by a JsonEncoder
+    """
     name = '2-json'
 
+    def __init__(self, ctx: Context = None, *, use_orjson: bool = False) -> None:
+        """
+        :param use_orjson: encode the items with orjson in case it is installed, which writes compact JSON
+        """
+        super().__init__(ctx)
+        self.encoder = JsonEncoder(use_orjson=use_orjson)
+
     def apply(self, data: any, out: Callable[[str], None]):
         try:
-            data = json.dumps(data, cls=EnhancedJSONEncoder)
-            out(data)
-        except JSONDecodeError:
+            encoded = self.encoder.encode(data)
+        except (TypeError, ValueError):
             self.logger.error("%s could not write object as json, object was: %s" % (self.name, data))
+            return
+        out(encoded)
@@ -1,10 +1,25 @@
+import copy
 import logging
 import multiprocessing
+import queue
 import threading
+import time
 from dataclasses import dataclass
-from typing import TypeVar, Generic, List, Tuple, Callable
-
-from glimmer.processing import Topology, Operator, Source, Sink, Node, Executable, Environment
+from typing import TypeVar, Generic, List, Tuple, Callable, Dict, Optional
+
+from glimmer.processing import Topology, Operator, Source, Sink, Node, Executable, Environment, compose_list, \
+    InvalidTopologyError
+from glimmer.processing.channel import (
+    EdgeConfig, EdgeWriter, EdgeReader, LingerFlusher, Channel, QueueChannel, POISON, EOS, BARRIER, Marker, EdgeCounters,
+    PartitionedWriter, MergedReader, RoundRobinWriter, LeastLoadedWriter, ReorderingReader, Sequenced, LEAST_LOADED,
+    ROUND_ROBIN, DROP_OLDEST, DROP_NEWEST, wait_any
+)
+from glimmer.processing.join import JoinOperator
+from glimmer.processing.checkpoint import Checkpointing
+from glimmer.processing.exporter import MetricsExporter
+from glimmer.processing.metrics import NodeMetrics
+from glimmer.processing.profiling import Profiling
+from glimmer.processing.state import state_stats
 
 Result = TypeVar("Result")
 Out = TypeVar("Out")
@@ -12,64 +27,176 @@ Out = TypeVar("Out")
 
 @dataclass
 class ParallelTopology(Topology, Generic[Result, Out]):
-    __POISON__ = 'POISON'
+    __POISON__ = POISON
 
-    def __init__(self, sources, operators, sinks):
+    def __init__(self, sources, operators, sinks, edge_config: EdgeConfig = None,
+                 edge_configs: Dict[Tuple[str, str], EdgeConfig] = None, fuse: bool = False,
+                 channel_factory: Callable[[], Channel] = None):
+        """
+        :param edge_config: transport configuration used for all edges
+        :param edge_configs: transport configuration for single edges, keyed by (upstream name, downstream name),
+                             overrides edge_config
+        :param fuse: in case it is set to True, chains of operators that are connected by a single edge are executed
+                     as one task, see find_chains
+        :param channel_factory: creates the channel for each edge, defaults to QueueChannel. Edges with a serializer
+                                pass it as argument
+        """
         self.raw_sources = sources
         self.raw_operators = operators
         self.raw_sinks = sinks
+        self.edge_config = edge_config or EdgeConfig()
+        self.edge_configs = edge_configs or dict()
+        self.fuse = fuse
+        self.channel_factory = channel_factory or QueueChannel
         self.sources = []
         self.operators = []
         self.sinks = []
-        self.queues = dict()
+        self.channels = dict()
+        self.counters = dict()
+        self.writers = dict()
+        self.readers = dict()
+        self.instances = dict()
+        # metrics of each task, keyed by task name
+        self.metrics = dict()
         self._prepare_topology()
 
+    def _add_edge(self, node1: str, node2: str, config_key: Tuple[str, str]):
+        config = self.edge_configs.get(config_key, self.edge_config)
+        if config.serializer is None:
+            channel = self.channel_factory()
+        else:
+            channel = self.channel_factory(config.serializer)
+        counters = EdgeCounters()
+        self.channels[(node1, node2)] = channel
+        self.counters[(node1, node2)] = counters
+        writer = EdgeWriter(channel, config, counters)
+        self.writers[(node1, node2)] = writer
+        self.readers[(node1, node2)] = EdgeReader(channel, counters)
+
+    def _instances(self, node: Node) -> List[Node]:
+        instances = self.instances.get(node.name)
+        if instances is None:
+            if node.parallelism == 1:
+                instances = [node]
+            else:
+                instances = [_copy_node(node) for _ in range(node.parallelism)]
+            self.instances[node.name] = instances
+        return instances
+
+    def _out_writers(self, node: Node, index: int) -> list:
+        writers = []
+        for out in node.outputs.values():
+            out_writers = [self.writers[(instance_name(node, index), instance_name(out, i))]
+                           for i in range(out.parallelism)]
+            if len(out_writers) == 1:
+                writers.append(out_writers[0])
+            elif out.key_selector is not None:
+                writers.append(PartitionedWriter(out_writers, out.key_selector, out.ordered))
+            elif out.distribution == LEAST_LOADED:
+                writers.append(LeastLoadedWriter(out_writers, out.ordered))
+            else:
+                writers.append(RoundRobinWriter(out_writers, out.ordered))
+        return writers
+
+    def _in_readers(self, node: Node, index: int) -> list:
+        readers = []
+        for name, node_in in node.inputs.items():
+            in_readers = []
+            for i in range(node_in.parallelism):
+                reader = self.readers.get((instance_name(node_in, i), instance_name(node, index)))
+                if reader is None:
+                    raise AttributeError(f'Found uninitialized edge: {name}->{node.name}')
+                in_readers.append(reader)
+            if len(in_readers) == 1:
+                readers.append((name, in_readers[0]))
+            elif node_in.ordered:
+                readers.append((name, ReorderingReader(MergedReader(in_readers))))
+            else:
+                readers.append((name, MergedReader(in_readers)))
+        return readers
+
+    def _validate_ordering(self, node: Node):
+        if not (node.ordered and node.parallelism > 1):
+            return
+        if not isinstance(node, Operator):
+            raise InvalidTopologyError(f'Only operators can be ordered, {node.name} is not an operator')
+        edges = [(name, node.name) for name, node_in in node.inputs.items()]
+        edges.extend((node.name, name) for name in node.outputs.keys())
+        for node_in in node.inputs.values():
+            if node_in.parallelism > 1:
+                raise InvalidTopologyError(f'Input of the ordered node {node.name} must have a single instance')
+        for node_out in node.outputs.values():
+            if node_out.parallelism > 1:
+                raise InvalidTopologyError(f'Outputs of the ordered node {node.name} must have a single instance')
+        for edge in edges:
+            config = self.edge_configs.get(edge, self.edge_config)
+            if config.bounded and config.policy in (DROP_OLDEST, DROP_NEWEST):
+                raise InvalidTopologyError(f'Edges of the ordered node {node.name} must not drop items')
+
     def _prepare_topology(self):
-        sources = []
-        for source in self.raw_sources:
-            queues = []
-            for out in list(source.outputs.keys()):
-                queue = multiprocessing.Queue()
-                queues.append(queue)
-                self.queues[(source.name, out)] = queue
-
-            sources.append(SourceWrapper(source, queues))
-
-        for operator in self.raw_operators:
-            queues = []
-            for out in list(operator.outputs.keys()):
-                queue = multiprocessing.Queue()
-                queues.append(queue)
-                self.queues[(operator.name, out)] = queue
-
-        operators = []
-        for operator in self.raw_operators:
-            in_queues = []
-            for node in list(operator.inputs.keys()):
-                queue = self.queues.get((node, operator.name))
-                if queue is None:
-                    raise AttributeError(f'Found uninitialized edge: {node}->{operator.name}')
-                in_queues.append((node, queue))
-            out_queues = []
-            for node1, node2 in self.queues:
-                if node1 == operator.name:
-                    out_queues.append(self.queues[(node1, node2)])
-
-            operators.append(OperatorWrapper(operator, in_qs=in_queues, out_qs=out_queues))
-
-        sinks = []
-        for sink in self.raw_sinks:
-            queues = []
-            for node in list(sink.inputs.keys()):
-                queue = self.queues.get((node, sink.name))
-                if queue is None:
-                    raise AttributeError(f'Found uninitialized edge: {node}->{sink.name}')
-                queues.append((node, queue))
-            sinks.append(SinkWrapper(sink, queues))
-
-        self.sources = sources
-        self.operators = operators
-        self.sinks = sinks
+        for node in self.raw_sources + self.raw_operators + self.raw_sinks:
+            _validate_parallelism(node)
+            self._validate_ordering(node)
+
+        if self.fuse:
+            chains = find_chains(self.raw_operators)
+        else:
+            chains = [[operator] for operator in self.raw_operators]
+
+        # edges between operators of the same chain are not needed, the chain calls its operators directly.
+        # an edge between nodes with multiple instances consists of a channel between each pair of instances
+        for node in self.raw_sources + [chain[-1] for chain in chains]:
+            for out in node.outputs.values():
+                for i in range(node.parallelism):
+                    for j in range(out.parallelism):
+                        self._add_edge(instance_name(node, i), instance_name(out, j), (node.name, out.name))
+
+        self.sources = [wrapper for source in self.raw_sources for wrapper in self._source_wrappers(source)]
+        self.operators = [wrapper for chain in chains for wrapper in self._operator_wrappers(chain)]
+        self.sinks = [wrapper for sink in self.raw_sinks for wrapper in self._sink_wrappers(sink)]
+
+    def _source_wrappers(self, source: Source) -> List['SourceWrapper']:
+        """Wraps each instance of the source, a replicated source is split among its instances
+        """
+        wrappers = []
+        for i, instance in enumerate(self._instances(source)):
+            if source.parallelism > 1:
+                instance.split(i, source.parallelism)
+            name = instance_name(source, i)
+            wrappers.append(SourceWrapper(instance, self._out_writers(source, i), name, self._metrics(name)))
+        return wrappers
+
+    def _operator_wrappers(self, chain: List[Operator]) -> List['OperatorWrapper']:
+        """Wraps each instance of the operator of a chain, a chain of multiple operators runs as one task
+        """
+        head = chain[0]
+        tail = chain[-1]
+        if len(chain) == 1:
+            instances = self._instances(head)
+        else:
+            instances = [compose_list(chain)]
+            # the operators of the chain are reported by their own name as well
+            self.metrics.update(instances[0].instrument())
+        sequenced = head.ordered and head.parallelism > 1
+        wrappers = []
+        for i, instance in enumerate(instances):
+            name = instance_name(instance, i, head.parallelism)
+            wrappers.append(OperatorWrapper(instance, in_qs=self._in_readers(head, i), out_qs=self._out_writers(tail, i),
+                                            name=name, sequenced=sequenced, metrics=self._metrics(name)))
+        return wrappers
+
+    def _sink_wrappers(self, sink: Sink) -> List['SinkWrapper']:
+        wrappers = []
+        for i, instance in enumerate(self._instances(sink)):
+            name = instance_name(sink, i)
+            wrappers.append(SinkWrapper(instance, self._in_readers(sink, i), name, self._metrics(name)))
+        return wrappers
+
+    @property
+    def queues(self) -> Dict[Tuple[str, str], Channel]:
+        """Alias of channels, the edges were backed by queues before channels were pluggable
+        """
+        return self.channels
 
     @property
     def nodes(self):
@@ -78,10 +205,106 @@ class ParallelTopology(Topology, Generic[Result, Out]):
         all_nodes.extend(self.sinks)
         return all_nodes
 
+    def _metrics(self, task_name: str) -> NodeMetrics:
+        metrics = NodeMetrics()
+        self.metrics[task_name] = metrics
+        return metrics
+
+    def edge_stats(self) -> Dict[Tuple[str, str], Dict[str, int]]:
+        """
+        Returns the counters of each edge, i.e.: items in flight, how often the producer was blocked
+        and how many items were dropped
+        """
+        return {edge: counters.snapshot() for edge, counters in self.counters.items()}
+
+    def node_metrics(self) -> Dict[str, Dict[str, float]]:
+        return {name: metrics.snapshot() for name, metrics in self.metrics.items()}
+
+    def state_stats(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        # the operator of a fused chain contains the states of its members
+        return state_stats({task.name: task.op for task in self.operators})
+
     def stop_topology(self):
-        for q in self.queues.values():
-            q.put(ParallelTopology.__POISON__)
+        for channel in self.channels.values():
+            channel.interrupt()
 
+    def close(self):
+        for channel in self.channels.values():
+            channel.close()
+
+
+def instance_name(node: Node, index: int, parallelism: int = None) -> str:
+    """Name of the index-th instance of the node, nodes with a single instance keep their name
+    """
+    if parallelism is None:
+        parallelism = node.parallelism
+    if parallelism == 1:
+        return node.name
+    return f'{node.name}[{index}]'
+
+
+def _copy_node(node: Node) -> Node:
+    # instances share the connections to other nodes and the context, but not the state
+    memo = {id(node.inputs): node.inputs, id(node.outputs): node.outputs, id(node.ctx): node.ctx,
+            id(node.logger): node.logger}
+    return copy.deepcopy(node, memo)
+
+
+def _validate_parallelism(node: Node):
+    if node.parallelism < 1:
+        raise InvalidTopologyError(f'Parallelism of {node.name} must be at least 1, was: {node.parallelism}')
+    if node.parallelism == 1:
+        return
+    if isinstance(node, Source):
+        if not node.splittable:
+            raise InvalidTopologyError(f'Source {node.name} can not have multiple instances, it is not splittable')
+        return
+    if len(node.inputs) != 1:
+        raise InvalidTopologyError(f'Node {node.name} with multiple instances must have exactly one input, '
+                                   f'was: {len(node.inputs)}')
+    if node.key_selector is None and node.distribution not in (ROUND_ROBIN, LEAST_LOADED):
+        raise InvalidTopologyError(f'Unknown distribution of node {node.name}: {node.distribution}')
+
+
+def _validate_checkpointing(tasks: list):
+    # the barriers of multiple inputs can only be aligned in case each item is passed on its own
+    for task in tasks:
+        in_qs = getattr(task, 'in_qs', [])
+        if len(in_qs) > 1 and not isinstance(getattr(task, 'op', None), JoinOperator):
+            raise InvalidTopologyError(f'Checkpoints require node {task.name} with multiple inputs to be a JoinOperator')
+
+
+def _fusible(node: Node, other: Node) -> bool:
+    return (isinstance(node, Operator) and isinstance(other, Operator)
+            and node.chainable and other.chainable
+            and node.parallelism == 1 and other.parallelism == 1
+            and len(node.outputs) == 1 and len(other.inputs) == 1
+            and node.outputs.get(other.name) is other)
+
+
+def find_chains(operators: List[Operator]) -> List[List[Operator]]:
+    """
+    Groups the passed operators into maximal chains. Two operators are part of the same chain if the first one
+    has the second one as its only output, the second one has the first one as its only input, and both allow
+    chaining (see Operator.chainable).
+    Each operator is contained in exactly one chain, operators that can't be fused form a chain of their own.
+    """
+    chains = []
+    for operator in operators:
+        inputs = list(operator.inputs.values())
+        if len(inputs) == 1 and _fusible(inputs[0], operator):
+            # operator is not the head of a chain
+            continue
+
+        chain = [operator]
+        while True:
+            outputs = list(chain[-1].outputs.values())
+            if len(outputs) == 1 and _fusible(chain[-1], outputs[0]):
+                chain.append(outputs[0])
+            else:
+                break
+        chains.append(chain)
+    return chains
 
 
 def _contains_duplicate_node(nodes: List[Node], check: Node):
@@ -100,13 +323,26 @@ def _warn_duplicate(nodes: List[Node], logger: logging.Logger):
                            f'Nodes must have unique names, so check if there are any with the same name.')
 
 
-def mk_parallel_topology(start: List[Source], logger: logging.Logger = logging.getLogger(__name__)) -> ParallelTopology:
+def mk_parallel_topology(start: List[Source], logger: logging.Logger = logging.getLogger(__name__),
+                         edge_config: EdgeConfig = None,
+                         edge_configs: Dict[Tuple[str, str], EdgeConfig] = None,
+                         fuse: bool = False,
+                         channel_factory: Callable[[], Channel] = None) -> ParallelTopology:
     """
     Helper function to generate a topology from a list of initialized sources.
     Goes through the topology in a breadth-first manner to look for all nodes used.
+    The remaining arguments are passed to the topology, see ParallelTopology.
     """
     sources = start
     _warn_duplicate(sources, logger)
+    operators, sinks = collect_nodes(sources)
+    return ParallelTopology(sources, operators, sinks, edge_config, edge_configs, fuse, channel_factory)
+
+
+def collect_nodes(sources: List[Source]) -> Tuple[List[Operator], List[Sink]]:
+    """
+    Returns all operators and sinks that are reachable from the passed sources
+    """
     operators = dict()
     sinks = dict()
 
@@ -126,17 +362,22 @@ def mk_parallel_topology(start: List[Source], logger: logging.Logger = logging.g
     for source in sources:
         register_node(source)
 
-    return ParallelTopology(sources, list(operators.values()), list(sinks.values()))
+    return list(operators.values()), list(sinks.values())
 
 
 def get_items(in_qs):
+    """Reads one item of each input, in case there are multiple inputs they are returned as dict keyed by name.
+    Returns POISON or EOS in case an input returns it. Once an input ended its stream, the items of the other inputs
+    can't be combined anymore, they are discarded until the other inputs end their stream as well.
+    """
     items = dict()
-    for node_name, in_q in in_qs:
+    for index, (node_name, in_q) in enumerate(in_qs):
         item = in_q.get()
 
-        if item == ParallelTopology.__POISON__:
-            items = ParallelTopology.__POISON__
-            return items
+        if type(item) is Marker:
+            if item is EOS:
+                _discard_inputs(in_qs, index, items)
+            return item
 
         items[node_name] = item
     if len(items) == 1:
@@ -144,48 +385,246 @@ def get_items(in_qs):
     return items
 
 
+def _next_input(in_qs: list, aligned: List[str], index: int, wait: float, slice: float) -> Optional[tuple]:
+    """Reads the first input that has an item available, starting at index. Inputs in aligned are skipped.
+    In case no input has an item, blocks until one of them may have an item, at most wait seconds. In case not all
+    inputs can be waited on at once, blocks on the first input that is not aligned for at most slice seconds.
+    :return: position of the input, its name and the item, None in case nothing arrived
+    """
+    n = len(in_qs)
+    candidates = [(index + i) % n for i in range(n) if not aligned or in_qs[(index + i) % n][0] not in aligned]
+    for position in candidates:
+        try:
+            return position, in_qs[position][0], in_qs[position][1].get(0)
+        except queue.Empty:
+            continue
+    if wait <= 0 or wait_any([in_qs[position][1] for position in candidates], wait):
+        return None
+    position = candidates[0]
+    try:
+        return position, in_qs[position][0], in_qs[position][1].get(min(wait, slice))
+    except queue.Empty:
+        return None
+
+
+def _discard_inputs(in_qs, ended: int, items: dict):
+    for index, (node_name, in_q) in enumerate(in_qs):
+        if node_name in items:
+            in_q.discard(1)
+        if index != ended:
+            in_q.drain()
+
+
 class OperatorWrapper:
+    # seconds a join blocks on one input in case no input has an item available
+    _JOIN_WAIT = 0.0005
 
-    def __init__(self, op: Operator, in_qs: List[Tuple[str, multiprocessing.Queue]],
-                 out_qs: List[multiprocessing.Queue]):
+    def __init__(self, op: Operator, in_qs: List[Tuple[str, EdgeReader]], out_qs: List[EdgeWriter], name: str = None,
+                 sequenced: bool = False, metrics: NodeMetrics = None):
+        """
+        :param sequenced: in case it is set to True, the operator receives Sequenced items and publishes all outputs
+                          of an item as one Sequenced list, which allows downstream nodes to restore the order
+        :param metrics: records items in and out, the time spent in apply and waiting for inputs
+        """
         if len(in_qs) == 0:
             raise AttributeError(f'Operator does not have any inputs {op.name}')
         if len(out_qs) == 0:
             raise AttributeError(f'Operator does not have any outputs {op.name}')
         self.op = op
+        self.task_name = name or op.name
         self.in_qs = in_qs
         self.out_qs = out_qs
+        self.sequenced = sequenced
+        self.metrics = metrics or NodeMetrics()
+        self.flusher = LingerFlusher(out_qs)
         self.closed = False
+        # set by the environment in case the node is profiled
+        self.profiler = None
+        # set by the environment in case it takes checkpoints
+        self.checkpointer = None
 
     def run(self, stop: multiprocessing.Event):
         self.logger.debug(f'start operator {self.name}')
         self.open()
+        for out_q in self.out_qs:
+            out_q.open(stop)
+        self.flusher.start()
+        self.metrics.start()
         try:
-            while not stop.is_set():
-                items = get_items(self.in_qs)
-                if items == ParallelTopology.__POISON__:
-                    return
-                self.apply(items, self.publish)
+            if isinstance(self.op, JoinOperator):
+                self.join(stop)
+            elif self._batching():
+                self.apply_batches(stop)
+            else:
+                self.apply_items(stop)
         except (KeyboardInterrupt, EOFError):
             return
         finally:
             self.close()
 
+    def apply_items(self, stop: multiprocessing.Event):
+        """Passes the items to apply one at a time, combined into a dict in case there are multiple inputs
+        """
+        if self.profiler is not None:
+            self.apply = self.profiler.wrap(self.apply, has_out=True)
+        metrics = self.metrics
+        values = metrics.values
+        clock = time.perf_counter_ns
+        while not stop.is_set():
+            waiting = clock()
+            items = get_items(self.in_qs)
+            start = clock()
+            values[NodeMetrics.WAIT] += start - waiting
+            if type(items) is Marker:
+                if self._on_marker(items):
+                    return
+                continue
+            values[NodeMetrics.ITEMS_IN] += 1
+            if self.sequenced:
+                self.apply_sequenced(items)
+            else:
+                self.apply(items, self.publish)
+            metrics.record(clock() - start)
+
+    def _batching(self) -> bool:
+        # the items of multiple inputs are combined one at a time, ordered items need their sequence number
+        return bool(self.op.batch_size) and len(self.in_qs) == 1 and not self.sequenced and \
+            hasattr(self.in_qs[0][1], 'get_batch')
+
+    def apply_batches(self, stop: multiprocessing.Event):
+        """Passes the items that are available, at most batch_size, to apply_batch at once
+        """
+        in_q = self.in_qs[0][1]
+        batch_size = self.op.batch_size
+        apply_batch = self.op.apply_batch
+        if self.profiler is not None:
+            apply_batch = self.profiler.wrap(apply_batch, has_out=True)
+        metrics = self.metrics
+        values = metrics.values
+        clock = time.perf_counter_ns
+        while not stop.is_set():
+            waiting = clock()
+            items = in_q.get_batch(batch_size)
+            start = clock()
+            values[NodeMetrics.WAIT] += start - waiting
+            if type(items) is Marker:
+                if self._on_marker(items):
+                    return
+                continue
+            values[NodeMetrics.ITEMS_IN] += len(items)
+            apply_batch(items, self.publish)
+            metrics.record(clock() - start)
+
     def publish(self, out):
         # TODO maybe make None filtering optional via parameter
         if out is not None:
+            self.metrics.values[NodeMetrics.ITEMS_OUT] += 1
             for out_q in self.out_qs:
                 out_q.put(out)
 
+    def end_stream(self):
+        for out_q in self.out_qs:
+            out_q.end_stream()
+
+    def barrier(self):
+        """Snapshots the state once the barrier arrived on all inputs and passes the barrier on
+        """
+        if self.checkpointer is not None:
+            self.checkpointer.barrier(self.op)
+        for out_q in self.out_qs:
+            out_q.barrier()
+
+    def join(self, stop: multiprocessing.Event):
+        """Waits on all inputs at once and passes each item to the join as soon as it arrives.
+        An input that sent BARRIER is not read until all inputs sent it
+        """
+        op: JoinOperator = self.op
+        apply_input = op.apply_input if self.profiler is None else self.profiler.wrap(op.apply_input, has_out=True)
+        metrics = self.metrics
+        values = metrics.values
+        clock = time.perf_counter_ns
+        in_qs = list(self.in_qs)
+        # inputs that sent BARRIER and wait for the others
+        aligned = []
+        index = 0
+        interval = op.timer_interval
+        next_timer = time.monotonic() + interval
+        while not stop.is_set():
+            now = time.monotonic()
+            if now >= next_timer:
+                op.on_timer(now, self.publish)
+                next_timer = now + interval
+            waiting = clock()
+            received = _next_input(in_qs, aligned, index, next_timer - now, self._JOIN_WAIT)
+            start = clock()
+            values[NodeMetrics.WAIT] += start - waiting
+            if received is None:
+                # wait on the next input the next time
+                index = (index + 1) % len(in_qs)
+                continue
+            position, input_name, item = received
+            if type(item) is Marker:
+                if self._on_join_marker(in_qs, aligned, position, input_name, item):
+                    return
+                continue
+            # start with the next input, so a busy input can't starve the others
+            index = (position + 1) % len(in_qs)
+            values[NodeMetrics.ITEMS_IN] += 1
+            apply_input(input_name, item, self.publish)
+            metrics.record(clock() - start)
+
+    def _on_marker(self, marker: Marker) -> bool:
+        """Handles a marker that arrived on the inputs
+        :return: whether the node stops
+        """
+        if marker is BARRIER:
+            self.barrier()
+            return False
+        if marker is EOS:
+            self.end_stream()
+        return True
+
+    def _on_join_marker(self, in_qs: list, aligned: List[str], position: int, input_name: str,
+                        marker: Marker) -> bool:
+        """Handles a marker that arrived on one input of a join. The stream ends once all inputs ended theirs,
+        the barrier is passed on once all inputs sent it
+        :return: whether the node stops
+        """
+        if marker is POISON:
+            return True
+        if marker is EOS:
+            del in_qs[position]
+            if not in_qs:
+                self.op.on_end(self.publish)
+                self.end_stream()
+                return True
+        else:
+            aligned.append(input_name)
+        if aligned and len(aligned) == len(in_qs):
+            aligned.clear()
+            self.barrier()
+        return False
+
+    def apply_sequenced(self, item: Sequenced):
+        outputs = []
+        self.apply(item.data, outputs.append)
+        # the envelope is sent even without outputs, otherwise the order could not be restored
+        result = Sequenced(item.seq, [out for out in outputs if out is not None])
+        self.metrics.values[NodeMetrics.ITEMS_OUT] += len(result.data)
+        for out_q in self.out_qs:
+            out_q.put(result)
+
     @property
     def logger(self):
         return self.op.logger
 
     @property
     def name(self):
-        return self.op.name
+        return self.task_name
 
     def open(self):
+        if self.checkpointer is not None:
+            self.checkpointer.restore(self.op)
         self.op.open()
 
     def apply(self, data, out):
@@ -193,9 +632,14 @@ class OperatorWrapper:
 
     def close(self):
         if not self.closed:
-            self.logger.warning(f'Shutting down {self.op.name}')
+            self.logger.warning(f'Shutting down {self.name}')
+            self.flusher.close()
             self.op.close()
             self.closed = True
+            if self.profiler is not None:
+                self.profiler.dump()
+            if self.checkpointer is not None:
+                self.checkpointer.close()
 
     def __str__(self):
         return str(self.op)
@@ -203,46 +647,111 @@ class OperatorWrapper:
 
 class SinkWrapper:
 
-    def __init__(self, sink: Sink, in_qs: List[Tuple[str, multiprocessing.Queue]]):
+    def __init__(self, sink: Sink, in_qs: List[Tuple[str, EdgeReader]], name: str = None,
+                 metrics: NodeMetrics = None):
         if len(in_qs) == 0:
             raise AttributeError(f'Sink does not have any inputs {sink.name}')
 
         self.sink = sink
+        self.task_name = name or sink.name
         self.in_qs = in_qs
+        self.metrics = metrics or NodeMetrics()
         self.closed = False
+        # set by the environment in case the node is profiled
+        self.profiler = None
+        # set by the environment in case it takes checkpoints
+        self.checkpointer = None
 
     def run(self, stop: multiprocessing.Event):
         self.logger.debug(f'start sink {self.name}')
         self.open()
+        self.metrics.start()
+        if self._batching():
+            self.write_batches(stop)
+            return
+        if self.profiler is not None:
+            self.write = self.profiler.wrap(self.write)
+        values = self.metrics.values
+        clock = time.perf_counter_ns
         try:
             while not stop.is_set():
+                waiting = clock()
                 items = get_items(self.in_qs)
-
-                if items == ParallelTopology.__POISON__:
+                start = clock()
+                values[NodeMetrics.WAIT] += start - waiting
+
+                if type(items) is Marker:
+                    if items is BARRIER:
+                        self.barrier()
+                        continue
+                    # POISON or EOS, in both cases there is nothing left to write
                     return
 
+                values[NodeMetrics.ITEMS_IN] += 1
                 self.write(items)
+                self.metrics.record(clock() - start)
         except (KeyboardInterrupt, EOFError):
             pass
         finally:
             self.close()
             return
 
+    def _batching(self) -> bool:
+        return bool(self.sink.batch_size) and len(self.in_qs) == 1 and hasattr(self.in_qs[0][1], 'get_batch')
+
+    def write_batches(self, stop: multiprocessing.Event):
+        """Passes the items that are available, at most batch_size, to write_batch at once
+        """
+        in_q = self.in_qs[0][1]
+        batch_size = self.sink.batch_size
+        write_batch = self.sink.write_batch
+        if self.profiler is not None:
+            write_batch = self.profiler.wrap(write_batch)
+        metrics = self.metrics
+        values = metrics.values
+        clock = time.perf_counter_ns
+        try:
+            while not stop.is_set():
+                waiting = clock()
+                items = in_q.get_batch(batch_size)
+                start = clock()
+                values[NodeMetrics.WAIT] += start - waiting
+                if type(items) is Marker:
+                    if items is BARRIER:
+                        self.barrier()
+                        continue
+                    return
+                values[NodeMetrics.ITEMS_IN] += len(items)
+                write_batch(items)
+                metrics.record(clock() - start)
+        except (KeyboardInterrupt, EOFError):
+            pass
+        finally:
+            self.close()
+
     def open(self):
         self.sink.open()
 
+    def barrier(self):
+        if self.checkpointer is not None:
+            self.checkpointer.barrier()
+
     def write(self, data):
         self.sink.write(data)
 
     def close(self):
         if not self.closed:
             self.closed = True
-            self.logger.warning(f'Shutting down {self.sink.name}')
+            self.logger.warning(f'Shutting down {self.name}')
             self.sink.close()
+            if self.profiler is not None:
+                self.profiler.dump()
+            if self.checkpointer is not None:
+                self.checkpointer.close()
 
     @property
     def name(self) -> str:
-        return self.sink.name
+        return self.task_name
 
     @property
     def logger(self) -> logging.Logger:
@@ -254,18 +763,49 @@ class SinkWrapper:
 
 class SourceWrapper:
 
-    def __init__(self, source: Source, out_qs: List[multiprocessing.Queue]):
+    def __init__(self, source: Source, out_qs: List[EdgeWriter], name: str = None, metrics: NodeMetrics = None):
         if len(out_qs) == 0:
             raise AttributeError(f'Source does not contain any outgoing queues {source.name}')
         self.source = source
+        self.task_name = name or source.name
         self.out_qs = out_qs
+        self.metrics = metrics or NodeMetrics()
+        self.flusher = LingerFlusher(out_qs)
         self.closed = False
+        # set by the environment, once it is set the source stops reading and ends its stream
+        self.drain_signal = None
+        # set by the environment in case the node is profiled
+        self.profiler = None
+        # set by the environment in case it takes checkpoints, the source then sends the barriers
+        self.checkpointer = None
 
     def run(self, stop: multiprocessing.Event):
         self.logger.debug(f'start source {self.name}')
+        for out_q in self.out_qs:
+            out_q.open(stop)
+        self.flusher.start()
+        self.metrics.start()
+        if self.profiler is not None:
+            self.read = self.profiler.wrap(self.read, has_out=True)
+        clock = time.perf_counter_ns
+        drain = self.drain_signal
+        checkpointer = self.checkpointer
+        source = self.source
+        if checkpointer is not None:
+            checkpointer.restore(source)
         try:
             while not stop.is_set():
+                if drain is not None and drain.is_set():
+                    self.end_stream()
+                    return
+                if checkpointer is not None and checkpointer.triggered:
+                    self.barrier()
+                start = clock()
                 self.read(self.publish)
+                self.metrics.record(clock() - start)
+                if source.exhausted:
+                    self.end_stream()
+                    return
         except (KeyboardInterrupt, EOFError):
             pass
         finally:
@@ -278,17 +818,32 @@ class SourceWrapper:
         if not self.closed:
             self.closed = True
             self.logger.warning(f'Shutting down {self.name}')
+            self.flusher.close()
             self.source.close()
+            if self.profiler is not None:
+                self.profiler.dump()
+            if self.checkpointer is not None:
+                self.checkpointer.close()
 
     def publish(self, item):
         # TODO maybe make None filtering optional via parameter
         if item is not None:
+            self.metrics.values[NodeMetrics.ITEMS_OUT] += 1
             for out_q in self.out_qs:
                 out_q.put(item)
 
+    def end_stream(self):
+        for out_q in self.out_qs:
+            out_q.end_stream()
+
+    def barrier(self):
+        self.checkpointer.barrier(self.source)
+        for out_q in self.out_qs:
+            out_q.barrier()
+
     @property
     def name(self):
-        return self.source.name
+        return self.task_name
 
     @property
     def logger(self):
@@ -302,51 +857,173 @@ class ParallelEnvironment(Environment, Generic[Result, Out]):
     """This environment will execute each node in its own thread. Nodes communicate via multiprocessing.Queue instances
     to publish and receive data. This allows to let each node work at its own pace
     """
+    _DRAIN_TIME = 0
+    _DRAINED = 1
+    # seconds between the checks whether all nodes finished
+    _FINISHED_CHECK_INTERVAL = 0.1
 
     def __init__(self, topology: ParallelTopology,
-                 task_factory: Callable[[Node, multiprocessing.Event], Executable], logger: logging.Logger = None):
+                 task_factory: Callable[[Node, multiprocessing.Event], Executable], logger: logging.Logger = None,
+                 drain: bool = False, shutdown_timeout: float = None, metrics_port: int = None,
+                 profiling: Profiling = None, checkpointing: Checkpointing = None):
         """
         Initializes the environment
         :param topology: the topology that will be executed
         :param task_factory: factory function that produces from a node and a stop event an executable,
                             i.e.: multiprocessing.Process or threading.Thread
         :param logger
+        :param drain: in case it is set to True, stopping the environment stops the sources first and lets all other
+                      nodes finish the items in flight, see stop
+        :param shutdown_timeout: seconds the environment waits for the nodes to drain, before they are stopped
+                                 immediately. None waits until all nodes finished
+        :param metrics_port: in case it is set, the metrics are served over HTTP on this port while the environment
+                             runs, see MetricsExporter
+        :param profiling: profiles the selected nodes, profiling can be switched on and off with
+                          env.profiling.enable() and env.profiling.disable()
+        :param checkpointing: takes periodic checkpoints of the keyed states of the operators and restores them when
+                              the environment is started again
         """
         super().__init__(topology, multiprocessing.Event())
         if logger is None:
             logger = logging.getLogger(__name__)
         self.task_factory = task_factory
         self.logger = logger
+        self.drain = drain
+        self.shutdown_timeout = shutdown_timeout
         self.p = None
         self.nodes = topology.nodes
+        # stops the nodes immediately, the stop signal only tells the environment to shut down
+        self.halt_signal = multiprocessing.Event()
+        self.drain_signal = multiprocessing.Event()
+        self.shutdown = multiprocessing.RawArray('d', 2)
+        for source in topology.sources:
+            source.drain_signal = self.drain_signal
+        self.exporter = None if metrics_port is None else MetricsExporter(self, metrics_port)
+        self.profiling = profiling
+        if profiling is not None:
+            for node in self.nodes:
+                if profiling.selects(node.name, str(node)):
+                    node.profiler = profiling.profiler(node.name)
+        self.checkpointing = checkpointing
+        if checkpointing is not None:
+            _validate_checkpointing(self.nodes)
+            checkpointing.prepare([node.name for node in self.nodes])
+            for node in self.nodes:
+                node.checkpointer = checkpointing.checkpointer(node.name)
 
     def start(self, use_thread: bool = False):
+        self._serve_metrics()
         if use_thread:
-            self.p = threading.Thread(target=self.run)
+            self.p = threading.Thread(target=self._execute)
         else:
-            self.p = multiprocessing.Process(target=self.run)
+            self.p = multiprocessing.Process(target=self._execute)
         self.p.start()
 
     def join(self, timeout: int = None):
+        """Waits until the environment was stopped, in drain mode until all nodes finished
+        """
         self.p.join(timeout)
 
     def run(self):
+        """Executes the topology in the calling thread until it is stopped, or until all nodes finished
+        """
+        self._serve_metrics()
+        self._execute()
+
+    def _serve_metrics(self):
+        # the exporter runs in the process that starts the environment, it reads the metrics from shared memory
+        if self.exporter is not None:
+            self.exporter.start()
+
+    def _execute(self):
         processes = []
         for node in self.topology.nodes:
-            processes.append(self.task_factory(node, self.stop_signal))
+            processes.append(self.task_factory(node, self.halt_signal))
 
         for p in processes:
             p.start()
 
+        coordinator = None
+        if self.checkpointing is not None:
+            coordinator = threading.Thread(target=self.checkpointing.coordinate, args=(self.stop_signal,),
+                                           name='checkpoint-coordinator', daemon=True)
+            coordinator.start()
+
         self.logger.warning('Started topology, watiting for stop signal')
-        self.stop_signal.wait()
+        self._wait(processes)
+        if self.drain or self.drain_signal.is_set():
+            self._drain(processes)
+        else:
+            self.logger.warning('Received stop signal, stopping all processes')
+            self.halt()
+        if coordinator is not None:
+            coordinator.join()
+
+    def _wait(self, processes: List[Executable]):
+        """Waits for the stop signal, or until all nodes finished because the sources read all of their input
+        """
+        while not self.stop_signal.wait(self._FINISHED_CHECK_INTERVAL):
+            if not any(p.is_alive() for p in processes):
+                self.logger.warning('All nodes finished')
+                return
+
+    def _drain(self, processes: List[Executable]):
+        self.logger.warning('Received stop signal, draining topology')
+        start = time.monotonic()
+        self.drain_signal.set()
+        deadline = None if self.shutdown_timeout is None else start + self.shutdown_timeout
+        for p in processes:
+            p.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        drained = not any(p.is_alive() for p in processes)
+        self.shutdown[self._DRAIN_TIME] = time.monotonic() - start
+        self.shutdown[self._DRAINED] = 1 if drained else 0
+        if drained:
+            self.logger.warning(f'Drained topology in {self.shutdown[self._DRAIN_TIME]:.3f}s')
+        else:
+            self.logger.warning(f'Topology did not drain within {self.shutdown_timeout}s, stopping all processes')
+            self.halt()
+
+    def halt(self):
+        self.halt_signal.set()
         self.topology.stop_topology()
-        self.logger.warning('Received stop signal, stopping all processes')
 
-    def stop(self):
+    def stop(self, drain: bool = None):
+        """Stops the execution of the environment.
+        In drain mode, the sources stop reading and send an end-of-stream marker, which moves through the topology.
+        Each node finishes the items it received before the marker, passes the marker on and exits.
+        :param drain: overrides the drain mode of the environment
+        """
         self.logger.info('Stop environment')
+        if drain is None:
+            drain = self.drain
+        if drain:
+            self.drain_signal.set()
         self.stop_signal.set()
 
+    def edge_stats(self) -> Dict[Tuple[str, str], Dict[str, int]]:
+        return self.topology.edge_stats()
+
+    def metrics(self) -> Dict[str, dict]:
+        return {'nodes': self.topology.node_metrics(), 'edges': self.topology.edge_stats(),
+                'states': self.topology.state_stats()}
+
+    def shutdown_stats(self) -> Dict[str, float]:
+        """
+        Returns how long draining took, whether all nodes finished in time and how many items were lost, which
+        are the items that are still in flight or were received but not processed
+        """
+        lost = 0
+        for stats in self.topology.edge_stats().values():
+            lost += stats['in_flight'] + stats['discarded']
+        return {
+            'drain_time': self.shutdown[self._DRAIN_TIME],
+            'drained': bool(self.shutdown[self._DRAINED]),
+            'lost': lost,
+        }
+
     def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
         for node in self.nodes:
             node.close()
+        self.topology.close()
@@ -0,0 +1,236 @@
+import cProfile
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, List
+
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+
+
+class Profiling:
+    """Profiling settings of an environment.
+    The profiles only cover the read, apply or write calls of the selected nodes. The calls of out within them,
+    which publish into the next edge and may wait for backpressure or a linger, are excluded. Each node writes its profile into
+    the output directory when it shuts down: cProfile stats as <node>.prof, which can be loaded with pstats or
+    snakeviz, samples as collapsed stacks in <node>.folded, which can be rendered with flamegraph.pl or speedscope.
+    Profiling can be switched on and off while the environment runs, the flag is kept in shared memory.
+    """
+
+    def __init__(self, output_dir: str = 'profiles', nodes: List[str] = None, mode: str = CPROFILE,
+                 interval: float = 0.005, enabled: bool = True):
+        """
+        :param output_dir: directory the profiles are written to
+        :param nodes: names of the nodes to profile, either the node name or the name of a single instance,
+                      None profiles all nodes
+        :param mode: CPROFILE records every function call, SAMPLING records the stack of the node every interval,
+                     which has a much lower overhead
+        :param interval: seconds between two samples
+        :param enabled: whether profiling is switched on initially
+        """
+        if mode not in (CPROFILE, SAMPLING):
+            raise AttributeError(f'Unknown profiling mode: {mode}')
+        self.output_dir = output_dir
+        self.nodes = nodes
+        self.mode = mode
+        self.interval = interval
+        self.flag = multiprocessing.RawValue('b', enabled)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.flag.value)
+
+    def enable(self):
+        self.flag.value = True
+
+    def disable(self):
+        self.flag.value = False
+
+    def selects(self, task_name: str, node_name: str) -> bool:
+        return self.nodes is None or task_name in self.nodes or node_name in self.nodes
+
+    def profiler(self, task_name: str) -> 'NodeProfiler':
+        if self.mode == CPROFILE:
+            return CProfileNodeProfiler(task_name, self)
+        return SamplingNodeProfiler(task_name, self)
+
+
+class NodeProfiler:
+    """Profiles the calls of a single node, i.e.: the instance of an operator
+    """
+    extension: str
+
+    def __init__(self, task_name: str, profiling: Profiling):
+        self.task_name = task_name
+        self.profiling = profiling
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def path(self) -> str:
+        file_name = re.sub(r'[^\w.-]+', '_', self.task_name).strip('_')
+        return os.path.join(self.profiling.output_dir, f'{file_name}.{self.extension}')
+
+    def wrap(self, func: Callable, has_out: bool = False) -> Callable:
+        """Returns a function that calls func and profiles the call while profiling is enabled.
+        Has to be called by the thread that executes the node
+        :param has_out: whether the last argument of func is the out callback, its calls are not profiled
+        """
+        raise NotImplementedError
+
+    def _pause(self, out: Callable) -> Callable:
+        """Returns a function that calls out without profiling the call
+        """
+        raise NotImplementedError
+
+    def _pausing(self, has_out: bool) -> Callable:
+        """Returns a function that replaces the out callback at the end of the arguments, in case there is one, by
+        one that pauses profiling. The callback is usually the same for all calls, so it is only wrapped once
+        """
+        last = [None, None]
+
+        def replace_out(args: tuple) -> tuple:
+            if not has_out:
+                return args
+            out = args[-1]
+            if out != last[0]:
+                last[0] = out
+                last[1] = self._pause(out)
+            return args[:-1] + (last[1],)
+
+        return replace_out
+
+    def dump(self):
+        """Writes the profile, in case anything was recorded
+        """
+        raise NotImplementedError
+
+
+class CProfileNodeProfiler(NodeProfiler):
+    extension = 'prof'
+
+    def __init__(self, task_name: str, profiling: Profiling):
+        super().__init__(task_name, profiling)
+        self.profile = cProfile.Profile()
+        self.calls = 0
+
+    def wrap(self, func: Callable, has_out: bool = False) -> Callable:
+        flag = self.profiling.flag
+        profile = self.profile
+        replace_out = self._pausing(has_out)
+
+        def profiled(*args):
+            if not flag.value:
+                return func(*args)
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is active in this thread
+                return func(*args)
+            self.calls += 1
+            args = replace_out(args)
+            try:
+                return func(*args)
+            finally:
+                profile.disable()
+
+        return profiled
+
+    def _pause(self, out: Callable) -> Callable:
+        profile = self.profile
+
+        def paused(item):
+            profile.disable()
+            try:
+                return out(item)
+            finally:
+                profile.enable()
+
+        return paused
+
+    def dump(self):
+        if self.calls == 0:
+            return
+        os.makedirs(self.profiling.output_dir, exist_ok=True)
+        self.profile.dump_stats(self.path)
+        self.logger.info(f'Wrote profile of {self.task_name} to {self.path}')
+
+
+class SamplingNodeProfiler(NodeProfiler):
+    """Samples the stack of the node from a background thread, frames outside of the profiled calls are omitted
+    """
+    extension = 'folded'
+
+    def __init__(self, task_name: str, profiling: Profiling):
+        super().__init__(task_name, profiling)
+        self.stacks = Counter()
+        self.thread_id = None
+        # frame of the profiled call that is currently executed
+        self.entry = None
+        self.sampler = None
+        self.stopped = False
+
+    def wrap(self, func: Callable, has_out: bool = False) -> Callable:
+        flag = self.profiling.flag
+        self.thread_id = threading.get_ident()
+        if self.sampler is None:
+            self.sampler = threading.Thread(target=self._sample, name=f'sampler-{self.task_name}', daemon=True)
+            self.sampler.start()
+        replace_out = self._pausing(has_out)
+
+        def profiled(*args):
+            if not flag.value:
+                return func(*args)
+            args = replace_out(args)
+            self.entry = sys._getframe()
+            try:
+                return func(*args)
+            finally:
+                self.entry = None
+
+        return profiled
+
+    def _pause(self, out: Callable) -> Callable:
+        def paused(item):
+            # no samples are taken while there is no entry frame
+            entry = self.entry
+            self.entry = None
+            try:
+                return out(item)
+            finally:
+                self.entry = entry
+
+        return paused
+
+    def _sample(self):
+        interval = self.profiling.interval
+        while not self.stopped:
+            time.sleep(interval)
+            entry = self.entry
+            if entry is None:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not entry:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            # the call returned while the stack was collected, in case the entry frame was not reached
+            if frame is entry and stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self):
+        self.stopped = True
+        if self.sampler is not None:
+            self.sampler.join()
+        if not self.stacks:
+            return
+        os.makedirs(self.profiling.output_dir, exist_ok=True)
+        with open(self.path, 'w') as fd:
+            for stack, count in self.stacks.most_common():
+                fd.write(f'{stack} {count}\n')
+        self.logger.info(f'Wrote {sum(self.stacks.values())} samples of {self.task_name} to {self.path}')
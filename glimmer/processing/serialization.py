@@ -0,0 +1,340 @@
+import dataclasses
+import json
+import marshal
+import pickle
+import struct
+import typing
+from typing import List, Callable, Dict
+
+from glimmer.processing.channel import Batch, Marker, POISON, EOS
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class Serializer:
+    """Converts the items that are sent over an edge into bytes and back
+    """
+
+    def dumps(self, item) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data):
+        """
+        :param data: bytes-like object, which is only valid during the call, i.e.: a view into a ring buffer
+        """
+        raise NotImplementedError
+
+    def frames(self, item) -> List:
+        """Returns the serialized item as a list of bytes-like objects, which concatenated are equal to dumps(item).
+        Channels that copy the item into a buffer anyway use this to avoid joining the frames first.
+        """
+        return [self.dumps(item)]
+
+
+class PickleSerializer(Serializer):
+    """Serializes items with pickle, the same as multiprocessing.Queue does
+    """
+
+    def __init__(self, protocol: int = pickle.HIGHEST_PROTOCOL):
+        self.protocol = protocol
+
+    def dumps(self, item) -> bytes:
+        return pickle.dumps(item, self.protocol)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class OutOfBandPickleSerializer(Serializer):
+    """Serializes items with pickle protocol 5 and transfers large buffers (i.e.: bytearrays or numpy arrays)
+    out-of-band. Their content is not copied into the pickle stream, but written directly after it.
+    Requires python >= 3.8.
+
+    Layout: number of buffers n, n + 1 lengths, the pickle stream, the buffers
+    """
+    _COUNT = struct.Struct('<I')
+    _LENGTH = struct.Struct('<Q')
+
+    def __init__(self):
+        if pickle.HIGHEST_PROTOCOL < 5:
+            raise AttributeError('OutOfBandPickleSerializer requires pickle protocol 5 (python >= 3.8)')
+
+    def frames(self, item) -> List:
+        buffers = []
+        stream = pickle.dumps(item, 5, buffer_callback=buffers.append)
+        views = [buffer.raw() for buffer in buffers]
+        header = [self._COUNT.pack(len(views)), self._LENGTH.pack(len(stream))]
+        header.extend(self._LENGTH.pack(view.nbytes) for view in views)
+        return [b''.join(header), stream] + views
+
+    def dumps(self, item) -> bytes:
+        return b''.join(self.frames(item))
+
+    def loads(self, data):
+        # copy once, the buffers of the item reference the copy instead of the passed data
+        data = memoryview(bytes(data)) if isinstance(data, memoryview) else memoryview(data)
+        count, = self._COUNT.unpack_from(data)
+        pos = self._COUNT.size
+        lengths = []
+        for _ in range(count + 1):
+            lengths.append(self._LENGTH.unpack_from(data, pos)[0])
+            pos += self._LENGTH.size
+        stream = data[pos:pos + lengths[0]]
+        pos += lengths[0]
+        buffers = []
+        for length in lengths[1:]:
+            buffers.append(data[pos:pos + length])
+            pos += length
+        return pickle.loads(stream, buffers=buffers)
+
+
+class DataclassSerializer(Serializer):
+    """Compact codec for dataclasses, which encodes only the field values of the registered dataclasses with marshal.
+    Fields that are typed as registered dataclasses are encoded recursively, dataclasses that are used as field
+    types are registered automatically. Batches of items are encoded as a whole.
+    Items, which can't be encoded this way, are pickled.
+
+    Both sides must register the same dataclasses in the same order.
+    """
+    _PICKLE = 0
+    _MARSHAL = 1
+    _BATCH = 2
+    _TYPES = 3
+
+    def __init__(self, *types: type):
+        self.types = []
+        self.tags = dict()
+        self.encoders = dict()
+        self.decoders = []
+        for cls in types:
+            self._register(cls)
+
+    def _register(self, cls: type):
+        if cls in self.tags:
+            return
+        if not dataclasses.is_dataclass(cls):
+            raise AttributeError(f'{cls} is not a dataclass')
+        self.tags[cls] = len(self.types) + self._TYPES
+        self.types.append(cls)
+        self.decoders.append(None)
+
+        fields = dataclasses.fields(cls)
+        hints = typing.get_type_hints(cls)
+        nested = dict()
+        for field in fields:
+            field_type = _unwrap_optional(hints.get(field.name))
+            if isinstance(field_type, type) and dataclasses.is_dataclass(field_type):
+                self._register(field_type)
+                nested[field.name] = field_type
+
+        names = [field.name for field in fields]
+        self.encoders[cls] = self._compile_encoder(names, nested)
+        self.decoders[self.tags[cls] - self._TYPES] = self._compile_decoder(cls, names, nested)
+
+    def _compile_encoder(self, names: List[str], nested: Dict[str, type]) -> Callable:
+        # like dataclasses does for __init__, the function is generated to avoid a loop over the fields
+        values = []
+        namespace = dict()
+        for name in names:
+            if name in nested:
+                namespace[f'_encode_{name}'] = self.encoders[nested[name]]
+                values.append(f'None if o.{name} is None else _encode_{name}(o.{name})')
+            else:
+                values.append(f'o.{name}')
+        return _compile('encode', 'o', '(' + ''.join(f'{value}, ' for value in values) + ')', namespace)
+
+    def _compile_decoder(self, cls: type, names: List[str], nested: Dict[str, type]) -> Callable:
+        namespace = {'_new': object.__new__, '_cls': cls, '_decoders': self.decoders}
+        values = []
+        for i, name in enumerate(names):
+            if name in nested:
+                index = self.tags[nested[name]] - self._TYPES
+                values.append(f'None if v[{i}] is None else _decoders[{index}](v[{i}])')
+            else:
+                values.append(f'v[{i}]')
+        if '__slots__' in cls.__dict__:
+            namespace['_set'] = object.__setattr__
+            body = [f'_set(o, {name!r}, {value})' for name, value in zip(names, values)]
+        else:
+            items = ', '.join(f'{name!r}: {value}' for name, value in zip(names, values))
+            body = [f'o.__dict__.update({{{items}}})']
+        body = '\n    '.join(['o = _new(_cls)'] + body)
+        return _compile('decode', 'v', 'o', namespace, body)
+
+    def _encode(self, item):
+        encode = self.encoders.get(type(item))
+        if encode is not None:
+            return self.tags[type(item)], encode(item)
+        if type(item) is Batch:
+            return self._BATCH, [self._encode(element) for element in item]
+        return self._MARSHAL, item
+
+    def _decode(self, encoded):
+        tag, value = encoded
+        if tag >= self._TYPES:
+            return self.decoders[tag - self._TYPES](value)
+        if tag == self._MARSHAL:
+            return value
+        if tag == self._BATCH:
+            return Batch([self._decode(element) for element in value])
+        return pickle.loads(value)
+
+    def dumps(self, item) -> bytes:
+        try:
+            return marshal.dumps(self._encode(item))
+        except ValueError:
+            # unsupported field or item type
+            return marshal.dumps((self._PICKLE, pickle.dumps(item, pickle.HIGHEST_PROTOCOL)))
+
+    def loads(self, data):
+        return self._decode(marshal.loads(data))
+
+
+class MsgpackSerializer(Serializer):
+    """Serializes items with msgpack, which only supports basic types (i.e.: numbers, strings, lists and dicts).
+    Tuples are decoded as lists, therefore it can't be used for ordered edges. Requires the msgpack package.
+    """
+    _BATCH = 1
+    _MARKER = 2
+    _MARKERS = {marker.name: marker for marker in (POISON, EOS)}
+
+    def __init__(self):
+        if msgpack is None:
+            raise AttributeError('MsgpackSerializer requires the msgpack package')
+
+    @staticmethod
+    def _default(item):
+        if type(item) is Batch:
+            return msgpack.ExtType(MsgpackSerializer._BATCH, MsgpackSerializer._pack(list(item)))
+        if type(item) is Marker:
+            return msgpack.ExtType(MsgpackSerializer._MARKER, item.name.encode())
+        if isinstance(item, tuple):
+            return list(item)
+        raise TypeError(f'Can not serialize {type(item)} with msgpack')
+
+    @staticmethod
+    def _pack(item) -> bytes:
+        # strict types, otherwise batches would be packed as plain lists
+        return msgpack.packb(item, use_bin_type=True, strict_types=True, default=MsgpackSerializer._default)
+
+    @staticmethod
+    def _unpack(data):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=MsgpackSerializer._ext_hook)
+
+    @staticmethod
+    def _ext_hook(code, data):
+        if code == MsgpackSerializer._BATCH:
+            return Batch(MsgpackSerializer._unpack(data))
+        if code == MsgpackSerializer._MARKER:
+            return MsgpackSerializer._MARKERS[data.decode()]
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, item) -> bytes:
+        return self._pack(item)
+
+    def loads(self, data):
+        return self._unpack(data)
+
+
+class JsonEncoder:
+    """Encodes items as JSON, dataclasses as objects of their fields like dataclasses.asdict.
+    Each dataclass is converted by a function that is generated for its type on first use, which reads the fields
+    directly instead of copying the dataclass recursively as asdict does. Fields that are typed as dataclasses are
+    converted the same way, other values are passed to the JSON encoder as they are.
+    The output is the same as the one of json.dumps with EnhancedJSONEncoder. In case use_orjson is set and the
+    orjson package is installed, it encodes the items instead, which is faster but writes compact JSON and non-ASCII
+    characters as they are.
+    """
+
+    def __init__(self, use_orjson: bool = False, ensure_ascii: bool = True):
+        """
+        :param use_orjson: whether orjson encodes the items in case it is installed
+        :param ensure_ascii: whether non-ASCII characters are escaped, see json.dumps
+        """
+        self.converters = dict()
+        self.orjson = orjson is not None and use_orjson
+        self._encode = json.JSONEncoder(ensure_ascii=ensure_ascii, default=self._default).encode
+
+    def convert(self, item):
+        """Returns the dataclass as dict of its field values, other items as they are
+        """
+        cls = type(item)
+        converter = self.converters.get(cls)
+        if converter is None:
+            converter = self._compile_converter(cls) if dataclasses.is_dataclass(cls) else _identity
+            self.converters[cls] = converter
+        return converter(item)
+
+    def _compile_converter(self, cls: type) -> Callable:
+        hints = typing.get_type_hints(cls)
+        values = []
+        for field in dataclasses.fields(cls):
+            field_type = _unwrap_optional(hints.get(field.name))
+            if isinstance(field_type, type) and dataclasses.is_dataclass(field_type):
+                values.append(f'{field.name!r}: _convert(o.{field.name})')
+            else:
+                values.append(f'{field.name!r}: o.{field.name}')
+        return _compile('convert', 'o', '{' + ', '.join(values) + '}', {'_convert': self.convert})
+
+    def _default(self, item):
+        # called by the encoder for items it does not support, i.e.: dataclasses in lists
+        if dataclasses.is_dataclass(item) and not isinstance(item, type):
+            return self.convert(item)
+        raise TypeError(f'Object of type {type(item).__name__} is not JSON serializable')
+
+    def encode(self, item) -> str:
+        if self.orjson:
+            return self.dumps(item).decode('utf-8')
+        return self._encode(self.convert(item))
+
+    def dumps(self, item) -> bytes:
+        if self.orjson:
+            return orjson.dumps(item, default=self._default, option=orjson.OPT_NON_STR_KEYS)
+        return self._encode(self.convert(item)).encode('utf-8')
+
+    def dumps_lines(self, items: List) -> List[bytes]:
+        """Encodes each item as a line of JSON, which ends with a newline
+        """
+        if self.orjson:
+            dumps = orjson.dumps
+            default = self._default
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+            return [dumps(item, default=default, option=option) for item in items]
+        encode = self._encode
+        convert = self.convert
+        return [(encode(convert(item)) + '\n').encode('utf-8') for item in items]
+
+    def dumps_batch(self, items: List) -> bytes:
+        """Encodes the items as newline-delimited JSON, each item on its own line
+        """
+        return b''.join(self.dumps_lines(items))
+
+
+def _identity(item):
+    return item
+
+
+def _compile(name: str, arg: str, result: str, namespace: dict, body: str = None) -> Callable:
+    source = f'def {name}({arg}):\n'
+    if body is not None:
+        source += f'    {body}\n'
+    source += f'    return {result}\n'
+    exec(source, namespace)
+    return namespace[name]
+
+
+def _unwrap_optional(hint):
+    # Optional[X] is Union[X, None]
+    if getattr(hint, '__origin__', None) is typing.Union:
+        args = [arg for arg in hint.__args__ if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return hint
@@ -1,4 +1,9 @@
-from glimmer.processing import Sink
+import threading
+import time
+from typing import List
+
+from glimmer.processing import Sink, In
+from glimmer.processing.serialization import JsonEncoder
 from glimmer.util.context import Context
 
 
@@ -11,3 +16,195 @@ class NoopSink(Sink):
 
     def write(self, data):
         self.logger.info("noop received: %s" % data)
+
+
+class BufferedSink(Sink[In]):
+    """Gathers the records of the items it receives and writes them with one call of flush_records, once max_items
+    records or max_bytes bytes are buffered, or the oldest buffered record waited linger seconds. A background thread
+    flushes records that exceeded the linger time in case no further items arrive. close flushes the remaining
+    records, environments close their sinks when they stop or shut down.
+    Subclasses implement flush_records and may override encode, which converts an item into the record that is
+    buffered, and encode_batch, which converts the items of a batch at once.
+    """
+    batch_size = 1024
+
+    def __init__(self, name: str = None, max_items: int = 1024, max_bytes: int = None, linger: float = 1.0,
+                 ctx: Context = None):
+        """
+        :param max_items: number of buffered records after which they are flushed
+        :param max_bytes: size of the buffered records in bytes after which they are flushed, requires records that
+                          have a length, i.e.: bytes
+        :param linger: seconds a record waits at most before it is flushed, None waits until one of the other limits
+                       is reached
+        """
+        if name is not None:
+            self.name = name
+        super().__init__(ctx)
+        if max_items < 1:
+            raise AttributeError(f'Buffer of sink {self.name} must hold at least one item, was: {max_items}')
+        if linger is not None and linger <= 0:
+            raise AttributeError(f'Linger time of sink {self.name} must be positive, was: {linger}')
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.linger = linger
+        self.buffer = []
+        self.buffered_bytes = 0
+        # time at which the oldest buffered record has to be flushed
+        self.deadline = None
+        # number of calls of flush_records
+        self.flushes = 0
+        # lock and thread are created once the first item arrives, so instances can be copied and forked before
+        self.lock = None
+        self.thread = None
+        self.closed = None
+
+    def encode(self, item: In):
+        return item
+
+    def flush_records(self, records: List):
+        """Writes the buffered records at once
+        """
+        raise NotImplementedError
+
+    def encode_batch(self, items: List[In]) -> List:
+        """Converts the items of a batch into one record per item, the limits are checked after each record as in write
+        """
+        encode = self.encode
+        return [encode(item) for item in items]
+
+    def write(self, data: In):
+        if self.lock is None:
+            self._start()
+        record = self.encode(data)
+        with self.lock:
+            buffer = self.buffer
+            if not buffer and self.linger is not None:
+                self.deadline = time.monotonic() + self.linger
+            buffer.append(record)
+            if self.max_bytes is not None:
+                self.buffered_bytes += len(record)
+                if self.buffered_bytes >= self.max_bytes:
+                    self._flush()
+                    return
+            if len(buffer) >= self.max_items:
+                self._flush()
+
+    def write_batch(self, items: List[In]):
+        if self.lock is None:
+            self._start()
+        records = self.encode_batch(items)
+        with self.lock:
+            if not self.buffer and self.linger is not None:
+                self.deadline = time.monotonic() + self.linger
+            for record in records:
+                self.buffer.append(record)
+                if self.max_bytes is not None:
+                    self.buffered_bytes += len(record)
+                    if self.buffered_bytes >= self.max_bytes:
+                        self._flush()
+                        continue
+                if len(self.buffer) >= self.max_items:
+                    self._flush()
+
+    def _start(self):
+        self.lock = threading.Lock()
+        if self.linger is None:
+            return
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f'flush-{self.name}', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.closed.wait(self.linger / 2):
+            with self.lock:
+                if self.buffer and time.monotonic() >= self.deadline:
+                    self._flush()
+
+    def _flush(self):
+        records = self.buffer
+        self.buffer = []
+        self.buffered_bytes = 0
+        if self.linger is not None:
+            self.deadline = time.monotonic() + self.linger
+        if records:
+            self.flushes += 1
+            self.flush_records(records)
+
+    def flush(self):
+        """Writes the buffered records
+        """
+        if self.lock is None:
+            return
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        if self.thread is not None:
+            self.closed.set()
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+
+class FileSink(BufferedSink[In]):
+    """Appends each item as a line to a file. The buffered lines are written with a single write call, multiple
+    instances of the sink can append to the same file since each write contains complete lines.
+    """
+    name = 'file-sink'
+
+    def __init__(self, path: str = None, name: str = None, encoding: str = 'utf-8', max_items: int = 1024,
+                 max_bytes: int = 1 << 20, linger: float = 1.0, ctx: Context = None):
+        """
+        :param path: file to append to, the file config key of the context in case it is None
+        :param encoding: encoding of the items that are strings, other items are written as their string
+                         representation and bytes as they are
+        See BufferedSink for the other arguments
+        """
+        super().__init__(name, max_items, max_bytes, linger, ctx)
+        self.path = path or self.ctx.getenv('file')
+        if self.path is None:
+            raise AttributeError(f'No file passed to sink {self.name}')
+        self.encoding = encoding
+        self.fd = None
+
+    def open(self):
+        if self.fd is None:
+            # unbuffered, so each flush is exactly one write
+            self.fd = open(self.path, 'ab', buffering=0)
+
+    def encode(self, item: In) -> bytes:
+        if isinstance(item, bytes):
+            return item + b'\n'
+        return (item if isinstance(item, str) else str(item)).encode(self.encoding) + b'\n'
+
+    def flush_records(self, records: List[bytes]):
+        self.open()
+        data = memoryview(b''.join(records))
+        while data:
+            data = data[self.fd.write(data):]
+
+    def close(self):
+        super().close()
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
+
+
+class JsonLinesSink(FileSink[In]):
+    """Appends each item as a line of JSON to a file, dataclasses are written as objects, see JsonEncoder
+    """
+    name = 'json-lines-sink'
+
+    def __init__(self, path: str = None, name: str = None, max_items: int = 1024, max_bytes: int = 1 << 20,
+                 linger: float = 1.0, ctx: Context = None, *, use_orjson: bool = False):
+        """
+        :param use_orjson: encode the items with orjson in case it is installed, which writes compact JSON
+        """
+        super().__init__(path, name, 'utf-8', max_items, max_bytes, linger, ctx)
+        self.encoder = JsonEncoder(use_orjson=use_orjson, ensure_ascii=False)
+
+    def encode(self, item: In) -> bytes:
+        return self.encoder.dumps(item) + b'\n'
+
+    def encode_batch(self, items: List[In]) -> List[bytes]:
+        return self.encoder.dumps_lines(items)
@@ -0,0 +1,238 @@
+import csv
+import io
+import mmap
+import os
+import time
+from typing import Callable, List, Optional
+
+from glimmer.processing import Source
+from glimmer.util.context import Context
+
+
+class FileSource(Source):
+    """Reads the records of a line-oriented file through a memory map. Each call of read takes the complete records of
+    the next chunk of the file with a single slice of the map and splits them at once, so there is no read call per
+    line. The records are emitted one at a time, or as lists of at most batch_size records.
+
+    With csv set, records end at line breaks outside of quoted fields and are emitted as lists of fields.
+    offset is the position in bytes of the next record, a source that is created with the offset of a previous one
+    resumes where it stopped. Without follow, the source is exhausted once it read all records, and the environment
+    ends the stream. With follow set, the source waits for more data once it reached the end of the file,
+    i.e.: to tail a log, and the last record is only emitted once it is terminated.
+    The file is mapped when the source is opened or read for the first time.
+
+    The source is splittable, i.e.: source.replicate(4) reads the file with four instances in a parallel environment.
+    Each instance cuts the file after offset into parts of the same size at record boundaries and reads one of them,
+    so every record is read by exactly one instance. The boundaries of CSV rows require counting the quotes before
+    them. A split source can not follow the file.
+    """
+    name = 'file-source'
+    splittable = True
+
+    def __init__(self, path: str = None, name: str = None, batch_size: int = None, csv: bool = False,
+                 delimiter: str = '\n', encoding: Optional[str] = 'utf-8', offset: int = 0, follow: bool = False,
+                 chunk_size: int = 1 << 20, poll_interval: float = 0.1, ctx: Context = None):
+        """
+        :param path: file to read, the file config key of the context in case it is None
+        :param batch_size: maximum number of records per emitted list, None emits each record on its own
+        :param csv: whether the records are CSV rows, which are emitted as lists of fields
+        :param delimiter: separator of the records, ignored for CSV rows
+        :param encoding: encoding of the file, which must be ASCII compatible, None emits the records as bytes
+        :param offset: position in bytes of the first record that is read
+        :param follow: whether the source waits for the file to grow once it reached its end
+        :param chunk_size: bytes read per call of read, longer records are read as a whole
+        :param poll_interval: seconds read waits at the end of the file
+        """
+        if name is not None:
+            self.name = name
+        super().__init__(ctx)
+        self.path = path or self.ctx.getenv('file')
+        if self.path is None:
+            raise AttributeError(f'No file passed to source {self.name}')
+        if batch_size is not None and batch_size < 1:
+            raise AttributeError(f'Batch size of source {self.name} must be positive, was: {batch_size}')
+        if csv and encoding is None:
+            raise AttributeError(f'CSV rows of source {self.name} require an encoding')
+        self.batch_size = batch_size
+        self.csv = csv
+        self.delimiter = '\n' if csv else delimiter
+        self.encoding = encoding
+        self.offset = offset
+        self.follow = follow
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.fd = None
+        self.mm = None
+        # size of the file when it was mapped
+        self.size = 0
+        # part of the file this instance reads, see split
+        self.index = 0
+        self.instances = 1
+        # position in bytes at which the part of this instance ends, None reads up to the end of the file
+        self.end = None
+
+    @property
+    def exhausted(self) -> bool:
+        """Whether all records were read, a source that follows the file is never exhausted
+        """
+        return not self.follow and self.fd is not None and self.offset >= self.limit
+
+    @property
+    def limit(self) -> int:
+        """Position in bytes at which the source stops reading
+        """
+        return self.size if self.end is None else self.end
+
+    def split(self, index: int, instances: int):
+        if self.follow:
+            raise AttributeError(f'Source {self.name} follows its file and can not be split')
+        self.index = index
+        self.instances = instances
+        self.end = None
+
+    def open(self):
+        self._map()
+
+    def _map(self) -> bool:
+        """Maps the file, again in case its size changed
+        :return: whether there is data after the offset
+        """
+        if self.fd is None:
+            self.fd = open(self.path, 'rb')
+        size = os.fstat(self.fd.fileno()).st_size
+        if size < self.offset:
+            self.logger.warning(f'{self.path} was truncated, {self.name} reads it from the start')
+            self.offset = 0
+        if size != self.size or (self.mm is None and size > 0):
+            if self.mm is not None:
+                self.mm.close()
+            # an empty file can not be mapped
+            self.mm = mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+            self.size = size
+        if self.instances > 1 and self.end is None:
+            self._split()
+        return self.offset < self.limit
+
+    def _split(self):
+        """Moves the offset and the end to the boundaries of the part of this instance, each instance computes the same
+        boundaries independently
+        """
+        start = self.offset
+        length = self.size - start
+        self.offset = self._boundary(start, start + length * self.index // self.instances)
+        self.end = self._boundary(start, start + length * (self.index + 1) // self.instances)
+
+    def _boundary(self, start: int, position: int) -> int:
+        """Start of the first record at or after position, start has to be the start of a record
+        """
+        if position <= start:
+            return start
+        if position >= self.size:
+            return self.size
+        delimiter = self.delimiter.encode()
+        # position is the start of a record in case a delimiter precedes it
+        cut = self.mm.find(delimiter, position - len(delimiter))
+        if self.csv:
+            counted = start
+            quotes = 0
+            while cut != -1:
+                quotes += self._count_quotes(counted, cut)
+                counted = cut
+                if quotes % 2 == 0:
+                    break
+                # the line break is inside a quoted field
+                cut = self.mm.find(delimiter, cut + len(delimiter))
+        return self.size if cut == -1 else cut + len(delimiter)
+
+    def _count_quotes(self, start: int, end: int) -> int:
+        count = 0
+        for chunk_start in range(start, end, self.chunk_size):
+            count += self.mm[chunk_start:min(chunk_start + self.chunk_size, end)].count(b'"')
+        return count
+
+    def seek(self, offset: int):
+        """Continues reading at the passed position in bytes, which has to be the start of a record
+        """
+        self.offset = offset
+
+    def position(self):
+        # the end of a split instance is kept, the size of the file may have changed once it is restored
+        return self.offset, self.end
+
+    def restore(self, position):
+        self.offset, self.end = position
+
+    def read(self, out: Callable):
+        records = self._records() if self.mm is not None and self.offset < self.limit else None
+        if records is None:
+            # the end of the mapped file was reached, or its last record is not terminated yet
+            size = self.size
+            if not self._map() or self.size == size:
+                if not self.exhausted:
+                    time.sleep(self.poll_interval)
+                return
+            records = self._records()
+            if records is None:
+                return
+        batch_size = self.batch_size
+        if batch_size is None:
+            for record in records:
+                out(record)
+        else:
+            for start in range(0, len(records), batch_size):
+                out(records[start:start + batch_size])
+
+    def _records(self) -> Optional[List]:
+        """Returns the complete records of the next chunk and moves the offset behind them, None in case there is none
+        """
+        data = self._next_chunk()
+        if data is None:
+            return None
+        if self.encoding is None:
+            return data.split(self.delimiter.encode())
+        text = data.decode(self.encoding)
+        if self.csv:
+            return list(csv.reader(io.StringIO(text, newline='')))
+        return text.split(self.delimiter)
+
+    def _next_chunk(self) -> Optional[bytes]:
+        mm = self.mm
+        start = self.offset
+        size = self.limit
+        delimiter = self.delimiter.encode()
+        end = min(start + self.chunk_size, size)
+        while True:
+            if end == size and not self.follow:
+                # the last record does not need to be terminated
+                data = mm[start:size]
+                self.offset = size
+                if data.endswith(delimiter):
+                    data = data[:-len(delimiter)]
+                return data
+            data = mm[start:end]
+            cut = self._cut(data, delimiter)
+            if cut != -1:
+                self.offset = start + cut + len(delimiter)
+                return data[:cut]
+            if end == size:
+                return None
+            # a record that is longer than the chunk
+            end = min(end + self.chunk_size, size)
+
+    def _cut(self, data: bytes, delimiter: bytes) -> int:
+        """Position of the last delimiter in data that terminates a record, -1 in case there is none
+        """
+        cut = data.rfind(delimiter)
+        if self.csv:
+            # a line break inside a quoted field, which is preceded by an odd number of quotes, does not end a row
+            while cut != -1 and data.count(b'"', 0, cut) % 2 == 1:
+                cut = data.rfind(delimiter, 0, cut)
+        return cut
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
@@ -0,0 +1,378 @@
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterator, List, MutableMapping, Tuple
+
+_MISSING = object()
+
+
+class StateCounters:
+    """Counters of a keyed state, kept in shared memory so they can be read from any process.
+    The operator that owns the state is the only writer, therefore no lock is needed.
+    """
+    HITS = 0
+    LOADS = 1
+    MISSES = 2
+    SPILLS = 3
+    EXPIRED = 4
+    IN_MEMORY = 5
+    ON_DISK = 6
+    _NAMES = ['hits', 'loads', 'misses', 'spills', 'expired', 'in_memory', 'on_disk']
+
+    def __init__(self):
+        self.values = multiprocessing.RawArray('q', len(self._NAMES))
+
+    def snapshot(self) -> Dict[str, float]:
+        stats = dict(zip(self._NAMES, self.values[:]))
+        found = stats['hits'] + stats['loads']
+        # share of the keys that were found in memory, the in-memory tier is too small in case it is low
+        stats['hit_ratio'] = stats['hits'] / found if found else 0.0
+        return stats
+
+
+class KeyedState(MutableMapping):
+    """State of an operator per key, i.e.: the last position of each taxi, with a bounded memory footprint.
+    The most recently used keys are kept in memory, at most capacity of them. Once the capacity is exceeded, the least
+    recently used keys are spilled to a sqlite database on disk and moved back into memory when they are accessed
+    again. Each key is either in memory or on disk, never in both.
+    In case ttl is set, a key expires ttl seconds after it was last written. Expired keys are removed when they are
+    accessed and by a sweep over all keys every ttl seconds.
+    Spilled keys and values are pickled, therefore equal keys must have equal pickles, i.e.: str, int or tuples of them.
+    Once changes are tracked for checkpoints, a key counts as changed when it is assigned or deleted, values that are
+    modified in place have to be assigned again.
+    """
+
+    def __init__(self, name: str = 'state', capacity: int = 100000, ttl: float = None, directory: str = None,
+                 spill_batch: int = None):
+        """
+        :param name: name of the state, unique per operator
+        :param capacity: maximum number of keys kept in memory
+        :param ttl: seconds after the last write until a key expires, None keeps keys forever
+        :param directory: directory of the database file, None uses a temporary database that sqlite removes once it
+                          is closed or the process exits
+        :param spill_batch: number of keys that are spilled at once, a tenth of the capacity by default
+        """
+        if capacity < 1:
+            raise AttributeError(f'Capacity of state {name} must be positive, was: {capacity}')
+        if ttl is not None and ttl <= 0:
+            raise AttributeError(f'TTL of state {name} must be positive, was: {ttl}')
+        self.name = name
+        self.capacity = capacity
+        self.ttl = ttl
+        self.directory = directory
+        self.spill_batch = min(capacity, spill_batch or max(1, capacity // 10))
+        self.counters = StateCounters()
+        # key -> (value, expiry time or None), ordered from the least to the most recently used
+        self.memory = OrderedDict()
+        self.on_disk = 0
+        self.next_sweep = None if ttl is None else time.time() + ttl
+        # keys assigned or deleted since the last delta, None in case changes are not tracked
+        self.changed = None
+        self._db = None
+        self._pid = None
+        # distinguishes the database files of instances that share a name, directory and process, i.e.: threads
+        self._uid = uuid.uuid4().hex
+
+    def __deepcopy__(self, memo):
+        # instances of a node get their own counters and database
+        copy = KeyedState(self.name, self.capacity, self.ttl, self.directory, self.spill_batch)
+        copy.memory = OrderedDict(self.memory)
+        copy.counters.values[StateCounters.IN_MEMORY] = len(copy.memory)
+        return copy
+
+    @property
+    def path(self) -> str:
+        if self.directory is None:
+            return ''
+        return os.path.join(self.directory, f'{self.name}-{os.getpid()}-{self._uid}.sqlite')
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is not None and self._pid == os.getpid():
+            return self._db
+        # a forked copy of the state can not use the connection of its parent, the keys the parent spilled are lost
+        self.on_disk = 0
+        self.counters.values[StateCounters.ON_DISK] = 0
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+        self._uid = uuid.uuid4().hex
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._pid = os.getpid()
+        # the database only backs the memory of a single process, durability is not needed
+        self._db.execute('PRAGMA journal_mode=OFF')
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._db.execute('DROP TABLE IF EXISTS state')
+        self._db.execute('CREATE TABLE state (key BLOB PRIMARY KEY, value BLOB, expires REAL) WITHOUT ROWID')
+        if self.ttl is not None:
+            self._db.execute('CREATE INDEX state_expires ON state (expires)')
+        return self._db
+
+    def _lookup(self, key):
+        """Returns the value of the key and moves it to the front of the memory, _MISSING in case there is none
+        """
+        values = self.counters.values
+        entry = self.memory.get(key)
+        if entry is not None:
+            expires = entry[1]
+            if expires is None or expires > time.time():
+                self.memory.move_to_end(key)
+                values[StateCounters.HITS] += 1
+                return entry[0]
+            del self.memory[key]
+            values[StateCounters.EXPIRED] += 1
+            values[StateCounters.IN_MEMORY] = len(self.memory)
+        elif self.on_disk:
+            entry = self._load(key)
+            if entry is not None:
+                values[StateCounters.LOADS] += 1
+                self._put(key, entry)
+                return entry[0]
+        values[StateCounters.MISSES] += 1
+        return _MISSING
+
+    def _load(self, key) -> Tuple:
+        db = self._connection()
+        raw_key = pickle.dumps(key)
+        row = db.execute('SELECT value, expires FROM state WHERE key = ?', (raw_key,)).fetchone()
+        if row is None:
+            return None
+        db.execute('DELETE FROM state WHERE key = ?', (raw_key,))
+        db.commit()
+        self._disk_changed(-1)
+        raw_value, expires = row
+        if expires is not None and expires <= time.time():
+            self.counters.values[StateCounters.EXPIRED] += 1
+            return None
+        return pickle.loads(raw_value), expires
+
+    def _put(self, key, entry: Tuple):
+        memory = self.memory
+        memory[key] = entry
+        memory.move_to_end(key)
+        if len(memory) > self.capacity:
+            self._spill()
+        self.counters.values[StateCounters.IN_MEMORY] = len(memory)
+
+    def _spill(self):
+        memory = self.memory
+        now = time.time()
+        rows = []
+        expired = 0
+        for _ in range(self.spill_batch):
+            key, (value, expires) = memory.popitem(last=False)
+            if expires is not None and expires <= now:
+                expired += 1
+                continue
+            rows.append((pickle.dumps(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires))
+        db = self._connection()
+        db.executemany('INSERT INTO state VALUES (?, ?, ?)', rows)
+        db.commit()
+        self._disk_changed(len(rows))
+        values = self.counters.values
+        values[StateCounters.SPILLS] += len(rows)
+        values[StateCounters.EXPIRED] += expired
+
+    def _disk_changed(self, delta: int):
+        self.on_disk += delta
+        self.counters.values[StateCounters.ON_DISK] = self.on_disk
+
+    def _delete_spilled(self, key) -> bool:
+        db = self._connection()
+        deleted = db.execute('DELETE FROM state WHERE key = ?', (pickle.dumps(key),)).rowcount
+        db.commit()
+        self._disk_changed(-deleted)
+        return deleted > 0
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if self.ttl is None:
+            expires = None
+        else:
+            now = time.time()
+            expires = now + self.ttl
+            if now >= self.next_sweep:
+                self.expire(now)
+        if self.changed is not None:
+            self.changed.add(key)
+        if self.on_disk and key not in self.memory:
+            self._delete_spilled(key)
+        self._put(key, (value, expires))
+
+    def __delitem__(self, key):
+        if self.changed is not None:
+            self.changed.add(key)
+        if self.memory.pop(key, _MISSING) is not _MISSING:
+            self.counters.values[StateCounters.IN_MEMORY] = len(self.memory)
+        elif not (self.on_disk and self._delete_spilled(key)):
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return self._lookup(key) is not _MISSING
+
+    def __iter__(self) -> Iterator:
+        for key, _ in self.items():
+            yield key
+
+    def __len__(self) -> int:
+        """Number of keys that did not expire, counts the spilled keys with a query
+        """
+        now = time.time()
+        count = sum(1 for _, expires in self.memory.values() if expires is None or expires > now)
+        if self.on_disk:
+            count += self._connection().execute(
+                'SELECT count(*) FROM state WHERE expires IS NULL OR expires > ?', (now,)).fetchone()[0]
+        return count
+
+    def items(self) -> Iterator[Tuple]:
+        """Iterates over all keys and values that did not expire, without moving spilled keys into memory
+        """
+        now = time.time()
+        for key, (value, expires) in list(self.memory.items()):
+            if expires is None or expires > now:
+                yield key, value
+        if self.on_disk:
+            rows = self._connection().execute(
+                'SELECT key, value FROM state WHERE expires IS NULL OR expires > ?', (now,)).fetchall()
+            for raw_key, raw_value in rows:
+                yield pickle.loads(raw_key), pickle.loads(raw_value)
+
+    def values(self) -> Iterator:
+        for _, value in self.items():
+            yield value
+
+    def expire(self, now: float = None) -> int:
+        """Removes all expired keys from memory and disk
+        :return: number of removed keys
+        """
+        if self.ttl is None:
+            return 0
+        if now is None:
+            now = time.time()
+        self.next_sweep = now + self.ttl
+        memory = self.memory
+        expired = [key for key, (_, expires) in memory.items() if expires <= now]
+        for key in expired:
+            del memory[key]
+        removed = len(expired)
+        if self.on_disk:
+            db = self._connection()
+            deleted = db.execute('DELETE FROM state WHERE expires <= ?', (now,)).rowcount
+            db.commit()
+            self._disk_changed(-deleted)
+            removed += deleted
+        values = self.counters.values
+        values[StateCounters.EXPIRED] += removed
+        values[StateCounters.IN_MEMORY] = len(memory)
+        return removed
+
+    def clear(self):
+        if self.changed is not None:
+            self.changed.update(self)
+        self.memory.clear()
+        self.counters.values[StateCounters.IN_MEMORY] = 0
+        if self.on_disk:
+            db = self._connection()
+            db.execute('DELETE FROM state')
+            db.commit()
+            self._disk_changed(-self.on_disk)
+
+    def track_changes(self):
+        """Records the keys that are assigned or deleted from now on, see delta
+        """
+        if self.changed is None:
+            self.changed = set()
+
+    def delta(self) -> Tuple[Dict, List]:
+        """Returns the entries, (value, expiry time), of the keys that were assigned since the last call and the keys
+        that were deleted
+        """
+        changed = self.changed or set()
+        self.changed = set()
+        entries = dict()
+        deleted = []
+        for key in changed:
+            entry = self._peek(key)
+            if entry is None:
+                deleted.append(key)
+            else:
+                entries[key] = entry
+        return entries, deleted
+
+    def _peek(self, key) -> Tuple:
+        # does not move the key into memory
+        entry = self.memory.get(key)
+        if entry is None and self.on_disk:
+            row = self._connection().execute(
+                'SELECT value, expires FROM state WHERE key = ?', (pickle.dumps(key),)).fetchone()
+            if row is not None:
+                entry = pickle.loads(row[0]), row[1]
+        return entry
+
+    def restore(self, entries: Dict, deleted: List = ()):
+        """Writes the entries, (value, expiry time), and removes the deleted keys, i.e.: from a checkpoint.
+        Restored keys do not count as changed
+        """
+        now = time.time()
+        for key in deleted:
+            if self.memory.pop(key, _MISSING) is _MISSING and self.on_disk:
+                self._delete_spilled(key)
+        for key, (value, expires) in entries.items():
+            if expires is not None and expires <= now:
+                continue
+            if self.on_disk and key not in self.memory:
+                self._delete_spilled(key)
+            self._put(key, (value, expires))
+        self.counters.values[StateCounters.IN_MEMORY] = len(self.memory)
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the counters of the state: hits and loads count the lookups of keys that were found in memory and
+        on disk, misses the lookups of keys that did not exist or expired, spills the keys moved to disk
+        """
+        return self.counters.snapshot()
+
+    def close(self):
+        """Closes the database, a temporary database is removed
+        """
+        if self._db is None or self._pid != os.getpid():
+            return
+        path = self.path
+        self._db.close()
+        self._db = None
+        self.on_disk = 0
+        if path:
+            os.remove(path)
+
+
+def operator_states(op) -> Dict[str, KeyedState]:
+    """Returns the keyed states of an operator, including the states of the operators of a chain
+    """
+    states = dict()
+    for inner in getattr(op, 'operators', [op]):
+        if getattr(inner, 'states', None):
+            states.update({f'{inner.name}.{name}' if inner is not op else name: state
+                           for name, state in inner.states.items()})
+    return states
+
+
+def state_stats(operators: Dict[str, object]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Returns the counters of the keyed states of the passed operators, keyed by task name and state name.
+    Operators without keyed state are omitted
+    """
+    stats = dict()
+    for task_name, op in operators.items():
+        states = operator_states(op)
+        if states:
+            stats[task_name] = {name: state.stats() for name, state in states.items()}
+    return stats
@@ -1,10 +1,15 @@
 import logging
 import multiprocessing
 import threading
+import time
 from dataclasses import dataclass
-from typing import TypeVar, Generic
+from typing import TypeVar, Generic, Dict, Callable
 
-from glimmer.processing import Source, Operator, Sink, Environment, Topology, InvalidTopologyError, compose_list
+from glimmer.processing import Source, Operator, Sink, Environment, Topology, InvalidTopologyError, compose_list, \
+    ChainedOperator
+from glimmer.processing.exporter import MetricsExporter
+from glimmer.processing.metrics import NodeMetrics
+from glimmer.processing.state import state_stats
 
 Result = TypeVar("Result")
 Out = TypeVar("Out")
@@ -42,13 +47,16 @@ class SynchronousEnvironment(Environment, Generic[Result, Out]):
     This pipe will call each operator one after another without any kind of parallelism.
     Which  means, that blocking operators will bring the whole pipeline to a halt.
     """
+    # seconds between two checks of the stop signal
+    stop_check_interval: float = 0.01
 
     def __init__(self, topology: SynchronousTopology[Result, Out],
                  logger=logging.getLogger(__name__),
-                 skip_none: bool = False):
+                 skip_none: bool = False, metrics_port: int = None):
         """
         Initializes an environment
-
+        :param metrics_port: in case it is set, the metrics are served over HTTP on this port until the environment
+                             is stopped, see MetricsExporter
         """
         super(SynchronousEnvironment, self).__init__(topology, multiprocessing.Event())
         if logger is None:
@@ -59,6 +67,10 @@ class SynchronousEnvironment(Environment, Generic[Result, Out]):
         self.logger = logger
         self.skip_none = skip_none
         self.p = None
+        self.node_metrics = {node.name: NodeMetrics() for node in (self.source, self.operator, self.sink)}
+        if isinstance(self.operator, ChainedOperator):
+            self.node_metrics.update(self.operator.instrument())
+        self.exporter = None if metrics_port is None else MetricsExporter(self, metrics_port)
 
     def open(self):
         self.logger.info('env opens nodes')
@@ -72,10 +84,11 @@ class SynchronousEnvironment(Environment, Generic[Result, Out]):
         self.operator.close()
 
     def start(self, use_thread: bool = False):
+        self._serve_metrics()
         if use_thread:
-            self.p = threading.Thread(target=self.run)
+            self.p = threading.Thread(target=self._execute)
         else:
-            self.p = multiprocessing.Process(target=self.run)
+            self.p = multiprocessing.Process(target=self._execute)
 
         self.p.start()
 
@@ -85,36 +98,109 @@ class SynchronousEnvironment(Environment, Generic[Result, Out]):
             In case skip_none is False, None will be passed to the operator and to the sink.
             In case it is set to True, the current iteration will be stopped and a new item will be read
             """
+        self._serve_metrics()
+        self._execute()
+
+    def _serve_metrics(self):
+        # the exporter runs in the process that starts the environment, it reads the metrics from shared memory
+        if self.exporter is not None:
+            self.exporter.start()
+
+    def _execute(self):
         self.logger.info(f'start executing following topology: {self.pretty_string()}')
-        skip_none = self.skip_none
+        for metrics in self.node_metrics.values():
+            metrics.start()
+        read = self._compile()
+        source = self.source
+        stop_signal = self.stop_signal
+        clock = time.perf_counter_ns
+        check_interval = int(self.stop_check_interval * 1e9)
+        next_check = 0
         self.open()
         try:
-            while not self.stop_signal.is_set():
-
-                def op_out(data):
-                    if skip_none and data is None:
-                        self.logger.warning('Operator returned None')
-
-                    self.logger.debug(f'data after applying {self.operator.name}: {data}')
-                    self.logger.debug('write data to sink')
-                    self.sink.write(data)
-
-                def read_out(data):
-                    if skip_none and data is None:
-                        self.logger.warning('Source returned None')
-
-                    self.logger.debug(f'process data: {data}')
-                    self.operator.apply(data, op_out)
-
-                self.source.read(read_out)
+            while True:
+                # checking a multiprocessing.Event takes a lock, reading the clock is much cheaper
+                if clock() >= next_check:
+                    if stop_signal.is_set():
+                        break
+                    next_check = clock() + check_interval
+                read()
+                if source.exhausted:
+                    self.logger.info(f'{source.name} read all of its input')
+                    break
         finally:
             self.logger.info('Close topology')
             self.close()
 
+    def _compile(self) -> Callable[[], None]:
+        """Binds the nodes, their metrics and the callbacks once and returns a function that reads one item from the
+        source and passes it through the topology
+        """
+        skip_none = self.skip_none
+        source_read = self.source.read
+        op_apply = self.operator.apply
+        op_name = self.operator.name
+        sink_write = self.sink.write
+        source_values = self.node_metrics[self.source.name].values
+        op_metrics = self.node_metrics[self.operator.name]
+        op_values = op_metrics.values
+        sink_metrics = self.node_metrics[self.sink.name]
+        sink_values = sink_metrics.values
+        source_record = self.node_metrics[self.source.name].record
+        op_record = op_metrics.record
+        sink_record = sink_metrics.record
+        items_in = NodeMetrics.ITEMS_IN
+        items_out = NodeMetrics.ITEMS_OUT
+        logger = self.logger
+        debug = logger.isEnabledFor(logging.DEBUG)
+        clock = time.perf_counter_ns
+        # time spent in the downstream nodes, which is subtracted from the time of the calling node
+        downstream = [0, 0]
+
+        def op_out(data):
+            if data is None and skip_none:
+                return
+            if debug:
+                logger.debug('data after applying %s: %s', op_name, data)
+            op_values[items_out] += 1
+            sink_values[items_in] += 1
+            start = clock()
+            sink_write(data)
+            elapsed = clock() - start
+            sink_record(elapsed)
+            downstream[1] += elapsed
+
+        def read_out(data):
+            if data is None and skip_none:
+                return
+            if debug:
+                logger.debug('process data: %s', data)
+            source_values[items_out] += 1
+            op_values[items_in] += 1
+            downstream[1] = 0
+            start = clock()
+            op_apply(data, op_out)
+            elapsed = clock() - start
+            op_record(elapsed - downstream[1])
+            downstream[0] += elapsed
+
+        def read():
+            downstream[0] = 0
+            start = clock()
+            source_read(read_out)
+            source_record(clock() - start - downstream[0])
+
+        return read
+
+    def metrics(self) -> Dict[str, dict]:
+        return {'nodes': {name: metrics.snapshot() for name, metrics in self.node_metrics.items()}, 'edges': {},
+                'states': state_stats({self.operator.name: self.operator})}
+
     def pretty_string(self):
         return f"{self.source.name} -> {self.operator.pretty_string()} -> {self.sink.name}"
 
     def stop(self):
         self.logger.info('Stop environment')
         self.stop_signal.set()
-
+        if self.exporter is not None:
+            self.exporter.close()
@@ -0,0 +1,379 @@
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, Optional
+
+from glimmer.processing.join import JoinOperator
+from glimmer.util.context import Context
+
+
+class Aggregate:
+    """Incremental aggregation, the state of a window is a single accumulator per key.
+    merge combines the accumulators of two disjoint parts of a window, i.e.: the panes of a sliding window.
+    """
+
+    def zero(self):
+        raise NotImplementedError
+
+    def add(self, acc, value):
+        raise NotImplementedError
+
+    def merge(self, acc_1, acc_2):
+        raise NotImplementedError
+
+    def result(self, acc):
+        return acc
+
+
+class Sum(Aggregate):
+
+    def zero(self):
+        return 0
+
+    def add(self, acc, value):
+        return acc + value
+
+    def merge(self, acc_1, acc_2):
+        return acc_1 + acc_2
+
+
+class Count(Aggregate):
+
+    def zero(self):
+        return 0
+
+    def add(self, acc, value):
+        return acc + 1
+
+    def merge(self, acc_1, acc_2):
+        return acc_1 + acc_2
+
+
+class Min(Aggregate):
+
+    def zero(self):
+        return None
+
+    def add(self, acc, value):
+        return value if acc is None or value < acc else acc
+
+    def merge(self, acc_1, acc_2):
+        return acc_1 if acc_2 is None else self.add(acc_1, acc_2)
+
+
+class Max(Aggregate):
+
+    def zero(self):
+        return None
+
+    def add(self, acc, value):
+        return value if acc is None or value > acc else acc
+
+    def merge(self, acc_1, acc_2):
+        return acc_1 if acc_2 is None else self.add(acc_1, acc_2)
+
+
+class Mean(Aggregate):
+
+    def zero(self):
+        return 0, 0
+
+    def add(self, acc, value):
+        return acc[0] + value, acc[1] + 1
+
+    def merge(self, acc_1, acc_2):
+        return acc_1[0] + acc_2[0], acc_1[1] + acc_2[1]
+
+    def result(self, acc):
+        return acc[0] / acc[1] if acc[1] else None
+
+
+class Monoid(Aggregate):
+    """Custom aggregation from functions, i.e.: Monoid(set, lambda acc, v: acc | {v}, lambda a, b: a | b)
+    """
+
+    def __init__(self, zero: Callable[[], Any], add: Callable[[Any, Any], Any],
+                 merge: Callable[[Any, Any], Any], result: Callable[[Any], Any] = None):
+        """
+        :param zero: returns the accumulator of an empty window
+        :param add: returns the accumulator with the value added
+        :param merge: returns the combination of two accumulators, needed for sliding and session windows
+        :param result: returns the result of the window, the accumulator itself in case it is None
+        """
+        self.zero = zero
+        self.add = add
+        self.merge = merge
+        if result is not None:
+            self.result = result
+
+
+@dataclass
+class WindowResult:
+    key: Any
+    start: float
+    end: float
+    value: Any
+    # False for early results of a window that is still open
+    final: bool = True
+
+
+class WindowOperator(JoinOperator):
+    """Aggregates the items of all inputs per key and window and emits a WindowResult for each key once a window
+    closes. Windows extend JoinOperator, so environments pass the items of all inputs as they arrive and call
+    on_timer and on_end.
+
+    With a time_selector the windows are based on the time of the items (event time), a window closes once an item
+    arrived that is later than the end of the window plus the allowed lateness. Items of closed windows are dropped.
+    Without time_selector the windows are based on the wall clock (processing time) and close when on_timer is
+    called after their end, in environments without timers once the next item arrives.
+    In case trigger is set, early results of the open windows are emitted every trigger seconds of processing time.
+    The remaining windows are emitted once all inputs ended their stream.
+    """
+
+    def __init__(self, name: str = None, aggregate: Aggregate = None, key_selector: Callable = None,
+                 value_selector: Callable = None, time_selector: Callable = None, lateness: float = 0,
+                 trigger: float = None, ctx: Context = None):
+        """
+        :param aggregate: aggregation of the values of a window, Count by default
+        :param key_selector: returns the key of an item, None aggregates all items of a window together
+        :param value_selector: returns the value of an item that is aggregated, the item itself in case it is None
+        :param time_selector: returns the time of an item in seconds
+        :param lateness: seconds a window waits for late items, in event time
+        :param trigger: seconds of processing time between early results, None only emits final results
+        """
+        super().__init__(name, ctx=ctx)
+        self.aggregate = aggregate or Count()
+        # not stored as key_selector, which partitions the inputs of a node, see Node.key_by
+        self.window_key_selector = key_selector
+        self.value_selector = value_selector
+        self.time_selector = time_selector
+        self.lateness = lateness
+        self.trigger = trigger
+        if trigger is not None:
+            self.timer_interval = min(self.timer_interval, trigger)
+        self.next_trigger = None
+        # highest item time seen, in event time
+        self.max_time = float('-inf')
+        self.late = 0
+
+    def apply_input(self, input_name: str, data, out: Callable):
+        self.apply(data, out)
+
+    def apply(self, data, out: Callable):
+        if self.time_selector is None:
+            item_time = time.time()
+        else:
+            item_time = self.time_selector(data)
+            if item_time > self.max_time:
+                self.max_time = item_time
+        key = None if self.window_key_selector is None else self.window_key_selector(data)
+        value = data if self.value_selector is None else self.value_selector(data)
+        if not self.add(key, value, item_time):
+            self.late += 1
+            self.logger.debug(f'Dropped late item: {data}')
+        self.emit_closed(self.watermark(), out)
+
+    def watermark(self) -> float:
+        """Time up to which all windows are complete
+        """
+        if self.time_selector is None:
+            return time.time()
+        return self.max_time - self.lateness
+
+    def on_timer(self, now: float, out: Callable):
+        if self.time_selector is None:
+            self.emit_closed(time.time(), out)
+        if self.trigger is not None:
+            if self.next_trigger is None:
+                self.next_trigger = now + self.trigger
+            elif now >= self.next_trigger:
+                self.emit_open(out)
+                self.next_trigger = now + self.trigger
+
+    def on_end(self, out: Callable):
+        self.emit_closed(float('inf'), out)
+
+    def add(self, key, value, item_time: float) -> bool:
+        """Adds the value to the windows that contain the item time
+        :return: False in case the item is late
+        """
+        raise NotImplementedError
+
+    def emit_closed(self, watermark: float, out: Callable):
+        """Emits and evicts all windows that end before the watermark
+        """
+        raise NotImplementedError
+
+    def emit_open(self, out: Callable):
+        """Emits early results of all open windows
+        """
+        raise NotImplementedError
+
+
+class SlidingWindow(WindowOperator):
+    """Windows of size seconds that start every slide seconds.
+    Each item is only added to the pane it falls into, panes are slices of the length of the greatest common divisor
+    of size and slide, and the windows are combined from their panes when they close. The cost per item does
+    therefore not depend on how much the windows overlap.
+    """
+
+    def __init__(self, name: str = None, size: float = 1.0, slide: float = None, **kwargs):
+        """
+        :param size: length of a window in seconds
+        :param slide: seconds between the start of two windows, size by default, which results in tumbling windows
+        See WindowOperator for the other arguments
+        """
+        super().__init__(name, **kwargs)
+        if slide is None:
+            slide = size
+        if size <= 0 or slide <= 0:
+            raise AttributeError(f'Size and slide of window {self.name} must be positive, was: {size}, {slide}')
+        self.size = size
+        self.slide = slide
+        # microsecond resolution
+        self.pane = math.gcd(round(size * 1e6), round(slide * 1e6)) / 1e6
+        # pane start -> key -> accumulator
+        self.panes: Dict[float, Dict[Any, Any]] = dict()
+        # end of the next window that is emitted
+        self.next_end: Optional[float] = None
+        # end of the last emitted window
+        self.emitted = float('-inf')
+
+    def _first_end(self, item_time: float) -> float:
+        # the first window that contains the item ends at the next multiple of slide
+        return (math.floor(item_time / self.slide) + 1) * self.slide
+
+    def add(self, key, value, item_time: float) -> bool:
+        # the last window that contains the item was already emitted
+        if math.floor((item_time + self.size) / self.slide) * self.slide <= self.emitted:
+            return False
+        first_end = max(self._first_end(item_time), self.emitted + self.slide)
+        if self.next_end is None or first_end < self.next_end:
+            self.next_end = first_end
+        pane_start = math.floor(item_time / self.pane) * self.pane
+        pane = self.panes.get(pane_start)
+        if pane is None:
+            pane = dict()
+            self.panes[pane_start] = pane
+        aggregate = self.aggregate
+        acc = pane.get(key)
+        pane[key] = aggregate.add(aggregate.zero() if acc is None else acc, value)
+        return True
+
+    def _window(self, end: float) -> Dict[Any, Any]:
+        aggregate = self.aggregate
+        # pane starts are multiples of pane, half a pane absorbs the rounding errors of large times
+        tolerance = self.pane / 2
+        start = end - self.size - tolerance
+        end = end - tolerance
+        accs = dict()
+        for pane_start in sorted(self.panes.keys()):
+            if pane_start < start:
+                continue
+            if pane_start >= end:
+                break
+            for key, acc in self.panes[pane_start].items():
+                current = accs.get(key)
+                accs[key] = acc if current is None else aggregate.merge(current, acc)
+        return accs
+
+    def emit_closed(self, watermark: float, out: Callable):
+        while self.next_end is not None and self.next_end <= watermark:
+            end = self.next_end
+            for key, acc in self._window(end).items():
+                out(WindowResult(key, end - self.size, end, self.aggregate.result(acc)))
+            self.emitted = end
+            self.next_end = end + self.slide
+            # panes that no later window contains
+            horizon = self.next_end - self.size - self.pane / 2
+            for pane_start in [start for start in self.panes.keys() if start < horizon]:
+                del self.panes[pane_start]
+            if not self.panes:
+                self.next_end = None
+            elif min(self.panes.keys()) >= self.next_end - self.pane / 2:
+                # skip the empty windows
+                self.next_end = self._first_end(min(self.panes.keys()))
+
+    def emit_open(self, out: Callable):
+        if self.next_end is None:
+            return
+        last_end = self._first_end(max(self.panes.keys())) + self.size - self.slide
+        end = self.next_end
+        while end <= last_end:
+            for key, acc in self._window(end).items():
+                out(WindowResult(key, end - self.size, end, self.aggregate.result(acc), final=False))
+            end += self.slide
+
+
+class TumblingWindow(SlidingWindow):
+    """Consecutive windows of size seconds that do not overlap
+    """
+
+    def __init__(self, name: str = None, size: float = 1.0, **kwargs):
+        super().__init__(name, size=size, slide=size, **kwargs)
+
+
+class SessionWindow(WindowOperator):
+    """A window per key that lasts as long as items arrive, it closes once no item arrived for gap seconds.
+    The end of a session is the time of its last item plus the gap.
+    """
+
+    def __init__(self, name: str = None, gap: float = 1.0, **kwargs):
+        """
+        :param gap: seconds of inactivity after which a session closes
+        See WindowOperator for the other arguments
+        """
+        super().__init__(name, **kwargs)
+        if gap <= 0:
+            raise AttributeError(f'Gap of session window {self.name} must be positive, was: {gap}')
+        self.gap = gap
+        # key -> list of [start, end, accumulator], there are multiple sessions per key only in case of late items
+        self.sessions: Dict[Any, list] = dict()
+        # lower bound of the end of all open sessions, avoids scanning them for every item
+        self.next_close = float('inf')
+
+    def add(self, key, value, item_time: float) -> bool:
+        if item_time + self.gap <= self.watermark() and not self._extends_open(key, item_time):
+            return False
+        aggregate = self.aggregate
+        session = [item_time, item_time + self.gap, aggregate.add(aggregate.zero(), value)]
+        remaining = []
+        for other in self.sessions.get(key, []):
+            if other[0] <= session[1] and session[0] <= other[1]:
+                # overlapping sessions are merged into one
+                session = [min(session[0], other[0]), max(session[1], other[1]),
+                           aggregate.merge(other[2], session[2])]
+            else:
+                remaining.append(other)
+        remaining.append(session)
+        self.sessions[key] = remaining
+        self.next_close = min(self.next_close, session[1])
+        return True
+
+    def _extends_open(self, key, item_time: float) -> bool:
+        return any(start <= item_time + self.gap and item_time <= end for start, end, _ in self.sessions.get(key, []))
+
+    def emit_closed(self, watermark: float, out: Callable):
+        if watermark < self.next_close:
+            return
+        self.next_close = float('inf')
+        closed_keys = []
+        for key, sessions in self.sessions.items():
+            remaining = []
+            for session in sessions:
+                if session[1] <= watermark:
+                    out(WindowResult(key, session[0], session[1], self.aggregate.result(session[2])))
+                else:
+                    remaining.append(session)
+                    self.next_close = min(self.next_close, session[1])
+            if remaining:
+                sessions[:] = remaining
+            else:
+                closed_keys.append(key)
+        for key in closed_keys:
+            del self.sessions[key]
+
+    def emit_open(self, out: Callable):
+        for key, sessions in self.sessions.items():
+            for start, end, acc in sessions:
+                out(WindowResult(key, start, end, self.aggregate.result(acc), final=False))
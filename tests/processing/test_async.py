@@ -0,0 +1,156 @@
+import asyncio
+import queue
+import threading
+import unittest
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source, Operator, Sink, InvalidTopologyError
+from glimmer.processing.asynchronous import AsyncSource, AsyncOperator, AsyncSink
+from glimmer.util.context import Context
+
+
+class CountingAsyncSource(AsyncSource):
+
+    def __init__(self, name: str, n: int = 10):
+        self.name = name
+        super().__init__()
+        self.n = n
+        self.idx = 0
+
+    async def read(self, out):
+        if self.idx < self.n:
+            await out(self.idx)
+            self.idx += 1
+        else:
+            await asyncio.sleep(0.01)
+
+
+class AsyncDouble(AsyncOperator):
+    name = 'async-double'
+
+    async def apply(self, data, out):
+        await asyncio.sleep(0)
+        await out(data * 2)
+
+
+class QueueSink(AsyncSink):
+    name = 'queue-sink'
+
+    async def write(self, data):
+        self.ctx.get('q').put(data)
+
+
+class AsyncEnvironmentTest(unittest.TestCase):
+
+    def _start(self, sources, **kwargs):
+        env = factory.mk_async_env(sources, **kwargs)
+        env.start(use_thread=True)
+        self.addCleanup(env.join, 2)
+        self.addCleanup(env.stop)
+        return env
+
+    def test_async_nodes(self):
+        q = queue.Queue()
+        source = CountingAsyncSource('source')
+        source | AsyncDouble() | QueueSink(Context(config={'q': q}))
+        self._start([source])
+
+        received = [q.get(timeout=2) for _ in range(10)]
+        self.assertEqual(received, [i * 2 for i in range(10)])
+
+    def test_sync_nodes_are_offloaded(self):
+        loop_threads = set()
+
+        class SyncSource(Source):
+            name = 'sync-source'
+            idx = 0
+
+            def read(self, out):
+                loop_threads.add(threading.current_thread().name)
+                if self.idx < 5:
+                    out(self.idx)
+                    out(None)
+                    self.idx += 1
+
+        class SyncOp(Operator):
+            name = 'sync-op'
+
+            def apply(self, data, out):
+                out(data)
+                out(data + 100)
+
+        class SyncSink(Sink):
+            name = 'sync-sink'
+
+            def write(self, data):
+                self.ctx.get('q').put(data)
+
+        q = queue.Queue()
+        source = SyncSource()
+        source | SyncOp() | SyncSink(Context(config={'q': q}))
+        self._start([source], capacity=2)
+
+        received = [q.get(timeout=2) for _ in range(10)]
+        self.assertEqual(received, [0, 100, 1, 101, 2, 102, 3, 103, 4, 104])
+        self.assertTrue(all(name.startswith('glimmer') for name in loop_threads))
+
+    def test_many_sources(self):
+        q = queue.Queue()
+        sources = [CountingAsyncSource(f'source-{i}', n=1) for i in range(200)]
+        sink = QueueSink(Context(config={'q': q}))
+        for source in sources:
+            source | sink
+        self._start(sources)
+
+        received = q.get(timeout=2)
+        self.assertEqual(len(received), 200)
+        self.assertEqual(set(received.values()), {0})
+
+    def test_blocking_sources_do_not_starve(self):
+        # every source blocks in read until all of them read, which requires a thread per source
+        n = 40
+        barrier = threading.Barrier(n, timeout=2)
+
+        class BlockingSource(Source):
+            done = False
+
+            def __init__(self, name: str):
+                self.name = name
+                super().__init__()
+
+            def read(self, out):
+                if not self.done:
+                    self.done = True
+                    barrier.wait()
+                    out(self.name)
+
+        q = queue.Queue()
+        sink = QueueSink(Context(config={'q': q}))
+        sources = []
+        for i in range(n):
+            source = BlockingSource(f'blocking-source-{i}')
+            source | factory.mk_op(lambda data: data, f'op-{i}') | sink
+            sources.append(source)
+        self._start(sources)
+
+        received = q.get(timeout=3)
+        self.assertEqual(len(received), n)
+
+    def test_failing_node_stops_environment(self):
+        class FailingOp(AsyncOperator):
+            name = 'failing-op'
+
+            async def apply(self, data, out):
+                raise ValueError(data)
+
+        source = CountingAsyncSource('source')
+        source | FailingOp() | QueueSink(Context(config={'q': queue.Queue()}))
+        env = self._start([source])
+        env.join(2)
+        self.assertTrue(env.stop_signal.is_set())
+
+    def test_multiple_instances_not_supported(self):
+        source = CountingAsyncSource('source')
+        source | AsyncDouble().replicate(2) | QueueSink()
+        with self.assertRaises(InvalidTopologyError):
+            factory.mk_async_env([source])
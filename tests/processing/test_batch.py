@@ -0,0 +1,129 @@
+import queue
+import unittest
+
+import glimmer.processing.factory as factory
+from examples.taxi.nodes import TaxiData, Checkpoint, CalculateSpeedOp, VectorizedSpeedOp, haversine
+from glimmer.processing import Source, Operator, BatchOperator, BatchSink, compose_list
+from glimmer.processing.channel import EdgeConfig, EdgeReader, Batch, LocalChannel, EOS, MergedReader
+
+
+class Double(Operator):
+    name = 'double'
+
+    def apply(self, data, out):
+        out(data * 2)
+
+
+class BatchIncrement(BatchOperator):
+    name = 'batch-increment'
+
+    def __init__(self, calls: list = None) -> None:
+        super().__init__()
+        self.calls = calls
+
+    def apply_batch(self, items, out):
+        if self.calls is not None:
+            self.calls.append(len(items))
+        for item in items:
+            out(item + 1)
+
+
+class GetBatchTest(unittest.TestCase):
+
+    def test_available_items(self):
+        channel = LocalChannel()
+        reader = EdgeReader(channel)
+        channel.put(1)
+        channel.put(Batch([2, 3, 4]))
+        channel.put(5)
+        self.assertEqual(reader.get_batch(3), [1, 2, 3])
+        self.assertEqual(reader.get_batch(10), [4, 5])
+        with self.assertRaises(queue.Empty):
+            reader.get_batch(10, timeout=0)
+        self.assertEqual(reader.counters.snapshot()['received'], 5)
+
+    def test_marker_after_items(self):
+        channel = LocalChannel()
+        reader = EdgeReader(channel)
+        channel.put(Batch([1, 2]))
+        channel.put(EOS)
+        self.assertEqual(reader.get_batch(10), [1, 2])
+        self.assertIs(reader.get_batch(10), EOS)
+
+    def test_merged_reader(self):
+        channels = [LocalChannel(), LocalChannel()]
+        reader = MergedReader([EdgeReader(channel) for channel in channels])
+        channels[0].put(Batch([1, 2]))
+        channels[0].put(EOS)
+        channels[1].put(EOS)
+        self.assertEqual(reader.get_batch(10), [1, 2])
+        self.assertIs(reader.get_batch(10), EOS)
+
+
+class BatchApiTest(unittest.TestCase):
+
+    def test_apply_batch_calls_apply(self):
+        out = []
+        Double().apply_batch([1, 2], out.append)
+        self.assertEqual(out, [2, 4])
+
+    def test_apply_calls_apply_batch(self):
+        calls = []
+        out = []
+        BatchIncrement(calls).apply(1, out.append)
+        self.assertEqual((calls, out), ([1], [2]))
+
+    def test_chain_with_batch_head(self):
+        chain = compose_list([BatchIncrement(), Double()])
+        self.assertEqual(chain.batch_size, BatchIncrement.batch_size)
+        out = []
+        chain.apply_batch([1, 2], out.append)
+        self.assertEqual(out, [4, 6])
+
+    def test_parallel_environment(self):
+        class RangeSource(Source):
+            name = 'range-source'
+            idx = 0
+
+            def read(self, out):
+                if self.idx < 100:
+                    out(self.idx)
+                    self.idx += 1
+
+        class CollectingSink(BatchSink):
+            name = 'collecting-sink'
+
+            def write_batch(self, items):
+                q.put(list(items))
+
+        q = queue.Queue()
+        calls = []
+        source = RangeSource()
+        source | BatchIncrement(calls) | CollectingSink()
+        env = factory.mk_parallel_env([source], task_factory=factory.thread_factory(),
+                                      edge_config=EdgeConfig(batch_size=10))
+        env.start(use_thread=True)
+        self.addCleanup(env.close)
+        self.addCleanup(env.stop)
+
+        received = []
+        while len(received) < 100:
+            received.extend(q.get(timeout=2))
+        self.assertEqual(received, list(range(1, 101)))
+        self.assertEqual(sum(calls), 100)
+        self.assertGreater(max(calls), 1)
+        self.assertEqual(env.metrics()['nodes']['batch-increment']['items_in'], 100)
+
+
+class TaxiSpeedTest(unittest.TestCase):
+    positions = [TaxiData(1, 0.0, 116.30, 39.90), TaxiData(2, 0.0, 116.40, 39.80), TaxiData(1, 60.0, 116.31, 39.90)]
+
+    def test_speed_of_consecutive_positions(self):
+        expected = [0, 0, haversine(39.90, 116.30, 39.90, 116.31)]
+        for op in (CalculateSpeedOp(), VectorizedSpeedOp()):
+            out = []
+            op.apply_batch(self.positions, out.append)
+            self.assertEqual([taxi.speed for taxi in out][:2], expected[:2])
+            self.assertAlmostEqual(out[2].speed, expected[2])
+            self.assertGreater(out[2].speed, 0)
+            self.assertEqual(op.last_pos[1], Checkpoint(60.0, 116.31, 39.90))
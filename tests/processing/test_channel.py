@@ -0,0 +1,382 @@
+import multiprocessing
+import pickle
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source, Operator, Sink
+from glimmer.processing.channel import EdgeConfig, EdgeWriter, EdgeReader, Batch, LingerFlusher, RingBufferChannel, \
+    POISON, QueueChannel, EdgeCounters, BLOCK, DROP_OLDEST, DROP_NEWEST, LocalChannel, EOS, MergedReader, shared_memory, \
+    partition
+from glimmer.util.context import Context
+
+
+def _produce(channel, n):
+    for i in range(n):
+        channel.put(i)
+
+
+@unittest.skipUnless(shared_memory is not None, 'requires multiprocessing.shared_memory')
+class RingBufferChannelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.channel = RingBufferChannel(capacity=64)
+
+    def tearDown(self):
+        self.channel.close()
+
+    def test_put_get(self):
+        self.channel.put('a')
+        self.channel.put({'b': 1})
+        self.assertEqual(self.channel.get(), 'a')
+        self.assertEqual(self.channel.get(), {'b': 1})
+
+    def test_get_timeout(self):
+        with self.assertRaises(queue.Empty):
+            self.channel.get(timeout=0.01)
+
+    def test_wraps_around(self):
+        for i in range(100):
+            self.channel.put(f'item-{i}')
+            self.assertEqual(self.channel.get(), f'item-{i}')
+
+    def test_item_too_large(self):
+        with self.assertRaises(ValueError):
+            self.channel.put('x' * 100)
+
+    def test_interrupt(self):
+        self.channel.put(1)
+        self.channel.interrupt()
+        self.assertEqual(self.channel.get(), 1)
+        self.assertEqual(self.channel.get(), POISON)
+
+    def test_interrupt_wakes_blocked_get(self):
+        threading.Timer(0.05, self.channel.interrupt).start()
+        self.assertEqual(self.channel.get(timeout=2), POISON)
+
+    def test_blocked_put_waits_for_get(self):
+        producer = threading.Thread(target=_produce, args=(self.channel, 100))
+        producer.start()
+        received = [self.channel.get(timeout=2) for _ in range(100)]
+        producer.join(2)
+        self.assertEqual(received, list(range(100)))
+
+    def test_between_processes(self):
+        producer = multiprocessing.Process(target=_produce, args=(self.channel, 1000))
+        producer.start()
+        received = [self.channel.get(timeout=2) for _ in range(1000)]
+        producer.join(2)
+        self.assertEqual(received, list(range(1000)))
+
+
+class EdgeWriterTest(unittest.TestCase):
+
+    def test_unbatched_put(self):
+        q = queue.Queue()
+        writer = EdgeWriter(q)
+        writer.put(1)
+        self.assertEqual(q.get_nowait(), 1)
+
+    def test_batch_sent_when_full(self):
+        q = queue.Queue()
+        writer = EdgeWriter(q, EdgeConfig(batch_size=3, linger=10))
+        writer.put(1)
+        writer.put(2)
+        self.assertTrue(q.empty())
+        writer.put(3)
+        batch = q.get_nowait()
+        self.assertIsInstance(batch, Batch)
+        self.assertEqual(batch, [1, 2, 3])
+
+    def test_flusher_sends_expired_batch(self):
+        q = queue.Queue()
+        writer = EdgeWriter(q, EdgeConfig(batch_size=100, linger=0.01))
+        flusher = LingerFlusher([writer])
+        flusher.start()
+        try:
+            writer.put(1)
+            self.assertEqual(q.get(timeout=1), [1])
+        finally:
+            flusher.close()
+
+    def test_flusher_close_sends_remaining(self):
+        q = queue.Queue()
+        writer = EdgeWriter(q, EdgeConfig(batch_size=100, linger=10))
+        flusher = LingerFlusher([writer])
+        writer.put(1)
+        flusher.close()
+        self.assertEqual(q.get_nowait(), [1])
+
+
+class BoundedEdgeTest(unittest.TestCase):
+
+    def _edge(self, config: EdgeConfig):
+        channel = QueueChannel()
+        counters = EdgeCounters()
+        return EdgeWriter(channel, config, counters), EdgeReader(channel, counters), counters
+
+    def test_drop_newest(self):
+        writer, reader, counters = self._edge(EdgeConfig(capacity=2, policy=DROP_NEWEST))
+        for i in range(5):
+            writer.put(i)
+        self.assertEqual(counters.snapshot()['dropped_newest'], 3)
+        self.assertEqual([reader.get(), reader.get()], [0, 1])
+        self.assertEqual(counters.in_flight, 0)
+
+    def test_drop_oldest(self):
+        writer, reader, counters = self._edge(EdgeConfig(capacity=2, policy=DROP_OLDEST))
+        for i in range(5):
+            writer.put(i)
+        self.assertEqual(counters.snapshot()['dropped_oldest'], 3)
+        self.assertEqual([reader.get(), reader.get()], [3, 4])
+
+    def test_drop_oldest_counts_batches(self):
+        writer, reader, counters = self._edge(EdgeConfig(batch_size=2, linger=10, capacity=2, policy=DROP_OLDEST))
+        for i in range(6):
+            writer.put(i)
+        self.assertEqual(counters.snapshot()['dropped_oldest'], 4)
+        self.assertEqual(counters.in_flight, 2)
+        self.assertEqual([reader.get(), reader.get()], [4, 5])
+
+    def test_capacity_in_bytes(self):
+        writer, reader, counters = self._edge(EdgeConfig(capacity_bytes=1, policy=DROP_NEWEST))
+        writer.put(1)
+        writer.put(2)
+        self.assertEqual(reader.get(), 1)
+        writer.put(3)
+        self.assertEqual(reader.get(), 3)
+        self.assertEqual(counters.snapshot()['dropped_newest'], 1)
+
+    def test_capacity_in_bytes_pickles_once(self):
+        writer, reader, counters = self._edge(EdgeConfig(capacity_bytes=1 << 20, policy=DROP_NEWEST))
+        self.assertTrue(writer.channel.pickled)
+        writer.put(b'ab')
+        writer.put({'a': 1})
+        writer.end_stream()
+        self.assertEqual(writer.bytes_in_flight, len(pickle.dumps(b'ab', pickle.HIGHEST_PROTOCOL)) +
+                         len(pickle.dumps({'a': 1}, pickle.HIGHEST_PROTOCOL)))
+        self.assertEqual([reader.get(), reader.get()], [b'ab', {'a': 1}])
+        self.assertIs(reader.get(), EOS)
+
+    def test_block_until_consumed(self):
+        writer, reader, counters = self._edge(EdgeConfig(capacity=1, policy=BLOCK))
+        writer.open(multiprocessing.Event())
+        writer.put(1)
+
+        def consume():
+            time.sleep(0.05)
+            reader.get()
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        writer.put(2)
+        consumer.join()
+        self.assertEqual(counters.snapshot()['blocked'], 1)
+        self.assertEqual(counters.in_flight, 1)
+
+    def test_blocked_writer_gives_up_on_stop(self):
+        writer, reader, counters = self._edge(EdgeConfig(capacity=1, policy=BLOCK))
+        stop = multiprocessing.Event()
+        writer.open(stop)
+        writer.put(1)
+        threading.Timer(0.05, stop.set).start()
+        writer.put(2)
+        self.assertEqual(counters.in_flight, 1)
+
+    @unittest.skipUnless(shared_memory is not None, 'requires multiprocessing.shared_memory')
+    def test_drop_oldest_not_supported_by_ring_buffer(self):
+        channel = RingBufferChannel(capacity=64)
+        try:
+            with self.assertRaises(AttributeError):
+                EdgeWriter(channel, EdgeConfig(capacity=1, policy=DROP_OLDEST))
+        finally:
+            channel.close()
+
+
+class PartitionTest(unittest.TestCase):
+    keys = ['a', b'b', 1, True, None, 2.5, ('a', 1), ('a', ('b', b'c')), ('ab', 'c')]
+
+    def test_same_partition_in_every_process(self):
+        # string hashes are randomized per process unless PYTHONHASHSEED is set
+        script = f'from glimmer.processing.channel import partition; print([partition(k, 7) for k in {self.keys!r}])'
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        partitions = []
+        for seed in ('1', '2'):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            output = subprocess.check_output([sys.executable, '-c', script], env=env, cwd=root)
+            partitions.append(output.decode().strip())
+        self.assertEqual(partitions[0], partitions[1])
+        self.assertEqual(partitions[0], str([partition(key, 7) for key in self.keys]))
+
+    def test_equal_keys(self):
+        self.assertEqual(partition(True, 7), partition(1, 7))
+        self.assertNotEqual(partition(('ab', 'c'), 1 << 16), partition(('a', 'bc'), 1 << 16))
+
+
+class EdgeReaderTest(unittest.TestCase):
+
+    def test_unpacks_batches(self):
+        q = queue.Queue()
+        q.put(Batch([1, 2]))
+        q.put(3)
+        reader = EdgeReader(q)
+        self.assertEqual([reader.get(), reader.get(), reader.get()], [1, 2, 3])
+
+
+class EndOfStreamTest(unittest.TestCase):
+
+    @unittest.skipUnless(shared_memory is not None, 'requires multiprocessing.shared_memory')
+    def test_markers_keep_identity(self):
+        self.assertIs(pickle.loads(pickle.dumps(EOS)), EOS)
+        channel = RingBufferChannel(capacity=64)
+        self.addCleanup(channel.close)
+        channel.put(EOS)
+        self.assertIs(channel.get(), EOS)
+
+    def test_end_stream_flushes_batch(self):
+        channel = LocalChannel()
+        writer = EdgeWriter(channel, EdgeConfig(batch_size=10, linger=10))
+        writer.put(1)
+        writer.end_stream()
+        reader = EdgeReader(channel)
+        self.assertEqual(reader.get(), 1)
+        self.assertIs(reader.get(), EOS)
+
+    def test_merged_reader_waits_for_all_instances(self):
+        channels = [LocalChannel(), LocalChannel()]
+        reader = MergedReader([EdgeReader(channel) for channel in channels])
+        channels[0].put(EOS)
+        channels[1].put(1)
+        channels[1].put(EOS)
+        self.assertEqual(reader.get(timeout=1), 1)
+        self.assertIs(reader.get(timeout=1), EOS)
+
+    def test_merged_reader_blocks_until_an_item_arrives(self):
+        # queue channels are waited on at once, local channels one after another
+        for channel_type in (QueueChannel, LocalChannel):
+            channels = [channel_type() for _ in range(3)]
+            reader = MergedReader([EdgeReader(channel) for channel in channels])
+            with self.assertRaises(queue.Empty):
+                reader.get(timeout=0.01)
+            threading.Timer(0.05, channels[2].put, args=('item',)).start()
+            self.assertEqual(reader.get(timeout=2), 'item')
+
+    def test_drain_counts_discarded(self):
+        channel = LocalChannel()
+        counters = EdgeCounters()
+        for item in [1, 2, EOS]:
+            channel.put(item)
+        self.assertEqual(EdgeReader(channel, counters).drain(), 2)
+        self.assertEqual(counters.snapshot()['discarded'], 2)
+
+
+class ParallelTopologyChannelTest(unittest.TestCase):
+
+    def _run_topology(self, **kwargs):
+        class TestSource(Source):
+            name = 'test-source'
+            idx = 0
+
+            def read(self, out):
+                if self.idx < 10:
+                    out(self.idx)
+                    self.idx += 1
+
+        class TestOp(Operator):
+            name = 'test-op'
+
+            def apply(self, data, out):
+                out(data * 2)
+
+        class TestSink(Sink):
+            name = 'test-sink'
+
+            def write(self, data):
+                self.ctx.get('q').put(data)
+
+        q = multiprocessing.Queue()
+        source = TestSource()
+        op = TestOp()
+        sink = TestSink(Context(config={'q': q}))
+        source | op | sink
+
+        env = factory.mk_parallel_env([source], **kwargs)
+        env.start()
+
+        received = [q.get(timeout=2) for _ in range(10)]
+        self.assertEqual(received, [i * 2 for i in range(10)])
+        env.stop()
+        env.close()
+
+    def test_batched_edges_keep_item_semantics(self):
+        self._run_topology(edge_config=EdgeConfig(batch_size=4, linger=0.01),
+                           edge_configs={('test-op', 'test-sink'): EdgeConfig(batch_size=1)})
+
+    @unittest.skipUnless(shared_memory is not None, 'requires multiprocessing.shared_memory')
+    def test_ring_buffer_channels(self):
+        self._run_topology(channel_factory=factory.ring_buffer_channel(capacity=4096))
+
+    @unittest.skipUnless(shared_memory is not None, 'requires multiprocessing.shared_memory')
+    def test_ring_buffer_channels_with_threads(self):
+        self._run_topology(channel_factory=factory.ring_buffer_channel(capacity=4096),
+                           task_factory=factory.thread_factory())
+
+    def test_thread_factory_uses_local_channels(self):
+        class TestSource(Source):
+            name = 'test-source'
+            item = {'id': 1}
+
+            def read(self, out):
+                out(self.item)
+                time.sleep(0.01)
+
+        class TestSink(Sink):
+            name = 'test-sink'
+
+            def write(self, data):
+                self.ctx.get('q').put(data)
+
+        q = queue.Queue()
+        source = TestSource()
+        source | TestSink(Context(config={'q': q}))
+        env = factory.mk_parallel_env([source], task_factory=factory.thread_factory())
+        self.assertTrue(all(isinstance(channel, LocalChannel) for channel in env.topology.channels.values()))
+        env.start(use_thread=True)
+        self.addCleanup(env.close)
+        self.addCleanup(env.stop)
+
+        # passed by reference
+        self.assertIs(q.get(timeout=2), TestSource.item)
+
+    def test_thread_factory_in_forked_environment(self):
+        # the environment process forks after the local channels were created
+        self._run_topology(task_factory=factory.thread_factory())
+
+    def test_local_channel_after_fork(self):
+        channel = LocalChannel()
+        channel.put('parent')
+        q = multiprocessing.Queue()
+
+        def child():
+            channel.put('child')
+            q.put(channel.get(timeout=1))
+
+        p = multiprocessing.get_context('fork').Process(target=child)
+        p.start()
+        p.join(5)
+        # the child uses a new queue, the parent keeps its own
+        self.assertEqual(q.get(timeout=2), 'child')
+        self.assertEqual(channel.get(timeout=1), 'parent')
+
+    def test_in_process_flag(self):
+        source = factory.mk_src(lambda: 1, 'test-source')
+        source | factory.mk_sink(print, 'test-sink')
+        env = factory.mk_parallel_env([source], task_factory=factory.thread_factory(), in_process=False)
+        self.assertIsInstance(env.topology.channels[('test-source', 'test-sink')], QueueChannel)
+        env = factory.mk_parallel_env([source], in_process=True)
+        self.assertIsInstance(env.topology.channels[('test-source', 'test-sink')], LocalChannel)
@@ -0,0 +1,186 @@
+import os
+import queue
+import tempfile
+import time
+import unittest
+
+import glimmer.processing.factory as factory
+from glimmer.processing import InvalidTopologyError, Source
+from glimmer.processing.channel import BARRIER, EOS, EdgeReader, EdgeWriter, LocalChannel, MergedReader, EdgeConfig, \
+    EdgeCounters, DROP_OLDEST
+from glimmer.processing.checkpoint import Checkpointing, LATEST
+from tests.processing.test_state import Counter
+
+
+class RepeatSource(Source):
+
+    def __init__(self, name: str, item, times: int) -> None:
+        self.name = name
+        super().__init__()
+        self.item = item
+        self.times = times
+        self.idx = 0
+
+    def read(self, out):
+        if self.idx == self.times:
+            time.sleep(0.001)
+            return
+        self.idx += 1
+        out(self.item)
+
+    def position(self):
+        return self.idx
+
+    def restore(self, position):
+        self.idx = position
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def _latest(self) -> int:
+        try:
+            with open(os.path.join(self.directory, LATEST)) as fd:
+                return int(fd.read())
+        except FileNotFoundError:
+            return 0
+
+    def test_deltas_are_compacted_and_restored(self):
+        checkpointing = Checkpointing(self.directory, full_every=2)
+        checkpointing.prepare(['counter'])
+        checkpointer = checkpointing.checkpointer('counter')
+        counter = Counter()
+        checkpointer.restore(counter)
+        counter.counts['a'] = 1
+        counter.counts['b'] = 1
+        checkpointer.barrier(counter)
+        del counter.counts['a']
+        counter.counts['c'] = 1
+        checkpointer.barrier(counter)
+        counter.counts['b'] = 2
+        checkpointer.barrier(counter)
+        checkpointer.close()
+
+        checkpointing.requested.value = 3
+        self.assertEqual(checkpointing.complete(), 3)
+        files = sorted(os.listdir(os.path.join(self.directory, 'counter')))
+        self.assertEqual(files, ['1.delta', '2.delta', '2.full', '3.delta'])
+        self.assertEqual(set(checkpointer.load(3)['counts'].keys()), {'b', 'c'})
+
+        restarted = Checkpointing(self.directory)
+        restarted.prepare(['counter'])
+        counter = Counter()
+        self.assertEqual(restarted.checkpointer('counter').restore(counter), 2)
+        self.assertEqual(dict(counter.counts.items()), {'b': 2, 'c': 1})
+
+    def test_incomplete_checkpoints_are_removed(self):
+        checkpointing = Checkpointing(self.directory)
+        checkpointing.prepare(['counter', 'sink'])
+        checkpointer = checkpointing.checkpointer('counter')
+        counter = Counter()
+        checkpointer.restore(counter)
+        counter.counts['a'] = 1
+        checkpointer.barrier(counter)
+        checkpointer.close()
+        # the sink did not acknowledge the checkpoint
+        checkpointing.requested.value = 1
+        checkpointing.acks['sink'].value = 0
+        self.assertEqual(checkpointing.complete(), 0)
+
+        Checkpointing(self.directory).prepare(['counter', 'sink'])
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'counter')), [])
+
+    def test_merged_reader_aligns_barriers(self):
+        channels = [LocalChannel(), LocalChannel()]
+        writers = [EdgeWriter(channel) for channel in channels]
+        reader = MergedReader([EdgeReader(channel) for channel in channels])
+        writers[0].put(1)
+        writers[0].barrier()
+        writers[0].put(2)
+        writers[1].put(3)
+        writers[1].barrier()
+        writers[1].end_stream()
+        writers[0].end_stream()
+
+        items = [reader.get() for _ in range(4)]
+        self.assertEqual(sorted(items[:2]), [1, 3])
+        self.assertIs(items[2], BARRIER)
+        self.assertEqual(items[3], 2)
+        self.assertIs(reader.get(), EOS)
+
+    def test_lossy_edge_keeps_barrier(self):
+        channel = LocalChannel()
+        counters = EdgeCounters()
+        writer = EdgeWriter(channel, EdgeConfig(capacity=2, policy=DROP_OLDEST), counters)
+        reader = EdgeReader(channel, counters)
+        writer.put(1)
+        writer.barrier()
+        for i in range(2, 6):
+            writer.put(i)
+
+        received = []
+        while True:
+            try:
+                received.append(reader.get(timeout=0.01))
+            except queue.Empty:
+                break
+        # the barrier is not evicted, items published after it are dropped instead of overtaking it
+        self.assertEqual(received, [BARRIER, 2, 3])
+        stats = counters.snapshot()
+        self.assertEqual((stats['dropped_oldest'], stats['dropped_newest']), (1, 2))
+        self.assertEqual(counters.in_flight, 0)
+
+    def test_checkpoints_complete_with_lossy_edges(self):
+        source = RepeatSource('source', 'a', 1000)
+        source | Counter() | factory.mk_sink(lambda item: time.sleep(0.001), 'sink')
+        checkpointing = Checkpointing(self.directory, interval=0.02)
+        env = factory.mk_parallel_env([source], task_factory=factory.thread_factory(), checkpointing=checkpointing,
+                                      edge_config=EdgeConfig(capacity=2, policy=DROP_OLDEST))
+        env.start(use_thread=True)
+        self.addCleanup(env.close)
+        deadline = time.monotonic() + 5
+        while self._latest() < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        env.stop()
+        env.join()
+        self.assertGreaterEqual(self._latest(), 3)
+
+    def test_multiple_inputs_require_join(self):
+        source_1 = RepeatSource('source-1', 'a', 1)
+        source_2 = RepeatSource('source-2', 'b', 1)
+        op = factory.mk_op(lambda items: items, 'zip')
+        op.receive_from([source_1, source_2])
+        op | factory.mk_sink(print, 'sink')
+        with self.assertRaises(InvalidTopologyError):
+            factory.mk_parallel_env([source_1, source_2], checkpointing=Checkpointing(self.directory))
+
+    def _run(self, times: int, items: int) -> list:
+        q = queue.Queue()
+        source = RepeatSource('source', 'a', times)
+        counter = Counter().key_by(lambda data: data, parallelism=2)
+        source | counter | factory.mk_sink(q.put, 'sink')
+        checkpointing = Checkpointing(self.directory, interval=0.02, full_every=3)
+        env = factory.mk_parallel_env([source], task_factory=factory.thread_factory(), checkpointing=checkpointing)
+        env.start(use_thread=True)
+        outputs = [q.get(timeout=2) for _ in range(items)]
+        # wait for a checkpoint that was triggered after the items were processed
+        latest = self._latest()
+        deadline = time.monotonic() + 5
+        while self._latest() < latest + 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        env.stop()
+        env.join()
+        env.close()
+        while not q.empty():
+            outputs.append(q.get())
+        return outputs
+
+    def test_parallel_environment_restores_state(self):
+        self.assertEqual(self._run(5, 5)[-1], ('a', 5))
+        self.assertGreaterEqual(self._latest(), 2)
+        # the source continues after the 5 items it read, which the restored counts contain
+        self.assertEqual(self._run(8, 3), [('a', 6), ('a', 7), ('a', 8)])
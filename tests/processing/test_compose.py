@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import Mock
 
-from glimmer.processing import Operator, In, composition
+from glimmer.processing import Operator, In, composition, compose_list, ChainedOperator
 
 
 class Op(Operator):
@@ -11,6 +11,24 @@ class Op(Operator):
         out(data)
 
 
+class FlatMap(Operator):
+
+    def __init__(self, name: str, events: list = None) -> None:
+        self.name = name
+        super().__init__()
+        self.events = events
+
+    def apply(self, data, out):
+        for item in data:
+            out(item)
+
+    def open(self):
+        self.events.append(f'open {self.name}')
+
+    def close(self):
+        self.events.append(f'close {self.name}')
+
+
 class CompositionTest(unittest.TestCase):
 
     def test_composition(self):
@@ -20,3 +38,41 @@ class CompositionTest(unittest.TestCase):
         mock = Mock()
         composed.apply('asdf', mock)
         mock.assert_called_with('asdf')
+
+    def test_compositions_are_flattened(self):
+        op1, op2, op3 = Op(), Op(), Op()
+        composed = op1 - op2 - op3
+        self.assertIsInstance(composed, ChainedOperator)
+        self.assertEqual(composed.operators, [op1, op2, op3])
+        self.assertEqual(composed.name, '(Op -> Op -> Op)')
+
+
+class ChainedOperatorTest(unittest.TestCase):
+
+    def test_fan_out_within_chain(self):
+        chain = compose_list([FlatMap('split'), FlatMap('chars'), Op()])
+        out = []
+        chain.apply(['ab', 'c'], out.append)
+        self.assertEqual(out, ['a', 'b', 'c'])
+
+    def test_out_per_call(self):
+        chain = compose_list([Op(), Op()])
+        first, second = [], []
+        chain.apply(1, first.append)
+        chain.apply(2, second.append)
+        self.assertEqual((first, second), ([1], [2]))
+
+    def test_fail_fast(self):
+        out = []
+        ChainedOperator([FlatMap('split'), Op()]).apply([None, 1], out.append)
+        self.assertEqual(out, [1])
+        out = []
+        ChainedOperator([FlatMap('split'), Op()], fail_fast=False).apply([None, 1], out.append)
+        self.assertEqual(out, [None, 1])
+
+    def test_open_and_close_all(self):
+        events = []
+        chain = compose_list([FlatMap('first', events), FlatMap('second', events)])
+        chain.open()
+        chain.close()
+        self.assertEqual(events, ['open first', 'open second', 'close first', 'close second'])
@@ -0,0 +1,114 @@
+import multiprocessing
+import queue
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source
+from glimmer.processing.exporter import render, MetricsExporter, CONTENT_TYPE
+from glimmer.processing.metrics import NodeMetrics
+
+
+class CountingSource(Source):
+    name = 'counting-source'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.idx = 0
+
+    def read(self, out):
+        if self.idx < 3:
+            out(self.idx)
+            self.idx += 1
+        else:
+            time.sleep(0.01)
+
+
+def _scrape(port: int, path: str = '/metrics'):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=2) as response:
+        return response.headers['Content-Type'], response.read().decode('utf-8')
+
+
+class RenderTest(unittest.TestCase):
+
+    def test_open_metrics_format(self):
+        metrics = NodeMetrics()
+        metrics.values[NodeMetrics.ITEMS_IN] = 3
+        metrics.record(500)
+        metrics.record(3000)
+        text = render({'nodes': {'op "a"': metrics.snapshot()},
+                       'edges': {('src', 'op'): {'sent': 5, 'blocked_us': 2000000, 'in_flight': 1}}})
+        lines = text.splitlines()
+        self.assertEqual(lines[-1], '# EOF')
+        self.assertIn('# TYPE glimmer_node_items_in counter', lines)
+        self.assertIn('glimmer_node_items_in_total{node="op \\"a\\""} 3', lines)
+        self.assertIn('glimmer_node_latency_seconds_bucket{node="op \\"a\\"",le="1.024e-06"} 1', lines)
+        self.assertIn('glimmer_node_latency_seconds_bucket{node="op \\"a\\"",le="4.096e-06"} 2', lines)
+        self.assertIn('glimmer_node_latency_seconds_bucket{node="op \\"a\\"",le="+Inf"} 2', lines)
+        self.assertIn('glimmer_node_latency_seconds_count{node="op \\"a\\""} 2', lines)
+        self.assertIn('glimmer_edge_sent_total{source="src",target="op"} 5', lines)
+        self.assertIn('glimmer_edge_blocked_seconds_total{source="src",target="op"} 2.0', lines)
+        self.assertIn('# TYPE glimmer_edge_in_flight gauge', lines)
+        self.assertIn('glimmer_edge_in_flight{source="src",target="op"} 1', lines)
+
+
+class MetricsExporterTest(unittest.TestCase):
+
+    def test_parallel_environment_with_processes(self):
+        q = multiprocessing.Queue()
+        source = CountingSource()
+        source | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_parallel_env([source], metrics_port=0)
+        env.start()
+        self.addCleanup(env.close)
+        self.addCleanup(env.stop)
+        [q.get(timeout=2) for _ in range(3)]
+
+        content_type, text = _scrape(env.exporter.port)
+        self.assertEqual(content_type, CONTENT_TYPE)
+        self.assertIn('glimmer_node_items_out_total{node="counting-source"} 3', text)
+        self.assertIn('glimmer_edge_in_flight{source="counting-source",target="sink"}', text)
+
+        with self.assertRaises(urllib.error.HTTPError):
+            _scrape(env.exporter.port, '/other')
+
+    def test_synchronous_environment(self):
+        q = queue.Queue()
+        source = CountingSource()
+        source | factory.mk_op(lambda data: data, 'identity') | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_synchronous_env(source, metrics_port=0)
+        env.start(use_thread=True)
+        [q.get(timeout=2) for _ in range(3)]
+
+        _, text = _scrape(env.exporter.port)
+        self.assertIn('glimmer_node_items_in_total{node="sink"} 3', text)
+        env.stop()
+        self.assertFalse(env.exporter.running)
+
+    def test_started_once(self):
+        for mk_env in (lambda source: factory.mk_parallel_env([source], task_factory=factory.thread_factory(),
+                                                              metrics_port=0),
+                       lambda source: factory.mk_synchronous_env(source, metrics_port=0)):
+            q = queue.Queue()
+            source = CountingSource()
+            source | factory.mk_op(lambda data: data, 'identity') | factory.mk_sink(q.put, 'sink')
+            env = mk_env(source)
+            with patch.object(MetricsExporter, 'start', autospec=True) as start:
+                env.start(use_thread=True)
+                [q.get(timeout=2) for _ in range(3)]
+                env.stop()
+                env.p.join(2)
+            self.assertEqual(start.call_count, 1)
+
+    def test_exporter_for_any_environment(self):
+        source = CountingSource()
+        source | factory.mk_sink(lambda data: None, 'sink')
+        env = factory.mk_async_env([source])
+        exporter = MetricsExporter(env, port=0)
+        exporter.start()
+        self.addCleanup(exporter.close)
+        _, text = _scrape(exporter.port)
+        self.assertIn('glimmer_node_items_in_total{node="sink"} 0', text)
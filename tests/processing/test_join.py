@@ -0,0 +1,174 @@
+import queue
+import time
+import unittest
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source, Sink
+from glimmer.processing.join import KeyedJoin, WindowedJoin, LatestJoin
+from glimmer.util.context import Context
+
+
+def _connect(join):
+    join.receive_from([factory.mk_src(lambda: None, 'left'), factory.mk_src(lambda: None, 'right')])
+    return join
+
+
+class KeyedJoinTest(unittest.TestCase):
+
+    def test_matches_by_key(self):
+        join = _connect(KeyedJoin('join', key_selector=lambda item: item[0]))
+        out = []
+        join.apply_input('left', (1, 'a'), out.append)
+        join.apply_input('left', (2, 'b'), out.append)
+        join.apply_input('right', (2, 'B'), out.append)
+        self.assertEqual(out, [{'left': (2, 'b'), 'right': (2, 'B')}])
+        self.assertEqual(list(join.pending.keys()), [1])
+
+    def test_key_selector_per_input(self):
+        join = _connect(KeyedJoin('join', key_selector={'left': lambda item: item['id'], 'right': lambda item: item}))
+        out = []
+        join.apply_input('right', 7, out.append)
+        join.apply_input('left', {'id': 7}, out.append)
+        self.assertEqual(out, [{'right': 7, 'left': {'id': 7}}])
+
+    def test_key_by_keeps_join_key(self):
+        join = _connect(KeyedJoin('join', key_selector={'left': lambda item: item['id'], 'right': lambda item: item}))
+        join.key_by(lambda item: 0)
+        out = []
+        join.apply_input('right', 7, out.append)
+        join.apply_input('left', {'id': 7}, out.append)
+        self.assertEqual(out, [{'right': 7, 'left': {'id': 7}}])
+
+    def test_timeout_evicts_partial(self):
+        join = _connect(KeyedJoin('join', timeout={'right': 0.5}, emit_partial=True))
+        out = []
+        join.apply_input('left', 1, out.append)
+        join.on_timer(time.monotonic(), out.append)
+        self.assertEqual(out, [])
+        join.on_timer(time.monotonic() + 1, out.append)
+        self.assertEqual(out, [{'left': 1, 'right': None}])
+        self.assertEqual(join.evicted, 1)
+
+    def test_bounded_state(self):
+        join = _connect(KeyedJoin('join', max_pending=2))
+        out = []
+        for i in range(5):
+            join.apply_input('left', i, out.append)
+        self.assertEqual(list(join.pending.keys()), [3, 4])
+        self.assertEqual(out, [])
+
+
+class WindowedJoinTest(unittest.TestCase):
+
+    def test_event_time_windows(self):
+        join = _connect(WindowedJoin('join', size=10, time_selector=lambda item: item))
+        out = []
+        for item in [1, 5, 12]:
+            join.apply_input('left', item, out.append)
+        join.apply_input('right', 3, out.append)
+        self.assertEqual(out, [])
+        join.apply_input('right', 11, out.append)
+        self.assertEqual(out, [{'left': [1, 5], 'right': [3]}])
+
+        # window is closed
+        join.apply_input('right', 4, out.append)
+        self.assertEqual(len(out), 1)
+
+    def test_stalled_input_is_not_waited_for(self):
+        join = _connect(WindowedJoin('join', size=10, time_selector=lambda item: item, timeout=0.5))
+        join.open()
+        out = []
+        join.apply_input('left', 1, out.append)
+        join.apply_input('left', 15, out.append)
+        self.assertEqual(out, [])
+        join.on_timer(time.monotonic() + 1, out.append)
+        self.assertEqual(out, [{'left': [1], 'right': []}])
+
+    def test_groups_by_key(self):
+        join = _connect(WindowedJoin('join', size=10, key_selector=lambda item: item % 2,
+                                     time_selector=lambda item: item))
+        out = []
+        for item in [1, 2, 3]:
+            join.apply_input('left', item, out.append)
+        join.apply_input('right', 4, out.append)
+        join.apply_input('left', 20, out.append)
+        join.apply_input('right', 20, out.append)
+        self.assertEqual(out, [{'left': [1, 3], 'right': []}, {'left': [2], 'right': [4]}])
+
+
+class LatestJoinTest(unittest.TestCase):
+
+    def test_emits_latest_values(self):
+        join = _connect(LatestJoin('join'))
+        out = []
+        join.apply_input('left', 1, out.append)
+        join.apply_input('left', 2, out.append)
+        join.apply_input('right', 'a', out.append)
+        join.apply_input('left', 3, out.append)
+        self.assertEqual(out, [{'left': 2, 'right': 'a'}, {'left': 3, 'right': 'a'}])
+
+    def test_missing_input_after_timeout(self):
+        join = _connect(LatestJoin('join', timeout=0))
+        out = []
+        join.apply_input('left', 1, out.append)
+        self.assertEqual(out, [{'left': 1, 'right': None}])
+
+
+class JoinEnvironmentTest(unittest.TestCase):
+
+    def _topology(self):
+        class FastSource(Source):
+            name = 'fast'
+            idx = 0
+
+            def read(self, out):
+                if self.idx < 5:
+                    out(self.idx)
+                    self.idx += 1
+                else:
+                    time.sleep(0.01)
+
+        class SlowSource(Source):
+            name = 'slow'
+            idx = 4
+
+            def read(self, out):
+                time.sleep(0.02)
+                if self.idx >= 0:
+                    out(self.idx)
+                    self.idx -= 1
+
+        class TestSink(Sink):
+            name = 'test-sink'
+
+            def write(self, data):
+                self.ctx.get('q').put(data)
+
+        q = queue.Queue()
+        fast = FastSource()
+        slow = SlowSource()
+        join = KeyedJoin('join')
+        join.receive_from([fast, slow])
+        join | TestSink(Context(config={'q': q}))
+        return [fast, slow], q
+
+    def _assert_joined(self, q):
+        received = [q.get(timeout=2) for _ in range(5)]
+        # the slow input sends the keys in reverse order, which a lockstep join could not match
+        self.assertEqual(received, [{'fast': i, 'slow': i} for i in reversed(range(5))])
+
+    def test_parallel_environment(self):
+        sources, q = self._topology()
+        env = factory.mk_parallel_env(sources, task_factory=factory.thread_factory())
+        env.start(use_thread=True)
+        self.addCleanup(env.close)
+        self.addCleanup(env.stop)
+        self._assert_joined(q)
+
+    def test_async_environment(self):
+        sources, q = self._topology()
+        env = factory.mk_async_env(sources)
+        env.start(use_thread=True)
+        self.addCleanup(env.join, 2)
+        self.addCleanup(env.stop)
+        self._assert_joined(q)
@@ -0,0 +1,168 @@
+import multiprocessing
+import queue
+import time
+import unittest
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source, Operator
+from glimmer.processing.metrics import NodeMetrics
+
+
+class NodeMetricsTest(unittest.TestCase):
+
+    def test_histogram(self):
+        metrics = NodeMetrics()
+        metrics.record(500)
+        metrics.record(3000)
+        metrics.record(10 ** 12)
+        histogram = metrics.histogram
+        self.assertEqual(histogram[0], 1)
+        self.assertEqual(histogram[2], 1)
+        self.assertEqual(histogram[-1], 1)
+        self.assertEqual(metrics.percentile(50), 4.096)
+
+    def test_snapshot(self):
+        metrics = NodeMetrics()
+        metrics.start()
+        metrics.values[NodeMetrics.ITEMS_IN] += 2
+        metrics.record(2000)
+        metrics.record(4000)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['items_in'], 2)
+        self.assertEqual(snapshot['calls'], 2)
+        self.assertAlmostEqual(snapshot['latency_mean_us'], 3.0)
+        self.assertGreater(snapshot['utilization'], 0)
+
+
+class RangeSource(Source):
+    name = 'range-source'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.idx = 0
+
+    def read(self, out):
+        if self.idx < 10:
+            out(self.idx)
+            self.idx += 1
+        else:
+            time.sleep(0.01)
+
+
+class EvenFilter(Operator):
+    name = 'even'
+
+    def apply(self, data, out):
+        time.sleep(0.001)
+        if data % 2 == 0:
+            out(data)
+
+
+class SlowDouble(Operator):
+    name = 'slow-double'
+
+    def apply(self, data, out):
+        time.sleep(0.005)
+        out(data * 2)
+
+
+class EnvironmentMetricsTest(unittest.TestCase):
+
+    def _assert_counts(self, metrics):
+        nodes = metrics['nodes']
+        self.assertEqual(nodes['range-source']['items_out'], 10)
+        self.assertEqual(nodes['even']['items_in'], 10)
+        self.assertEqual(nodes['even']['items_out'], 5)
+        self.assertEqual(nodes['sink']['items_in'], 5)
+        self.assertGreater(nodes['even']['busy_s'], 0.005)
+        self.assertGreaterEqual(nodes['even']['latency_p50_us'], 1000)
+
+    def _wait_for_sink(self, env, items):
+        self._wait_for(env, 'sink', 'items_in', items)
+
+    def _wait_for(self, env, node, key, value):
+        deadline = time.monotonic() + 2
+        while env.metrics()['nodes'][node][key] < value and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_parallel_environment_with_processes(self):
+        q = multiprocessing.Queue()
+        source = RangeSource()
+        source | EvenFilter() | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_parallel_env([source])
+        env.start()
+        self.addCleanup(env.close)
+        self.addCleanup(env.stop)
+
+        [q.get(timeout=2) for _ in range(5)]
+        self._wait_for_sink(env, 5)
+        self._wait_for(env, 'even', 'calls', 10)
+        metrics = env.metrics()
+        self._assert_counts(metrics)
+        self.assertEqual(metrics['edges'][('range-source', 'even')]['in_flight'], 0)
+        self.assertGreater(metrics['nodes']['sink']['wait_s'], 0)
+
+    def _assert_chain_counts(self, metrics):
+        nodes = metrics['nodes']
+        self.assertEqual(nodes['(even -> slow-double)']['items_in'], 10)
+        self.assertEqual(nodes['even']['items_in'], 10)
+        self.assertEqual(nodes['even']['items_out'], 5)
+        self.assertEqual(nodes['slow-double']['items_in'], 5)
+        self.assertEqual(nodes['slow-double']['items_out'], 5)
+        self.assertGreaterEqual(nodes['slow-double']['latency_mean_us'], 5000)
+        # the time spent in slow-double is not part of the latency of even
+        self.assertLess(nodes['even']['latency_mean_us'], 3000)
+
+    def test_parallel_environment_reports_operators_of_chains(self):
+        q = multiprocessing.Queue()
+        source = RangeSource()
+        source | EvenFilter() | SlowDouble() | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_parallel_env([source], fuse=True)
+        env.start()
+        self.addCleanup(env.close)
+        self.addCleanup(env.stop)
+
+        [q.get(timeout=2) for _ in range(5)]
+        self._wait_for_sink(env, 5)
+        self._wait_for(env, 'even', 'calls', 10)
+        self._assert_chain_counts(env.metrics())
+
+    def test_synchronous_environment(self):
+        q = queue.Queue()
+        source = RangeSource()
+        source | EvenFilter() | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_synchronous_env(source)
+        env.start(use_thread=True)
+        self.addCleanup(env.stop)
+
+        [q.get(timeout=2) for _ in range(5)]
+        self._wait_for_sink(env, 5)
+        self._wait_for(env, 'even', 'calls', 10)
+        self._assert_counts(env.metrics())
+
+    def test_synchronous_environment_reports_operators_of_chains(self):
+        q = queue.Queue()
+        source = RangeSource()
+        source | EvenFilter() | SlowDouble() | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_synchronous_env(source)
+        env.start(use_thread=True)
+        self.addCleanup(env.stop)
+
+        [q.get(timeout=2) for _ in range(5)]
+        self._wait_for_sink(env, 5)
+        self._wait_for(env, 'even', 'calls', 10)
+        self._assert_chain_counts(env.metrics())
+
+    def test_async_environment(self):
+        q = queue.Queue()
+        source = RangeSource()
+        source | EvenFilter() | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_async_env([source])
+        env.start(use_thread=True)
+        self.addCleanup(env.join, 2)
+        self.addCleanup(env.stop)
+
+        [q.get(timeout=2) for _ in range(5)]
+        self._wait_for_sink(env, 5)
+        self._wait_for(env, 'even', 'calls', 10)
+        self._assert_counts(env.metrics())
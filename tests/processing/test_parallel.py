@@ -1,9 +1,12 @@
 import logging
 import multiprocessing
+import time
 import unittest
 
 import glimmer.processing.factory as factory
-from glimmer.processing import Source, Operator, Sink
+from glimmer.processing import Source, Operator, Sink, InvalidTopologyError
+from glimmer.processing.channel import LEAST_LOADED
+from glimmer.processing.parallel import find_chains, mk_parallel_topology
 from glimmer.util.context import Context
 
 logging.basicConfig(level=logging.DEBUG)
@@ -295,3 +298,252 @@ class ParallelTopologyTest(unittest.TestCase):
 
         env.stop()
         env.close()
+
+
+class FusionTest(unittest.TestCase):
+
+    def test_find_chains(self):
+        source = factory.mk_src(lambda: 1, 'source')
+        op1 = factory.mk_op(lambda x: x + 1, 'op-1')
+        op2 = factory.mk_op(lambda x: x + 1, 'op-2')
+        op3 = factory.mk_op(lambda x: x + 1, 'op-3')
+        op4 = factory.mk_op(lambda x: x + 1, 'op-4')
+        op5 = factory.mk_op(lambda x: x + 1, 'op-5')
+        sink = factory.mk_sink(print, 'sink')
+
+        source | op1 | op2 | [op3, op4]
+        op3 | op5 | sink
+        op4 | sink
+
+        chains = find_chains([op1, op2, op3, op4, op5])
+        names = [[op.name for op in chain] for chain in chains]
+        self.assertEqual(names, [['op-1', 'op-2'], ['op-3', 'op-5'], ['op-4']])
+
+    def test_find_chains_respects_chainable(self):
+        source = factory.mk_src(lambda: 1, 'source')
+        op1 = factory.mk_op(lambda x: x + 1, 'op-1')
+        op2 = factory.mk_op(lambda x: x + 1, 'op-2')
+        op3 = factory.mk_op(lambda x: x + 1, 'op-3')
+        sink = factory.mk_sink(print, 'sink')
+        op2.chainable = False
+
+        source | op1 | op2 | op3 | sink
+
+        chains = find_chains([op1, op2, op3])
+        self.assertEqual(len(chains), 3)
+
+    def test_fused_topology(self):
+        q = multiprocessing.Queue()
+        source = factory.mk_src(lambda: 1, 'source')
+        op1 = factory.mk_op(lambda x: x + 1, 'op-1')
+        op2 = factory.mk_op(lambda x: x * 3, 'op-2')
+        op3 = factory.mk_op(lambda x: x - 1, 'op-3')
+        sink = factory.mk_sink(q.put, 'sink')
+
+        source | op1 | op2 | op3 | sink
+
+        env = factory.mk_parallel_env([source], fuse=True)
+        self.assertEqual(len(env.topology.operators), 1)
+        self.assertEqual(list(env.topology.queues.keys()), [('source', 'op-1'), ('op-3', 'sink')])
+
+        env.start()
+        self.assertEqual(q.get(timeout=2), 5)
+        env.stop()
+        env.close()
+
+
+class CountingSource(Source):
+    name = 'counting-source'
+
+    def __init__(self, ctx: Context = None) -> None:
+        super().__init__(ctx)
+        self.idx = 0
+
+    def read(self, out):
+        if self.idx < 30:
+            out('abc'[self.idx % 3])
+            self.idx += 1
+
+
+class KeyedCounter(Operator):
+    name = 'keyed-counter'
+
+    def __init__(self, ctx: Context = None) -> None:
+        super().__init__(ctx)
+        self.counts = dict()
+
+    def apply(self, data, out):
+        count = self.counts.get(data, 0) + 1
+        self.counts[data] = count
+        out((data, count))
+
+
+class KeyPartitionTest(unittest.TestCase):
+
+    def _run_keyed(self, task_factory):
+        q = multiprocessing.Queue()
+        source = CountingSource()
+        counter = KeyedCounter().key_by(lambda word: word, parallelism=2)
+        sink = factory.mk_sink(q.put, 'sink')
+        source | counter | sink
+
+        env = factory.mk_parallel_env([source], task_factory=task_factory)
+        env.start()
+        received = [q.get(timeout=2) for _ in range(30)]
+        env.stop()
+        env.close()
+
+        # each key is counted by a single instance, therefore the counts of each key are complete and ordered
+        for key in 'abc':
+            self.assertEqual([count for word, count in received if word == key], list(range(1, 11)))
+
+    def test_keyed_instances_with_processes(self):
+        self._run_keyed(factory.process_factory())
+
+    def test_keyed_instances_with_threads(self):
+        self._run_keyed(factory.thread_factory())
+
+    def test_instances_and_edges(self):
+        source = CountingSource()
+        counter = KeyedCounter().key_by(lambda word: word, parallelism=3)
+        sink = factory.mk_sink(print, 'sink')
+        source | counter | sink
+
+        topology = mk_parallel_topology([source])
+        self.assertEqual([op.name for op in topology.operators],
+                         ['keyed-counter[0]', 'keyed-counter[1]', 'keyed-counter[2]'])
+        self.assertEqual(len(topology.channels), 6)
+        # instances do not share state
+        instances = topology.instances['keyed-counter']
+        self.assertIsNot(instances[0].counts, instances[1].counts)
+
+    def test_unknown_distribution(self):
+        source = CountingSource()
+        counter = KeyedCounter().replicate(2, distribution='random')
+        sink = factory.mk_sink(print, 'sink')
+        source | counter | sink
+
+        with self.assertRaises(InvalidTopologyError):
+            mk_parallel_topology([source])
+
+
+class SlowDouble(Operator):
+    name = 'slow-double'
+
+    def apply(self, data, out):
+        # later items overtake earlier ones
+        time.sleep(0.01 * (3 - data % 3))
+        out(data * 2)
+
+
+class ReplicaTest(unittest.TestCase):
+
+    def _run_replicated(self, op, n=12, expected=None):
+        class RangeSource(Source):
+            name = 'range-source'
+            idx = 0
+
+            def read(self, out):
+                if self.idx < n:
+                    out(self.idx)
+                    self.idx += 1
+
+        q = multiprocessing.Queue()
+        source = RangeSource()
+        sink = factory.mk_sink(q.put, 'sink')
+        source | op | sink
+
+        env = factory.mk_parallel_env([source], task_factory=factory.thread_factory())
+        env.start()
+        self.addCleanup(env.close)
+        self.addCleanup(env.stop)
+        return [q.get(timeout=2) for _ in range(expected or n)]
+
+    def test_ordered_replicas(self):
+        received = self._run_replicated(SlowDouble().replicate(3, ordered=True))
+        self.assertEqual(received, [i * 2 for i in range(12)])
+
+    def test_unordered_replicas(self):
+        received = self._run_replicated(SlowDouble().replicate(3))
+        self.assertEqual(sorted(received), [i * 2 for i in range(12)])
+
+    def test_least_loaded_replicas(self):
+        received = self._run_replicated(SlowDouble().replicate(3, distribution=LEAST_LOADED))
+        self.assertEqual(sorted(received), [i * 2 for i in range(12)])
+
+    def test_ordered_replicas_with_filter(self):
+        op = factory.mk_op(lambda x: x if x % 2 == 0 else None, 'even').replicate(2, ordered=True)
+        received = self._run_replicated(op, n=20, expected=10)
+        self.assertEqual(received, list(range(0, 20, 2)))
+
+    def test_ordered_replicas_require_single_instance_outputs(self):
+        source = CountingSource()
+        op = SlowDouble().replicate(2, ordered=True)
+        counter = KeyedCounter().key_by(lambda x: x, parallelism=2)
+        source | op | counter | factory.mk_sink(print, 'sink')
+
+        with self.assertRaises(InvalidTopologyError):
+            mk_parallel_topology([source])
+
+
+class SlowCountingSource(Source):
+    name = 'slow-counting-source'
+
+    def __init__(self, ctx: Context = None) -> None:
+        super().__init__(ctx)
+        self.idx = 0
+
+    def read(self, out):
+        time.sleep(0.002)
+        out(self.idx)
+        self.idx += 1
+
+
+class DrainTest(unittest.TestCase):
+
+    def _run_until_stopped(self, op, task_factory, **kwargs):
+        q = multiprocessing.Queue()
+        source = SlowCountingSource()
+        source | op | factory.mk_sink(q.put, 'sink')
+
+        env = factory.mk_parallel_env([source], task_factory=task_factory, drain=True, **kwargs)
+        self.addCleanup(env.close)
+        env.start()
+        time.sleep(0.2)
+        env.stop()
+        env.join(5)
+        self.assertFalse(env.p.is_alive())
+
+        received = []
+        while not q.empty():
+            received.append(q.get(timeout=1))
+        return env, received
+
+    def test_drain_with_processes(self):
+        env, received = self._run_until_stopped(SlowDouble(), factory.process_factory())
+
+        # every item that was read arrived at the sink
+        self.assertGreater(len(received), 0)
+        self.assertEqual(received, [i * 2 for i in range(len(received))])
+        stats = env.shutdown_stats()
+        self.assertTrue(stats['drained'])
+        self.assertEqual(stats['lost'], 0)
+        self.assertGreater(stats['drain_time'], 0)
+
+    def test_drain_replicas(self):
+        env, received = self._run_until_stopped(SlowDouble().replicate(3, ordered=True), factory.thread_factory())
+        self.assertEqual(received, [i * 2 for i in range(len(received))])
+        self.assertEqual(env.shutdown_stats()['lost'], 0)
+
+    def test_shutdown_timeout(self):
+        class VerySlowOp(Operator):
+            name = 'very-slow-op'
+
+            def apply(self, data, out):
+                time.sleep(0.05)
+                out(data)
+
+        env, received = self._run_until_stopped(VerySlowOp(), factory.thread_factory(), shutdown_timeout=0.1)
+        stats = env.shutdown_stats()
+        self.assertFalse(stats['drained'])
+        self.assertGreater(stats['lost'], 0)
@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source, Operator
+from glimmer.processing.profiling import Profiling, SAMPLING
+
+
+def busy_function(data):
+    deadline = time.perf_counter() + 0.002
+    while time.perf_counter() < deadline:
+        pass
+    return data
+
+
+class RangeSource(Source):
+    name = 'range-source'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.idx = 0
+
+    def read(self, out):
+        if self.idx < 20:
+            out(self.idx)
+            self.idx += 1
+        else:
+            time.sleep(0.01)
+
+
+class BusyOperator(Operator):
+    name = 'busy-op'
+
+    def apply(self, data, out):
+        out(busy_function(data))
+
+
+def _wait_for(path: str, timeout: float = 3):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output_dir = directory.name
+
+    def _run(self, profiling: Profiling, task_factory=None):
+        q = multiprocessing.Queue()
+        source = RangeSource()
+        source | BusyOperator() | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_parallel_env([source], task_factory=task_factory, profiling=profiling)
+        env.start()
+        [q.get(timeout=2) for _ in range(20)]
+        env.stop()
+        env.join(2)
+        env.close()
+
+    def test_cprofile_with_processes(self):
+        self._run(Profiling(self.output_dir, nodes=['busy-op']))
+        path = os.path.join(self.output_dir, 'busy-op.prof')
+        _wait_for(path)
+        functions = [function for _, _, function in pstats.Stats(path).stats.keys()]
+        self.assertIn('busy_function', functions)
+        self.assertEqual(os.listdir(self.output_dir), ['busy-op.prof'])
+
+    def test_sampling(self):
+        self._run(Profiling(self.output_dir, nodes=['busy-op'], mode=SAMPLING, interval=0.001),
+                  factory.thread_factory())
+        path = os.path.join(self.output_dir, 'busy-op.folded')
+        _wait_for(path)
+        with open(path) as fd:
+            lines = fd.read().splitlines()
+        self.assertTrue(any('busy_function' in line for line in lines))
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertTrue(stack.startswith('apply'))
+        self.assertGreater(int(count), 0)
+
+    def test_switch_at_runtime(self):
+        profiling = Profiling(self.output_dir, enabled=False)
+        profiler = profiling.profiler('op')
+        profiled = profiler.wrap(busy_function)
+        profiled(1)
+        profiler.dump()
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+        profiling.enable()
+        self.assertEqual(profiled(2), 2)
+        profiler.dump()
+        self.assertEqual(os.listdir(self.output_dir), ['op.prof'])
+
+    def test_out_is_excluded(self):
+        def apply(data, out):
+            out(busy_function(data))
+
+        profiler = Profiling(self.output_dir).profiler('op')
+        profiled = profiler.wrap(apply, has_out=True)
+        received = []
+        profiled(1, lambda data: received.append(busy_function(data)))
+        profiler.dump()
+        self.assertEqual(received, [1])
+        stats = pstats.Stats(os.path.join(self.output_dir, 'op.prof')).stats
+        calls = {function: stat[0] for (_, _, function), stat in stats.items()}
+        # only the call within apply is profiled, not the one of the out callback
+        self.assertEqual(calls['busy_function'], 1)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(AttributeError):
+            Profiling(mode='perf')
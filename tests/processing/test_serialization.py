@@ -0,0 +1,198 @@
+import dataclasses
+import json
+import multiprocessing
+import pickle
+import unittest
+from dataclasses import dataclass
+from typing import Optional
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source, Operator, Sink
+from glimmer.processing.channel import Batch, RingBufferChannel, QueueChannel, EdgeConfig, POISON, shared_memory
+from glimmer.processing.operator import ToJsonOperator
+from glimmer.processing.serialization import PickleSerializer, OutOfBandPickleSerializer, DataclassSerializer, \
+    MsgpackSerializer, msgpack, JsonEncoder, orjson
+from glimmer.util import EnhancedJSONEncoder
+from glimmer.util.context import Context
+
+
+@dataclass
+class Point:
+    x: float
+    y: float
+
+
+@dataclass
+class Measurement:
+    id: int
+    location: Point
+    previous: Optional[Point] = None
+    tags: list = None
+
+
+class DataclassSerializerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.serializer = DataclassSerializer(Measurement)
+
+    def _round_trip(self, item):
+        return self.serializer.loads(self.serializer.dumps(item))
+
+    def test_nested_dataclasses(self):
+        item = Measurement(1, Point(1.5, 2.5), None, ['a', 'b'])
+        self.assertEqual(self._round_trip(item), item)
+        item = Measurement(2, Point(1.5, 2.5), Point(0.0, 1.0))
+        self.assertEqual(self._round_trip(item), item)
+
+    def test_nested_types_are_registered(self):
+        self.assertEqual(self._round_trip(Point(3.0, 4.0)), Point(3.0, 4.0))
+
+    def test_batch(self):
+        batch = Batch([Measurement(i, Point(i, i)) for i in range(3)] + ['other'])
+        result = self._round_trip(batch)
+        self.assertIsInstance(result, Batch)
+        self.assertEqual(result, batch)
+
+    def test_falls_back_to_pickle(self):
+        item = Measurement(1, Point(1.0, 2.0), tags=[Point(0, 0)])
+        self.assertEqual(self._round_trip(item), item)
+        self.assertEqual(self._round_trip({'set': {1, 2}}), {'set': {1, 2}})
+
+    def test_only_dataclasses(self):
+        with self.assertRaises(AttributeError):
+            DataclassSerializer(dict)
+
+
+class JsonEncoderTest(unittest.TestCase):
+    items = [Measurement(1, Point(1.5, 2.5), None, ['a', Point(0.0, 1.0)]), {'point': Point(1.0, 2.0), 'n': 'ü'},
+             [1, None]]
+
+    def _encoders(self):
+        encoders = [JsonEncoder()]
+        if orjson is not None:
+            encoders.append(JsonEncoder(use_orjson=True))
+        return encoders
+
+    def test_same_as_asdict(self):
+        for encoder in self._encoders():
+            for item in self.items:
+                expected = dataclasses.asdict(item) if dataclasses.is_dataclass(item) else item
+                self.assertEqual(json.loads(encoder.dumps(item)), json.loads(json.dumps(expected, default=vars)))
+
+    def test_converter_is_compiled_once(self):
+        encoder = JsonEncoder()
+        encoder.dumps(self.items[0])
+        converter = encoder.converters[Measurement]
+        encoder.dumps(self.items[0])
+        self.assertIs(encoder.converters[Measurement], converter)
+        self.assertIn(Point, encoder.converters)
+
+    def test_same_output_as_enhanced_json_encoder(self):
+        encoder = JsonEncoder()
+        for item in self.items:
+            self.assertEqual(encoder.encode(item), json.dumps(item, cls=EnhancedJSONEncoder))
+        encoder = JsonEncoder(ensure_ascii=False)
+        for item in self.items:
+            self.assertEqual(encoder.encode(item), json.dumps(item, cls=EnhancedJSONEncoder, ensure_ascii=False))
+
+    def test_batch(self):
+        for encoder in self._encoders():
+            data = encoder.dumps_batch(self.items)
+            self.assertTrue(data.endswith(b'\n'))
+            self.assertEqual(data.split(b'\n')[:-1], [encoder.dumps(item) for item in self.items])
+
+    def test_to_json_operator(self):
+        out = []
+        op = ToJsonOperator()
+        op.apply(Point(1.0, 2.0), out.append)
+        op.apply({1, 2}, out.append)
+        self.assertEqual(out, ['{"x": 1.0, "y": 2.0}'])
+
+    def test_to_json_operator_with_context(self):
+        ctx = Context(config={'key': 'value'})
+        op = ToJsonOperator(ctx)
+        self.assertIs(op.ctx, ctx)
+        self.assertFalse(op.encoder.orjson)
+
+
+class SerializerTest(unittest.TestCase):
+
+    def test_pickle(self):
+        serializer = PickleSerializer()
+        self.assertEqual(serializer.loads(serializer.dumps(Point(1, 2))), Point(1, 2))
+
+    @unittest.skipIf(pickle.HIGHEST_PROTOCOL < 5, 'requires pickle protocol 5')
+    def test_out_of_band_buffers(self):
+        serializer = OutOfBandPickleSerializer()
+        item = {'data': pickle.PickleBuffer(bytearray(b'x' * 1000)), 'id': 1}
+        frames = serializer.frames(item)
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(frames[2].nbytes, 1000)
+        result = serializer.loads(serializer.dumps(item))
+        self.assertEqual(bytes(result['data']), b'x' * 1000)
+        self.assertEqual(result['id'], 1)
+
+    @unittest.skipIf(msgpack is None, 'requires msgpack')
+    def test_msgpack(self):
+        serializer = MsgpackSerializer()
+        self.assertEqual(serializer.loads(serializer.dumps({'a': [1, 2]})), {'a': [1, 2]})
+        result = serializer.loads(serializer.dumps(Batch([1, 'b'])))
+        self.assertIsInstance(result, Batch)
+        self.assertEqual(result, [1, 'b'])
+
+
+class SerializingChannelTest(unittest.TestCase):
+
+    @unittest.skipUnless(shared_memory is not None, 'requires multiprocessing.shared_memory')
+    def test_ring_buffer_with_frames(self):
+        channel = RingBufferChannel(capacity=4096, serializer=OutOfBandPickleSerializer())
+        self.addCleanup(channel.close)
+        for i in range(20):
+            size = channel.put({'i': i, 'data': pickle.PickleBuffer(bytearray(100))})
+            self.assertGreater(size, 100)
+            self.assertEqual(channel.get()['i'], i)
+
+    def test_queue_channel(self):
+        channel = QueueChannel(DataclassSerializer(Point))
+        self.assertIsNotNone(channel.put(Point(1, 2)))
+        channel.interrupt()
+        self.assertEqual(channel.get(timeout=1), Point(1, 2))
+        self.assertEqual(channel.get(timeout=1), POISON)
+
+    @unittest.skipUnless(shared_memory is not None, 'requires multiprocessing.shared_memory')
+    def test_serializer_per_edge(self):
+        class TestSource(Source):
+            name = 'test-source'
+            idx = 0
+
+            def read(self, out):
+                if self.idx < 5:
+                    out(Point(self.idx, 0))
+                    self.idx += 1
+
+        class TestOp(Operator):
+            name = 'test-op'
+
+            def apply(self, data, out):
+                out(Measurement(int(data.x), data))
+
+        class TestSink(Sink):
+            name = 'test-sink'
+
+            def write(self, data):
+                self.ctx.get('q').put(data)
+
+        q = multiprocessing.Queue()
+        source = TestSource()
+        source | TestOp() | TestSink(Context(config={'q': q}))
+
+        env = factory.mk_parallel_env([source], channel_factory=factory.ring_buffer_channel(capacity=4096),
+                                      edge_config=EdgeConfig(serializer=DataclassSerializer(Point)),
+                                      edge_configs={('test-op', 'test-sink'):
+                                                    EdgeConfig(serializer=DataclassSerializer(Measurement))})
+        self.assertIsInstance(env.topology.channels[('test-op', 'test-sink')].serializer, DataclassSerializer)
+        env.start()
+        received = [q.get(timeout=2) for _ in range(5)]
+        self.assertEqual(received, [Measurement(i, Point(i, 0)) for i in range(5)])
+        env.stop()
+        env.close()
@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from dataclasses import dataclass
+
+import glimmer.processing.factory as factory
+from glimmer.processing.sink import BufferedSink, FileSink, JsonLinesSink
+from tests.processing.test_parallel import SlowCountingSource
+
+
+class ListSink(BufferedSink):
+    name = 'list-sink'
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.written = []
+
+    def flush_records(self, records):
+        self.written.append(records)
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+class BufferedSinkTest(unittest.TestCase):
+
+    def test_flush_on_max_items(self):
+        sink = ListSink(max_items=4, linger=None)
+        for i in range(6):
+            sink.write(i)
+        sink.write_batch([6, 7, 8])
+        self.assertEqual(sink.written, [[0, 1, 2, 3], [4, 5, 6, 7]])
+        sink.close()
+        self.assertEqual(sink.written[-1], [8])
+        self.assertEqual(sink.flushes, 3)
+
+    def test_flush_on_max_bytes(self):
+        sink = ListSink(max_bytes=5, linger=None)
+        sink.write_batch([b'ab', b'cd', b'ef', b'g'])
+        self.assertEqual(sink.written, [[b'ab', b'cd', b'ef']])
+
+    def test_flush_after_linger(self):
+        sink = ListSink(linger=0.02)
+        self.addCleanup(sink.close)
+        sink.write(1)
+        self.assertEqual(sink.written, [])
+        deadline = time.monotonic() + 2
+        while not sink.written and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sink.written, [[1]])
+
+
+class FileSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def _read(self) -> str:
+        with open(self.path) as fd:
+            return fd.read()
+
+    def test_lines(self):
+        sink = FileSink(self.path, max_items=100)
+        sink.write_batch(['a', b'b', 3] * 100)
+        sink.close()
+        self.assertEqual(self._read(), 'a\nb\n3\n' * 100)
+        self.assertEqual(sink.flushes, 3)
+
+    def test_json_lines(self):
+        sink = JsonLinesSink(self.path)
+        sink.write(Point(1, 2))
+        sink.write({'text': 'ü'})
+        sink.close()
+        self.assertEqual([json.loads(line) for line in self._read().splitlines()], [{'x': 1, 'y': 2}, {'text': 'ü'}])
+
+    def test_json_lines_batch(self):
+        sink = JsonLinesSink(self.path, max_items=2)
+        sink.write_batch([Point(1, 2), {'text': 'ü'}, [Point(3, 4)]])
+        self.assertEqual(sink.flushes, 1)
+        sink.close()
+        self.assertEqual(self._read(), '{"x": 1, "y": 2}\n{"text": "ü"}\n[{"x": 3, "y": 4}]\n')
+        self.assertEqual(sink.flushes, 2)
+
+    def test_flush_on_shutdown(self):
+        source = SlowCountingSource()
+        sink = FileSink(self.path, linger=None)
+        source | sink
+        env = factory.mk_parallel_env([source], task_factory=factory.thread_factory(), drain=True)
+        self.addCleanup(env.close)
+        env.start()
+        time.sleep(0.1)
+        env.stop()
+        env.join(5)
+        # the buffered lines were written when the sink was closed
+        lines = self._read().splitlines()
+        self.assertGreater(len(lines), 0)
+        self.assertEqual(lines, [str(i) for i in range(len(lines))])
@@ -0,0 +1,166 @@
+import os
+import queue
+import tempfile
+import threading
+import unittest
+
+import glimmer.processing.factory as factory
+from glimmer.processing import InvalidTopologyError
+from glimmer.processing.parallel import mk_parallel_topology
+from glimmer.processing.source import FileSource
+from tests.processing.test_parallel import CountingSource
+from tests.processing.test_state import Counter
+from glimmer.util.context import Context
+
+
+def _read_all(source: FileSource) -> list:
+    out = []
+    while not source.exhausted:
+        source.read(out.append)
+    return out
+
+
+class FileSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def _write(self, data: bytes, mode: str = 'wb'):
+        with open(self.path, mode) as fd:
+            fd.write(data)
+
+    def _source(self, **kwargs) -> FileSource:
+        source = FileSource(self.path, poll_interval=0, **kwargs)
+        self.addCleanup(source.close)
+        return source
+
+    def test_lines(self):
+        self._write(b'a\nbb\n\nccc')
+        self.assertEqual(_read_all(self._source(chunk_size=3)), ['a', 'bb', '', 'ccc'])
+
+    def test_trailing_delimiter(self):
+        self._write(b'a\nb\n')
+        self.assertEqual(_read_all(self._source()), ['a', 'b'])
+
+    def test_batches_and_bytes(self):
+        self._write(b'1\n2\n3\n4\n5\n')
+        self.assertEqual(_read_all(self._source(batch_size=2, encoding=None)), [[b'1', b'2'], [b'3', b'4'], [b'5']])
+
+    def test_csv(self):
+        self._write(b'id,text\n1,"multi\nline, quoted"\n2,plain\n')
+        records = _read_all(self._source(csv=True, chunk_size=16))
+        self.assertEqual(records, [['id', 'text'], ['1', 'multi\nline, quoted'], ['2', 'plain']])
+
+    def test_resume_at_offset(self):
+        self._write(b'a\nb\nc\n')
+        source = self._source(chunk_size=2)
+        out = []
+        source.read(out.append)
+        self.assertEqual(out, ['a'])
+        self.assertEqual(_read_all(self._source(offset=source.offset)), ['b', 'c'])
+
+    def test_restore_position(self):
+        self._write(''.join(f'{i}\n' for i in range(20)).encode())
+        expected = self._source()
+        expected.split(1, 2)
+        expected = _read_all(expected)
+        source = self._source(chunk_size=4)
+        source.split(1, 2)
+        out = []
+        source.read(out.append)
+        restored = self._source(chunk_size=4)
+        restored.split(1, 2)
+        restored.restore(source.position())
+        self.assertGreater(len(out), 0)
+        self.assertEqual(out + _read_all(restored), expected)
+
+    def test_follow_growing_file(self):
+        self._write(b'')
+        source = self._source(follow=True)
+        out = []
+        source.read(out.append)
+        self._write(b'a\nb', 'ab')
+        source.read(out.append)
+        self.assertEqual(out, ['a'])
+        # the last record is emitted once it is terminated
+        source.read(out.append)
+        self.assertEqual(out, ['a'])
+        self._write(b'c\n', 'ab')
+        source.read(out.append)
+        self.assertEqual(out, ['a', 'bc'])
+        self.assertFalse(source.exhausted)
+
+    def test_path_from_context(self):
+        self._write(b'x\n')
+        source = FileSource(ctx=Context(config={'file': self.path}))
+        self.addCleanup(source.close)
+        self.assertEqual(_read_all(source), ['x'])
+        with self.assertRaises(AttributeError):
+            FileSource(ctx=Context(config={}))
+
+    def _read_split(self, instances: int, **kwargs) -> list:
+        records = []
+        for i in range(instances):
+            source = self._source(**kwargs)
+            source.split(i, instances)
+            records.extend(_read_all(source))
+        return records
+
+    def test_split_at_record_boundaries(self):
+        self._write(b'a\nbb\n\nccc\ndddd\ne')
+        for instances in range(1, 8):
+            self.assertEqual(self._read_split(instances, offset=2, chunk_size=3), ['bb', '', 'ccc', 'dddd', 'e'])
+
+    def test_split_csv(self):
+        self._write(b'1,"a\nb\nc"\n2,"\n"\n3,x\n')
+        for instances in range(1, 8):
+            self.assertEqual(self._read_split(instances, csv=True), [['1', 'a\nb\nc'], ['2', '\n'], ['3', 'x']])
+
+    def test_split_requires_splittable_source(self):
+        with self.assertRaises(AttributeError):
+            self._source(follow=True).split(0, 2)
+        source = CountingSource().replicate(2)
+        source | factory.mk_sink(print, 'sink')
+        with self.assertRaises(InvalidTopologyError):
+            mk_parallel_topology([source])
+
+    def test_parallel_instances(self):
+        self._write(''.join(f'{i % 3}\n' for i in range(30)).encode())
+        q = queue.Queue()
+        source = FileSource(self.path, chunk_size=4, poll_interval=0.01).replicate(3)
+        counter = Counter().key_by(lambda data: data, parallelism=2)
+        source | counter | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_parallel_env([source], task_factory=factory.thread_factory())
+        env.start(use_thread=True)
+        self.addCleanup(env.close)
+        self.addCleanup(env.stop)
+        counts = dict()
+        for _ in range(30):
+            key, count = q.get(timeout=2)
+            counts[key] = max(counts.get(key, 0), count)
+        self.assertEqual(counts, {'0': 10, '1': 10, '2': 10})
+
+    def _run_until_end(self, mk_env) -> list:
+        self._write(b'a\nb\nc\n')
+        out = []
+        source = FileSource(self.path, poll_interval=0.01)
+        source | factory.mk_op(str.upper, 'upper') | factory.mk_sink(out.append, 'sink')
+        env = mk_env(source)
+        runner = threading.Thread(target=env.run, daemon=True)
+        runner.start()
+        runner.join(5)
+        self.assertFalse(runner.is_alive(), 'environment did not finish at the end of the file')
+        return out
+
+    def test_synchronous_env_ends_at_end_of_file(self):
+        self.assertEqual(self._run_until_end(factory.mk_synchronous_env), ['A', 'B', 'C'])
+
+    def test_async_env_ends_at_end_of_file(self):
+        self.assertEqual(self._run_until_end(lambda source: factory.mk_async_env([source])), ['A', 'B', 'C'])
+
+    def test_parallel_env_ends_at_end_of_file(self):
+        out = self._run_until_end(
+            lambda source: factory.mk_parallel_env([source], task_factory=factory.thread_factory()))
+        self.assertEqual(out, ['A', 'B', 'C'])
@@ -0,0 +1,168 @@
+import copy
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Operator
+from glimmer.processing.exporter import render
+from glimmer.processing.state import KeyedState
+from tests.processing.test_sync import ListSource
+
+
+class Counter(Operator):
+    name = 'counter'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.counts = self.keyed_state('counts', capacity=2, spill_batch=1)
+
+    def apply(self, data, out):
+        count = self.counts.get(data, 0) + 1
+        self.counts[data] = count
+        out((data, count))
+
+
+class KeyedStateTest(unittest.TestCase):
+
+    def test_spills_least_recently_used(self):
+        state = KeyedState(capacity=2, spill_batch=1)
+        state['a'] = 1
+        state['b'] = 2
+        self.assertEqual(state['a'], 1)
+        state['c'] = 3
+        self.assertEqual(list(state.memory.keys()), ['a', 'c'])
+        self.assertEqual(state.on_disk, 1)
+
+        self.assertEqual(state['b'], 2)
+        self.assertEqual(state.on_disk, 1)
+        self.assertEqual(len(state.memory), 2)
+        self.assertEqual(dict(state.items()), {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(len(state), 3)
+
+        stats = state.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['loads'], 1)
+        self.assertEqual(stats['spills'], 2)
+        self.assertEqual(stats['in_memory'], 2)
+        self.assertEqual(stats['on_disk'], 1)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+        state.close()
+
+    def test_overwrite_and_delete_spilled_key(self):
+        state = KeyedState(capacity=1)
+        state['a'] = 1
+        state['b'] = 2
+        state['a'] = 3
+        self.assertEqual(state.on_disk, 1)
+        self.assertEqual(state['a'], 3)
+        del state['b']
+        self.assertNotIn('b', state)
+        with self.assertRaises(KeyError):
+            del state['b']
+        self.assertEqual(state.get('b', 0), 0)
+        self.assertEqual(state.on_disk, 0)
+        state.close()
+
+    def test_ttl(self):
+        state = KeyedState(capacity=1, ttl=0.05)
+        state['a'] = 1
+        state['b'] = 2
+        time.sleep(0.06)
+        self.assertIsNone(state.get('a'))
+        self.assertIsNone(state.get('b'))
+        self.assertEqual(state.stats()['expired'], 2)
+        state['c'] = 3
+        self.assertEqual(state.expire(time.time() + 1), 1)
+        self.assertEqual(len(state), 0)
+
+    def test_directory_is_removed_on_close(self):
+        with tempfile.TemporaryDirectory() as directory:
+            state = KeyedState('positions', capacity=1, directory=directory)
+            state[(1, 'a')] = [1.0, 2.0]
+            state[(2, 'b')] = [3.0, 4.0]
+            self.assertEqual(os.listdir(directory), [os.path.basename(state.path)])
+            self.assertEqual(state[(1, 'a')], [1.0, 2.0])
+            state.close()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_states_with_same_name_do_not_share_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first = KeyedState('positions', capacity=1, directory=directory)
+            second = KeyedState('positions', capacity=1, directory=directory)
+            first['a'] = 1
+            first['b'] = 2
+            second['c'] = 3
+            second['d'] = 4
+            self.assertNotEqual(first.path, second.path)
+            self.assertEqual(dict(first), {'a': 1, 'b': 2})
+            self.assertEqual(dict(second), {'c': 3, 'd': 4})
+            first.close()
+            self.assertEqual(second['c'], 3)
+            second.close()
+
+    def test_copies_do_not_share_state(self):
+        state = KeyedState(capacity=1)
+        state['a'] = 1
+        state['b'] = 2
+        copied = copy.deepcopy(state)
+        copied['c'] = 3
+        self.assertEqual(state.stats()['spills'], 1)
+        self.assertEqual(copied.stats()['spills'], 1)
+        self.assertNotIn('c', state)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(AttributeError):
+            KeyedState(capacity=0)
+        with self.assertRaises(AttributeError):
+            KeyedState(ttl=0)
+
+    def test_environment_reports_states(self):
+        written = []
+        source = ListSource(['a', 'b', 'c', 'a', 'b'])
+        source | Counter() | factory.mk_sink(written.append, 'sink')
+        env = factory.mk_synchronous_env(source)
+        source.env = env
+        env.run()
+        self.assertEqual(written, [('a', 1), ('b', 1), ('c', 1), ('a', 2), ('b', 2)])
+        states = env.metrics()['states']
+        self.assertEqual(states['counter']['counts']['in_memory'], 2)
+        self.assertEqual(states['counter']['counts']['on_disk'], 1)
+        self.assertEqual(states['counter']['counts']['loads'], 2)
+        self.assertIn('glimmer_state_spills_total{node="counter",state="counts"} 3', render(env.metrics()))
+
+    def test_parallel_environment_reports_states_of_instances(self):
+        q = multiprocessing.Queue()
+        items = iter(['a', 'b', 'c', 'd', 'a'])
+        source = factory.mk_src(lambda: next(items, None), 'source')
+        counter = Counter().key_by(lambda data: data, parallelism=2)
+        source | counter | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_parallel_env([source])
+        env.start()
+        self.addCleanup(env.close)
+        self.addCleanup(env.stop)
+
+        outputs = [q.get(timeout=2) for _ in range(5)]
+        self.assertIn(('a', 2), outputs)
+        states = env.metrics()['states']
+        self.assertEqual(set(states.keys()), {'counter[0]', 'counter[1]'})
+        self.assertEqual(sum(stats['counts']['in_memory'] + stats['counts']['on_disk'] for stats in states.values()), 4)
+        self.assertEqual(sum(stats['counts']['misses'] for stats in states.values()), 4)
+
+    def test_parallel_environment_reports_states_of_chains(self):
+        q = multiprocessing.Queue()
+        items = iter(['a', 'b', 'a'])
+        source = factory.mk_src(lambda: next(items, None), 'source')
+        source | factory.mk_op(lambda data: data, 'identity') | Counter() | factory.mk_sink(q.put, 'sink')
+        env = factory.mk_parallel_env([source], fuse=True)
+        env.start()
+        self.addCleanup(env.close)
+        self.addCleanup(env.stop)
+
+        self.assertEqual([q.get(timeout=2) for _ in range(3)], [('a', 1), ('b', 1), ('a', 2)])
+        states = env.metrics()['states']
+        self.assertEqual(len(states), 1)
+        chain_states = list(states.values())[0]
+        self.assertEqual(chain_states['counter.counts']['misses'], 2)
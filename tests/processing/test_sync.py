@@ -0,0 +1,54 @@
+import time
+import unittest
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source
+
+
+class ListSource(Source):
+    name = 'list-source'
+
+    def __init__(self, items) -> None:
+        super().__init__()
+        self.items = list(items)
+        self.env = None
+
+    def read(self, out):
+        if not self.items:
+            self.env.stop()
+            time.sleep(0.001)
+            return
+        out(self.items.pop(0))
+
+
+class SynchronousEnvironmentTest(unittest.TestCase):
+
+    def _run(self, items, skip_none: bool):
+        written = []
+        source = ListSource(items)
+        drop_two = factory.mk_op(lambda data: None if data == 2 else data, 'drop-two')
+        source | drop_two | factory.mk_sink(written.append, 'sink')
+        env = factory.mk_synchronous_env(source, skip_none=skip_none)
+        source.env = env
+        env.run()
+        return written, env.metrics()['nodes']
+
+    def test_skip_none(self):
+        written, nodes = self._run([1, None, 2, 3], skip_none=True)
+        self.assertEqual(written, [1, 3])
+        self.assertEqual(nodes['list-source']['items_out'], 3)
+        self.assertEqual(nodes['sink']['items_in'], 2)
+
+    def test_passes_none(self):
+        written, _ = self._run([1, None, 2], skip_none=False)
+        self.assertEqual(written, [1, None, None])
+
+    def test_stops_within_check_interval(self):
+        source = ListSource([])
+        source | factory.mk_op(lambda data: data, 'identity') | factory.mk_sink(lambda data: None, 'sink')
+        env = factory.mk_synchronous_env(source)
+        source.env = env
+        start = time.monotonic()
+        env.run()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertGreater(env.metrics()['nodes']['list-source']['calls'], 0)
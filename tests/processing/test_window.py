@@ -0,0 +1,145 @@
+import queue
+import time
+import unittest
+
+import glimmer.processing.factory as factory
+from glimmer.processing import Source
+from glimmer.processing.window import TumblingWindow, SlidingWindow, SessionWindow, WindowResult, Sum, Mean, Max, \
+    Monoid
+
+
+def _apply(window, items):
+    out = []
+    for item in items:
+        window.apply(item, out.append)
+    return out
+
+
+def _results(out):
+    return [(result.key, result.start, result.end, result.value) for result in out]
+
+
+class TumblingWindowTest(unittest.TestCase):
+
+    def test_event_time(self):
+        window = TumblingWindow('window', size=10, aggregate=Sum(), time_selector=lambda item: item)
+        out = _apply(window, [1, 5, 9, 12])
+        self.assertEqual(_results(out), [(None, 0, 10, 15)])
+        self.assertEqual(list(window.panes.keys()), [10])
+
+        window.on_end(out.append)
+        self.assertEqual(_results(out)[1:], [(None, 10, 20, 12)])
+        self.assertEqual(window.panes, {})
+
+    def test_keys_and_values(self):
+        window = TumblingWindow('window', size=10, aggregate=Mean(), key_selector=lambda item: item[0],
+                                value_selector=lambda item: item[2], time_selector=lambda item: item[1])
+        out = _apply(window, [('a', 1, 2), ('b', 2, 10), ('a', 3, 4), ('a', 11, 0)])
+        self.assertEqual(_results(out), [('a', 0, 10, 3.0), ('b', 0, 10, 10.0)])
+
+    def test_key_by_keeps_window_key(self):
+        window = TumblingWindow('window', size=10, key_selector=lambda item: item[0], time_selector=lambda item: item[1])
+        window.key_by(lambda item: item[1], parallelism=2)
+        out = _apply(window, [('a', 1), ('a', 2), ('b', 3), ('a', 11)])
+        self.assertEqual(_results(out), [('a', 0, 10, 2), ('b', 0, 10, 1)])
+
+    def test_late_items(self):
+        window = TumblingWindow('window', size=10, time_selector=lambda item: item, lateness=5)
+        out = _apply(window, [1, 12, 3, 16, 4])
+        self.assertEqual(_results(out), [(None, 0, 10, 2)])
+        self.assertEqual(window.late, 1)
+
+    def test_skips_empty_windows(self):
+        window = TumblingWindow('window', size=10, time_selector=lambda item: item)
+        out = _apply(window, [1, 1000, 2000])
+        self.assertEqual(_results(out), [(None, 0, 10, 1), (None, 1000, 1010, 1)])
+
+    def test_large_times(self):
+        # window ends and pane starts of times like the wall clock differ by rounding errors
+        window = TumblingWindow('window', size=0.05, time_selector=lambda item: item)
+        out = _apply(window, [1760000000.0, 1760000000.0346])
+        window.on_end(out.append)
+        self.assertEqual([result.value for result in out], [2])
+
+    def test_processing_time(self):
+        window = TumblingWindow('window', size=0.05)
+        out = _apply(window, ['a', 'b'])
+        time.sleep(0.1)
+        window.on_timer(time.monotonic(), out.append)
+        # both items fall into the same window, unless they arrived on either side of a window boundary
+        self.assertEqual(sum(result.value for result in out), 2)
+        self.assertTrue(all(result.final for result in out))
+
+
+class SlidingWindowTest(unittest.TestCase):
+
+    def test_panes(self):
+        window = SlidingWindow('window', size=10, slide=5, aggregate=Sum(), time_selector=lambda item: item)
+        self.assertEqual(window.pane, 5)
+        out = _apply(window, [1, 6, 11, 16, 30])
+        self.assertEqual(_results(out), [(None, -5, 5, 1), (None, 0, 10, 7), (None, 5, 15, 17), (None, 10, 20, 27),
+                                         (None, 15, 25, 16)])
+        # only the pane of the open windows is kept
+        self.assertEqual(list(window.panes.keys()), [30])
+
+    def test_pane_is_gcd(self):
+        window = SlidingWindow('window', size=0.75, slide=0.5, time_selector=lambda item: item)
+        self.assertEqual(window.pane, 0.25)
+
+    def test_early_results(self):
+        window = SlidingWindow('window', size=10, slide=5, aggregate=Max(), time_selector=lambda item: item,
+                               trigger=0.01)
+        out = _apply(window, [1, 3])
+        window.on_timer(0, out.append)
+        window.on_timer(1, out.append)
+        self.assertEqual([(result.start, result.value, result.final) for result in out],
+                         [(-5, 3, False), (0, 3, False)])
+
+    def test_invalid_size(self):
+        with self.assertRaises(AttributeError):
+            SlidingWindow('window', size=0)
+
+
+class SessionWindowTest(unittest.TestCase):
+
+    def test_sessions_per_key(self):
+        window = SessionWindow('window', gap=5, key_selector=lambda item: item[0], time_selector=lambda item: item[1])
+        out = _apply(window, [('a', 1), ('b', 2), ('a', 4), ('a', 20), ('b', 30)])
+        self.assertEqual(_results(out), [('a', 1, 9, 2), ('b', 2, 7, 1), ('a', 20, 25, 1)])
+        self.assertEqual(list(window.sessions.keys()), ['b'])
+
+    def test_merges_sessions(self):
+        collect = Monoid(frozenset, lambda acc, value: acc | {value}, lambda a, b: a | b)
+        window = SessionWindow('window', gap=5, aggregate=collect, time_selector=lambda item: item, lateness=20)
+        out = _apply(window, [1, 10, 5])
+        self.assertEqual(out, [])
+        window.on_end(out.append)
+        self.assertEqual(out, [WindowResult(None, 1, 15, frozenset({1, 5, 10}))])
+
+
+class WindowEnvironmentTest(unittest.TestCase):
+
+    def test_flushed_when_drained(self):
+        class RangeSource(Source):
+            name = 'range-source'
+            idx = 0
+
+            def read(self, out):
+                if self.idx < 25:
+                    out(self.idx)
+                    self.idx += 1
+                else:
+                    time.sleep(0.01)
+
+        q = queue.Queue()
+        source = RangeSource()
+        source | TumblingWindow('window', size=10, aggregate=Sum(), time_selector=lambda item: item) | \
+            factory.mk_sink(q.put, 'sink')
+        env = factory.mk_parallel_env([source], task_factory=factory.thread_factory(), drain=True)
+        env.start(use_thread=True)
+        self.addCleanup(env.close)
+        self.assertEqual(q.get(timeout=2).value, sum(range(10)))
+        self.assertEqual(q.get(timeout=2).value, sum(range(10, 20)))
+        env.stop()
+        env.join(2)
+        self.assertEqual(q.get(timeout=2).value, sum(range(20, 25)))